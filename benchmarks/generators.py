@@ -0,0 +1,104 @@
+"""
+Synthetic graph generators for the benchmarks, each shaped like data we actually keep in trip stores. Every
+generator takes a target number of triples, and is seeded, so a given size always produces the same graph.
+
+* sequences: cft style sequences, with refs to subjects and (shared) timepoints
+* samples: flat sample metadata records, with a few many valued attributes
+* lineage: a forest of person:parent chains, for recursive and reverse ref pulls
+"""
+
+import csv
+import random
+
+
+sequence_schema = {
+    'cft.seq:subject': {'db:valueType': 'db.type:ref', 'db:cardinality': 'db.cardinality:one'},
+    'cft.seq:timepoint': {'db:valueType': 'db.type:ref', 'db:cardinality': 'db.cardinality:many'},
+    'cft.seq:string': {'db:cardinality': 'db.cardinality:one'}}
+
+sample_schema = {
+    'sample:id': {'db:cardinality': 'db.cardinality:one'},
+    'sample:date': {'db:cardinality': 'db.cardinality:one'}}
+
+lineage_schema = {
+    'person:parent': {'db:valueType': 'db.type:ref', 'db:cardinality': 'db.cardinality:one'},
+    'person:name': {'db:cardinality': 'db.cardinality:one'}}
+
+
+def _seq_string(rng, length=60):
+    return ''.join(rng.choice('ACGT') for _ in range(length))
+
+
+def sequences(n_triples, seed=0):
+    "About 7 triples per sequence, plus subjects and timepoints (one each per 20 sequences)."
+    rng = random.Random(seed)
+    n_seqs = max(1, n_triples // 7)
+    n_subjects = max(1, n_seqs // 20)
+    n_timepoints = max(1, n_seqs // 20)
+    facts = [{'db:ident': 'subject-%d' % i, 'cft:type': 'cft.type:subject', 'cft.subject:id': 'S%d' % i}
+             for i in range(n_subjects)]
+    facts += [{'db:ident': 'timepoint-%d' % i, 'cft:type': 'cft.type:timepoint', 'cft.timepoint:id': 'dpi%d' % i}
+              for i in range(n_timepoints)]
+    for i in range(n_seqs):
+        facts.append({'db:ident': 'seq-%d' % i,
+                      'cft:type': 'cft.type:seq',
+                      'cft.seq:id': 'seq%d' % i,
+                      'cft.seq:string': _seq_string(rng),
+                      'cft.seq:subject': 'subject-%d' % rng.randrange(n_subjects),
+                      'cft.seq:timepoint': ['timepoint-%d' % rng.randrange(n_timepoints) for _ in range(2)]})
+    return facts
+
+
+def samples(n_triples, seed=0):
+    "About 8 triples per sample."
+    rng = random.Random(seed)
+    sites = ['jena', 'seattle', 'boston', 'kinshasa', 'freetown']
+    facts = []
+    for i in range(max(1, n_triples // 8)):
+        facts.append({'db:ident': 'sample-%d' % i,
+                      'sample:type': 'sample.type:sample',
+                      'sample:id': 's%d' % i,
+                      'sample:site': rng.choice(sites),
+                      'sample:date': '2017-%02d-%02d' % (rng.randint(1, 12), rng.randint(1, 28)),
+                      'sample:tag': ['tag%d' % rng.randrange(50) for _ in range(3)]})
+    return facts
+
+
+def lineage(n_triples, seed=0, depth=50):
+    """About 4 triples per person, in chains of up to depth ancestors, each with a few children (so reverse
+    lookups fan out)."""
+    rng = random.Random(seed)
+    n_people = max(1, n_triples // 4)
+    facts = []
+    for i in range(n_people):
+        fact = {'db:ident': 'person-%d' % i, 'person:type': 'person.type:person', 'person:name': 'P%d' % i}
+        # Roots every depth people; otherwise a parent among the last few people
+        if i % depth:
+            fact['person:parent'] = 'person-%d' % (i - rng.randint(1, min(3, i % depth)))
+        facts.append(fact)
+    return facts
+
+
+graphs = {'sequences': (sequences, sequence_schema),
+          'samples': (samples, sample_schema),
+          'lineage': (lineage, lineage_schema)}
+
+
+def write_csv(filename, n_rows, seed=0):
+    "A toy.csv shaped CSV (see tripl/data/toy.csv) with n_rows rows, for bio.load_csv."
+    rng = random.Random(seed)
+    with open(filename, 'w') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['virus', 'geo', 'sample', 'id', 'date', 'date_id'])
+        for i in range(n_rows):
+            day = rng.randint(1, 28)
+            writer.writerow([rng.choice(['EBOV', 'ZIKV']), rng.choice(['jena', 'seattle']), 's%d' % (i // 3),
+                             'i%d' % i, '2017-06-%02d' % day, 't%d' % day])
+
+
+csv_attr_map = {
+    'seq:id': 'id',
+    'seq:virus': 'virus',
+    'seq:geo': 'geo',
+    'seq:date': [{'date:day': 'date', 'date:id': 'date_id'}],
+    'seq:sample': [{'sample:id': 'sample'}]}
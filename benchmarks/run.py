@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+"""
+Benchmarks for TripleStore ingestion, persistence and queries, over the synthetic graphs in generators.py.
+
+    python benchmarks/run.py run --sizes 10000 100000 -o before.json
+    # ... change things ...
+    python benchmarks/run.py run --sizes 10000 100000 -o after.json
+    python benchmarks/run.py compare before.json after.json
+
+Each benchmark is timed as the best of --repeat runs. With --memory, each is also run once more under tracemalloc
+to record its peak allocation (this is slow, so it's opt in). Results are written as JSON, one record per
+(benchmark, graph, size), and compare reports the ratio of each to a baseline run, exiting non zero if anything got
+slower than --threshold.
+"""
+
+from __future__ import print_function
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+sys.path.insert(0, here)
+
+from tripl import tripl, bio
+import generators
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+# Benchmarks: each takes a _Case, and returns the function to time
+
+class _Case(object):
+    "A graph at a given size, with the store, dump file etc. built lazily and shared between benchmarks."
+
+    def __init__(self, graph, n_triples, workdir):
+        self.graph = graph
+        self.n_triples = n_triples
+        self.workdir = workdir
+        generate, self.schema = generators.graphs[graph]
+        self.facts = generate(n_triples)
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = tripl.TripleStore(schema=self.schema)
+            self._store.assert_facts(self.facts)
+        return self._store
+
+    @property
+    def dump_filename(self):
+        filename = os.path.join(self.workdir, '%s-%d.trip.json' % (self.graph, self.n_triples))
+        if not os.path.exists(filename):
+            self.store.dump_file(filename)
+        return filename
+
+
+def bench_assert_facts(case):
+    def run():
+        tripl.TripleStore(schema=case.schema).assert_facts(case.facts)
+    return run
+
+
+def bench_construct(case):
+    "TripleStore(facts=...), as load_file does"
+    def run():
+        tripl.TripleStore(schema=case.schema, facts=case.facts)
+    return run
+
+
+def bench_dump_file(case):
+    store = case.store
+    filename = os.path.join(case.workdir, 'dump.trip.json')
+    def run():
+        store.dump_file(filename)
+    return run
+
+
+def bench_load_file(case):
+    filename = case.dump_filename
+    def run():
+        tripl.TripleStore.load_file(filename)
+    return run
+
+
+_patterns = {'sequences': {'cft:type': 'cft.type:seq'},
+             'samples': {'sample:site': 'jena'},
+             'lineage': {'person:type': 'person.type:person'}}
+
+
+def bench_match_pattern(case):
+    store = case.store
+    pattern = _patterns[case.graph]
+    def run():
+        store.match_pattern(pattern)
+    return run
+
+
+_pull_exprs = {
+    'sequences': ['cft.seq:id', 'cft.seq:string',
+                  {'cft.seq:subject': ['cft.subject:id'], 'cft.seq:timepoint': ['cft.timepoint:id']}],
+    'samples': ['*'],
+    'lineage': ['person:name', {'person:parent': ['person:name']}]}
+
+
+def bench_pull_many(case):
+    store = case.store
+    expr = _pull_exprs[case.graph]
+    eids = sorted(store.match_pattern(_patterns[case.graph]))
+    def run():
+        for _ in store.pull_many(expr, eids):
+            pass
+    return run
+
+
+_reverse_pulls = {
+    'sequences': (['cft.timepoint:id', {'cft.seq:_timepoint': ['cft.seq:id']}], {'cft:type': 'cft.type:timepoint'}),
+    'lineage': (['person:name', {'person:_parent': ['person:name']}], {'person:type': 'person.type:person'})}
+
+
+def bench_pull_reverse(case):
+    "pull_many with a reverse ref lookup"
+    if case.graph not in _reverse_pulls:
+        return None
+    store = case.store
+    expr, pattern = _reverse_pulls[case.graph]
+    eids = sorted(store.match_pattern(pattern))
+    def run():
+        for _ in store.pull_many(expr, eids):
+            pass
+    return run
+
+
+def bench_pull_recursive(case):
+    "100 pulls of the whole person:parent ancestry, via '...'"
+    if case.graph != 'lineage':
+        return None
+    store = case.store
+    n_people = len(case.facts)
+    # The last person in each chain has the longest ancestry
+    eids = ['person-%d' % i for i in range(49, n_people, 50)][:100] or ['person-%d' % (n_people - 1)]
+    expr = ['person:name', {'person:parent': '...'}]
+    def run():
+        for eid in eids:
+            store.pull(expr, eid)
+    return run
+
+
+benchmarks = [bench_assert_facts, bench_construct, bench_dump_file, bench_load_file, bench_match_pattern,
+              bench_pull_many, bench_pull_reverse, bench_pull_recursive]
+
+
+def bench_load_csv(n_rows, workdir):
+    "bio.load_csv of a toy.csv shaped file, asserted into a store"
+    filename = os.path.join(workdir, 'bench-%d.csv' % n_rows)
+    generators.write_csv(filename, n_rows)
+    def run():
+        ts = tripl.TripleStore()
+        ts.assert_facts(bio.load_csv(filename, generators.csv_attr_map, 'toy'), id_attrs=['toy.seq:id'])
+    return run
+
+
+# Measurement
+
+def measure(run, repeat, memory):
+    times = []
+    for _ in range(repeat):
+        start = _clock()
+        run()
+        times.append(_clock() - start)
+    result = {'seconds': min(times), 'seconds_mean': sum(times) / len(times), 'repeat': repeat}
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+        run()
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=here,
+                                       stderr=subprocess.STDOUT).decode().strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(args):
+    workdir = tempfile.mkdtemp(prefix='tripl-bench-')
+    results = []
+    def record(name, graph, size, run):
+        if run is None:
+            return
+        result = measure(run, args.repeat, args.memory)
+        result.update(benchmark=name, graph=graph, size=size)
+        results.append(result)
+        print('%-20s %-10s %10d %10.4fs' % (name, graph, size, result['seconds']) +
+              ('  %8.1fMB' % (result['peak_bytes'] / 1e6) if 'peak_bytes' in result else ''),
+              file=sys.stderr)
+    try:
+        for size in args.sizes:
+            for graph in args.graphs:
+                case = _Case(graph, size, workdir)
+                for bench in benchmarks:
+                    name = bench.__name__[len('bench_'):]
+                    if not args.only or name in args.only:
+                        record(name, graph, size, bench(case))
+            if not args.only or 'load_csv' in args.only:
+                # ~10 triples per row
+                record('load_csv', 'csv', size, bench_load_csv(max(1, size // 10), workdir))
+    finally:
+        shutil.rmtree(workdir)
+    output = {'meta': {'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'revision': _git_revision(),
+                       'time': datetime.datetime.now().isoformat()},
+              'results': results}
+    if args.output == '-':
+        json.dump(output, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as fp:
+            json.dump(output, fp, indent=2)
+
+
+def compare(args):
+    def load(filename):
+        with open(filename) as fp:
+            return dict(((r['benchmark'], r['graph'], r['size']), r) for r in json.load(fp)['results'])
+    baseline, current = load(args.baseline), load(args.current)
+    regressions = 0
+    print('%-20s %-10s %10s %10s %10s %8s' % ('benchmark', 'graph', 'size', 'baseline', 'current', 'ratio'))
+    for key in sorted(set(baseline) & set(current)):
+        before, after = baseline[key]['seconds'], current[key]['seconds']
+        ratio = after / before if before else float('inf')
+        flag = ''
+        if ratio > 1 + args.threshold:
+            flag = '  SLOWER'
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = '  faster'
+        print('%-20s %-10s %10d %9.4fs %9.4fs %8.2f%s' % (key + (before, after, ratio, flag)))
+        if 'peak_bytes' in baseline[key] and 'peak_bytes' in current[key]:
+            print('%-20s %-10s %10s %8.1fMB %8.1fMB %8.2f' % (
+                '', 'memory', '', baseline[key]['peak_bytes'] / 1e6, current[key]['peak_bytes'] / 1e6,
+                float(current[key]['peak_bytes']) / max(1, baseline[key]['peak_bytes'])))
+    return 1 if regressions else 0
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    run = subparsers.add_parser('run', help="run the benchmarks")
+    run.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help="graph sizes, in triples")
+    run.add_argument('--graphs', nargs='+', default=sorted(generators.graphs), choices=sorted(generators.graphs))
+    run.add_argument('--only', nargs='+', help="only run these benchmarks (by name, e.g. pull_many load_csv)")
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--memory', action='store_true', help="also measure peak memory (slow)")
+    run.add_argument('-o', '--output', default='-', help="results file (default stdout)")
+    comp = subparsers.add_parser('compare', help="compare two results files")
+    comp.add_argument('baseline')
+    comp.add_argument('current')
+    comp.add_argument('--threshold', type=float, default=0.1, help="relative slowdown to flag (default 0.1)")
+    args = parser.parse_args()
+    if not args.command:
+        parser.error("a command is required")
+    return args
+
+
+def main():
+    args = get_args()
+    if args.command == 'run':
+        return run_benchmarks(args)
+    else:
+        return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
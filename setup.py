@@ -19,12 +19,12 @@ setup(name='tripl',
       author='Christopher Small',
       author_email='metasoarous@gmail.com',
       url='https://github.com/metasoarous/tripl',
-      packages=find_packages(),
+      packages=find_packages(exclude=['tests']),
+      extras_require={'parquet': ['pyarrow']},
       entry_points={
           'console_scripts': [
               'trip = tripl.cli:main',
           ]
       },
-      #test_suite='tripl.test.suite',
-      #tests_require=['mock>=1.0.1']
+      test_suite='tests',
       )
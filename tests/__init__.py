@@ -0,0 +1,3 @@
+"""
+Tests for tripl; run with `python setup.py test`, `python -m unittest discover` or pytest.
+"""
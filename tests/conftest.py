@@ -0,0 +1,4 @@
+import sys
+
+# tripl.aio is python 3 only
+collect_ignore = ['test_aio.py'] if sys.version_info < (3,) else []
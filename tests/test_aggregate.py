@@ -0,0 +1,68 @@
+import threading
+import time
+import unittest
+
+from tripl import tripl
+from tests import util
+
+
+class AggregateTest(unittest.TestCase):
+
+    def test_against_pulls(self):
+        ts = util.store()
+        pattern = {'toy:type': 'toy.type:seq'}
+        seqs = list(ts.pull_many(['*'], pattern))
+        depths = [s['toy.seq:depth'] for s in seqs]
+        row = ts.aggregate({'n': 'count', 'max': ('max', 'toy.seq:depth'), 'sum': ('sum', 'toy.seq:depth'),
+                            'samples': ('count_distinct', 'toy.seq:sample')}, pattern=pattern)
+        self.assertEqual(row['n'], len(seqs))
+        self.assertEqual(row['max'], max(depths))
+        self.assertAlmostEqual(row['sum'], sum(depths))
+        self.assertEqual(row['samples'], len(set(s['toy.seq:sample'] for s in seqs)))
+
+    def test_group_by(self):
+        ts = util.store()
+        groups = dict(ts.aggregate({'n': 'count'}, group_by='toy.seq:sample'))
+        for sample, row in groups.items():
+            self.assertEqual(row['n'], len(ts.match_pattern({'toy.seq:sample': sample})))
+        self.assertRaises(ValueError, ts.aggregate, {'n': 'median'})
+
+    def test_while_writing(self):
+        # Entities move between p:g groups, with p:a and p:z always changing together in the same call
+        n = 50
+        schema = dict((a, {'db:cardinality': 'db.cardinality:one'}) for a in ['p:g', 'p:a', 'p:z'])
+        ts = tripl.TripleStore(schema=schema, thread_safe=True)
+        ts.assert_facts([{'db:ident': 'e%d' % i, 'p:type': 'x', 'p:g': i % 5, 'p:a': 0, 'p:z': 0,
+                          'p:n': list(range(300))} for i in range(n)])
+        aggregates = {'n': 'count', 'a': ('sum', 'p:a'), 'z': ('sum', 'p:z'), 'values': ('count_distinct', 'p:n')}
+        stop = threading.Event()
+        errors = []
+
+        def writer():
+            k = 0
+            try:
+                while not stop.is_set():
+                    k += 1
+                    es = ['e%d' % ((k + i) % n) for i in range(5)]
+                    ts.assert_facts([{'db:ident': e, 'p:g': k % 5, 'p:a': k, 'p:z': k, 'p:n': list(range(k, k + 300))}
+                                     for e in es])
+                    ts.retract_facts([(e, 'p:n', v) for e in es for v in range(k, k + 200)])
+            except Exception as e:
+                errors.append(e)
+
+        interval = util.switch_often()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        deadline = time.time() + 1.0
+        try:
+            while time.time() < deadline:
+                for pattern in [{'p:type': 'x'}, None]:
+                    rows = [row for _, row in ts.aggregate(aggregates, pattern=pattern, group_by='p:g')]
+                    self.assertEqual(sum(row['n'] for row in rows), n)
+                    self.assertEqual([row['a'] for row in rows], [row['z'] for row in rows])
+        finally:
+            stop.set()
+            thread.join()
+            util.switch_often(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(ts._lock._readers, 0)
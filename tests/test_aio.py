@@ -0,0 +1,57 @@
+import unittest
+
+from tests import util
+
+try:
+    import asyncio
+    from unittest import mock
+    from tripl import aio
+except (ImportError, SyntaxError):
+    # python 2
+    aio = None
+
+
+def collect(async_iterator):
+    "The items of an async iterator, stepped through on a new loop (no async syntax, which python 2 can't parse)."
+    loop = asyncio.new_event_loop()
+    items = []
+    try:
+        while True:
+            try:
+                items.append(loop.run_until_complete(async_iterator.__anext__()))
+            except StopAsyncIteration:
+                return items
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(aio is None, "tripl.aio needs python 3")
+class AsyncTest(unittest.TestCase):
+
+    patterns = [{'toy:type': 'toy.type:seq'}, {'toy.seq:depth': {'>': 50}},
+                {'toy.seq:description': {'text': 'ebola'}, 'toy.seq:tags': 'x'}]
+
+    def setUp(self):
+        self.ts = util.store()
+        self.ts.index_text('toy.seq:description')
+        self.ats = aio.AsyncTripleStore(self.ts, chunk_size=16)
+
+    def test_match_pattern(self):
+        for pattern in self.patterns:
+            self.assertEqual(asyncio.run(self.ats.match_pattern(pattern)), self.ts.match_pattern(pattern))
+        # The indexed patterns only check their candidates, rather than scanning
+        with mock.patch.object(aio, '_all_eids', side_effect=AssertionError('scanned')):
+            for pattern in self.patterns[1:]:
+                self.assertEqual(asyncio.run(self.ats.match_pattern(pattern)), self.ts.match_pattern(pattern))
+
+    def test_pull_many_one_snapshot(self):
+        snapshots = []
+        snapshot = self.ts.snapshot
+
+        def counted():
+            snapshots.append(snapshot())
+            return snapshots[-1]
+        self.ts.snapshot = counted
+        results = collect(self.ats.pull_many(['db:ident'], self.patterns[1]))
+        self.assertEqual(len(snapshots), 1)
+        self.assertEqual(set(min(r['db:ident']) for r in results), self.ts.match_pattern(self.patterns[1]))
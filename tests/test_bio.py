@@ -0,0 +1,113 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from tripl import bio, tripl
+
+
+toy_csv = os.path.join(os.path.dirname(__file__), 'data', 'toy.csv')
+
+attr_map = {'seq:id': 'id', 'seq:geo': 'geo', 'seq:tag': 'tag', 'seq:sample': [{'sample:id': 'sample'}]}
+
+id_attrs = ['toy.seq:id', 'toy.sample:id']
+
+pattern = {'toy:type': 'toy.type:seq'}
+
+
+def load(filename):
+    ts = tripl.TripleStore()
+    ts.assert_facts(bio.load_csv(filename, attr_map, 'toy'), id_attrs=id_attrs)
+    return ts
+
+
+def toy_store():
+    "The toy CSV, plus a seq with several tags, and one with several samples."
+    ts = load(toy_csv)
+    i1, = ts.match_pattern({'toy.seq:id': 'i1'})
+    i3, = ts.match_pattern({'toy.seq:id': 'i3'})
+    s1, = ts.match_pattern({'toy.sample:id': 's1'})
+    ts.assert_facts([{'db:ident': i1, 'toy.seq:tag': ['x', 'y']}, {'db:ident': i3, 'toy.seq:sample': [s1]}])
+    return ts
+
+
+def seqs(ts, sep=None):
+    "Each seq's id -> (geos, tags, sample ids), with joined cells split on sep."
+    def values(vs):
+        vs = set(vs)
+        return set(x for v in vs for x in v.split(sep)) if sep else vs
+    return dict((min(r['toy.seq:id']), (values(r['toy.seq:geo']), values(r['toy.seq:tag']),
+                                         values(id for s in r['toy.seq:sample'] for id in s['toy.sample:id'])))
+                for r in ts.pull_many(['*', {'toy.seq:sample': ['toy.sample:id']}], pattern))
+
+
+class CSVTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.out = os.path.join(self.dirname, 'out.csv')
+        self.ts = toy_store()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_round_trip(self):
+        ts = load(toy_csv)
+        bio.write_csv(self.out, ts, attr_map, pattern, ns='toy')
+        with open(toy_csv) as expected, open(self.out) as written:
+            self.assertEqual(sorted(csv.DictReader(written), key=repr), sorted(csv.DictReader(expected), key=repr))
+
+    def test_explode(self):
+        bio.write_csv(self.out, self.ts, attr_map, pattern, ns='toy')
+        with open(self.out) as fp:
+            rows = list(csv.DictReader(fp))
+        # A row per tag for i1, and per sample for i3
+        self.assertEqual(sorted(r['id'] for r in rows), ['i1', 'i1', 'i1', 'i2', 'i3', 'i3'])
+        self.assertEqual(seqs(load(self.out)), seqs(self.ts))
+
+    def test_join(self):
+        bio.write_csv(self.out, self.ts, attr_map, pattern, ns='toy', many='join', delimiter='\t')
+        with open(self.out) as fp:
+            rows = list(csv.DictReader(fp, delimiter='\t'))
+        self.assertEqual(sorted(r['id'] for r in rows), ['i1', 'i2', 'i3'])
+        self.assertEqual(dict((r['id'], r['tag']) for r in rows)['i1'], 'raw;x;y')
+        # Back into single cells, which split give the values
+        joined = os.path.join(self.dirname, 'joined.csv')
+        with open(joined, 'w') as fp:
+            writer = csv.DictWriter(fp, bio.attr_map_columns(attr_map))
+            writer.writeheader()
+            writer.writerows(rows)
+        self.assertEqual(seqs(load(joined), sep=';'), seqs(self.ts))
+
+    def test_pull_rows(self):
+        self.assertEqual(sorted(bio.attr_map_columns(attr_map)), ['geo', 'id', 'sample', 'tag'])
+        rows = list(bio.pull_rows(self.ts, attr_map, pattern, ns='toy'))
+        self.assertEqual(sorted((r['id'], r['tag'], r['sample']) for r in rows),
+                         [('i1', 'raw', 's1'), ('i1', 'x', 's1'), ('i1', 'y', 's1'), ('i2', 'trimmed', 's1'),
+                          ('i3', 'raw', 's1'), ('i3', 'raw', 's2')])
+        self.assertEqual(bio.flatten({'toy.seq:id': set(['i9']), 'toy.seq:tag': set(['b', 'a'])}, attr_map, 'toy',
+                                     many='join'),
+                         [{'id': 'i9', 'geo': None, 'tag': 'a;b'}])
+        self.assertRaises(ValueError, list, bio.pull_rows(self.ts, attr_map, pattern, ns='toy', many='each'))
+
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+@unittest.skipIf(pyarrow is None, "needs pyarrow")
+class ParquetTest(unittest.TestCase):
+
+    def test_parquet(self):
+        ts = toy_store()
+        dirname = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dirname, 'out.parquet')
+            bio.write_parquet(filename, ts, attr_map, pattern, ns='toy', batch_size=2)
+            rows = pyarrow.parquet.read_table(filename).to_pylist()
+        finally:
+            shutil.rmtree(dirname)
+        self.assertEqual(sorted(rows, key=repr), sorted(bio.pull_rows(ts, attr_map, pattern, ns='toy'), key=repr))
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tripl import cli, stream, tripl, txlog
+
+
+data = os.path.join(os.path.dirname(__file__), 'data')
+a, b = os.path.join(data, 'a.trip.json'), os.path.join(data, 'b.trip.json')
+
+
+class ArgsTest(unittest.TestCase):
+
+    def test_output(self):
+        self.assertEqual(cli.get_args(['merge', 'a.trip.json', '-o', 'out']).output, 'out')
+        self.assertEqual(cli.get_args(['-o', 'out', 'merge', 'a.trip.json']).output, 'out')
+        self.assertEqual(cli.get_args(['-i', 'a.trip.json', '-o', 'out']).output, 'out')
+        args = cli.get_args(['diff', 'a.trip.json', 'b.trip.json'])
+        self.assertEqual(args.output, '-')
+
+    def test_merge_shorthand(self):
+        for argv in [['-i', 'a.trip.json', 'b.trip.json', '-o', 'out'],
+                     ['-o', 'out', '-i', 'a.trip.json', 'b.trip.json']]:
+            args = cli.get_args(argv)
+            self.assertEqual((args.command, args.inputs, args.output), ('merge', ['a.trip.json', 'b.trip.json'], 'out'))
+
+
+class MainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.out = os.path.join(self.dirname, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def output(self):
+        with open(self.out) as fp:
+            return fp.read()
+
+    def test_merge(self):
+        cli.main(['merge', a, b, '-o', self.out])
+        merged = self.output()
+        with open(self.out) as fp:
+            entities = dict(stream.read_entities(fp))
+        self.assertTrue(set(['sample-1', 'sample-2', 'seq-1', 'seq-2', 'seq-3']) <= set(entities))
+        expected = tripl.TripleStore.load_files([a, b])
+        self.assertEqual(tripl.TripleStore(facts=entities).diff(expected), ([], []))
+        # And the same again through the shorthand
+        cli.main(['-i', a, b, '-o', self.out])
+        self.assertEqual(self.output(), merged)
+
+    def test_diff(self):
+        cli.main(['diff', a, b, '-o', self.out])
+        changes = list(txlog.read_log(self.out))
+        ts = tripl.TripleStore.load_file(a)
+        ts.apply_changes(changes)
+        self.assertEqual(ts.diff(tripl.TripleStore.load_file(b)), ([], []))
+        self.assertTrue(all(op in (txlog.ASSERT, txlog.RETRACT) for op, _ in changes))
+
+    def test_pull(self):
+        ts = tripl.TripleStore.load_file(a)
+        for expr in [['db:ident', 'toy.seq:depth'], ['db:ident', {'toy.seq:sample': ['toy.sample:geo']}]]:
+            cli.main(['pull', a, '-e', json.dumps(expr), '-p', '{"toy:type": "toy.type:seq"}', '-o', self.out])
+            with open(self.out) as fp:
+                results = [json.loads(line) for line in fp]
+            expected = json.loads(json.dumps(list(ts.pull_many(expr, {'toy:type': 'toy.type:seq'})), default=list))
+            self.assertEqual(sorted(results, key=repr), sorted(expected, key=repr))
@@ -0,0 +1,55 @@
+import unittest
+
+from tripl import tripl
+from tests import util
+
+
+def old_flow(schema=None, facts=None):
+    "A store built the way the constructor used to: everything asserted, then the schema, then everything again."
+    ts = tripl.TripleStore()
+    # Back to just the base schema
+    ts.retract_facts([('db:schema', 'db.refs:lazy', True),
+                      ('db:schema', 'db.cardinality:default', 'db.cardinality:many')])
+    ts.assert_facts(facts)
+    if schema:
+        ts.assert_schema(schema)
+    schema_pull = ts.pull(['*'], 'db:schema')
+    ts.lazy_refs = tripl.some(schema_pull.get('db.refs:lazy'), True)
+    ts.default_cardinality = tripl.some(schema_pull.get('db.cardinality:default'), 'db.cardinality:many')
+    ts.assert_fact({'db:ident': 'db:schema', 'db.refs:lazy': ts.lazy_refs,
+                    'db.cardinality:default': ts.default_cardinality})
+    ts.assert_facts(facts)
+    return ts
+
+
+def indexes(ts):
+    def entries(index):
+        return dict((k, dict((a, set(tripl.as_values(vs))) for a, vs in entry.items())) for k, entry in index.items())
+    return entries(ts._eav_index), entries(ts._vae_index), ts.default_cardinality, ts.lazy_refs
+
+
+class ConstructorTest(unittest.TestCase):
+
+    def test_same_as_old_flow(self):
+        facts = [
+            # Refs, and a value replaced, before the schema making them a ref and cardinality one
+            {'db:ident': 'b', 'p:parent': ['a'], 'p:name': 'bee'},
+            {'db:ident': 'c', 'p:parent': ['b'], 'p:name': 'sea'},
+            {'db:ident': 'c', 'p:name': 'see'},
+            {'db:ident': 'p:parent', 'db:valueType': 'db.type:ref'},
+            {'db:ident': 'db:schema',
+             'db:attributes': [{'db:ident': 'p:name', 'db:cardinality': 'db.cardinality:one'}]},
+            {'db:ident': 'a', 'p:tags': ['x', 'y']}]
+        new = tripl.TripleStore(facts=facts)
+        self.assertEqual(indexes(new), indexes(old_flow(facts=facts)))
+        self.assertEqual(new.pull(['*', {'p:_parent': ['db:ident']}], 'b'),
+                         {'db:ident': set(['b']), 'p:name': 'bee', 'p:parent': set(['a']),
+                          'p:_parent': [{'db:ident': set(['c'])}]})
+        for schema, facts in [(util.schema, util.facts()), ({'p:tags': {'db:valueType': 'db.type:ref'}}, facts)]:
+            self.assertEqual(indexes(tripl.TripleStore(schema=schema, facts=facts)), indexes(old_flow(schema, facts)))
+        # Dumps (an eav index) and cardinality defaults given as facts
+        dump = dict(tripl.TripleStore(facts=facts)._eav_index.items())
+        dump['db:schema'] = dict(dump['db:schema'], **{'db.cardinality:default': set(['db.cardinality:one'])})
+        new = tripl.TripleStore(facts=dump)
+        self.assertEqual(new.default_cardinality, 'db.cardinality:one')
+        self.assertEqual(indexes(new), indexes(old_flow(facts=dump)))
@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+
+from tripl import tripl
+from tests import util
+
+
+class DatomsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ts = util.store()
+        self.triples = set((e, a, v) for e, entry in self.ts._eav_index.items()
+                           for a, vs in entry.items() for v in tripl.as_values(vs))
+
+    def test_orders(self):
+        for index, key in [('eav', lambda t: t), ('ave', lambda t: (t[1], t[2], t[0]))]:
+            datoms = list(self.ts.datoms(index))
+            self.assertEqual(set(datoms), self.triples)
+            self.assertEqual(datoms, sorted(datoms, key=lambda t: tuple(tripl._order_key(x) for x in key(t))))
+        # Only refs are in the vae index
+        refs = set(t for t in self.triples if self.ts._ref_attr(t[1]))
+        self.assertEqual(set(self.ts.datoms('vae')), refs)
+        self.assertRaises(ValueError, self.ts.datoms, 'aev')
+
+    def test_prefix_and_range(self):
+        self.assertEqual(set(self.ts.datoms('eav', ('seq-1',))), set(t for t in self.triples if t[0] == 'seq-1'))
+        self.assertEqual(set(self.ts.datoms('vae', ('sample-1', 'toy.seq:sample'))),
+                         set(t for t in self.triples if t[1:] == ('toy.seq:sample', 'sample-1')))
+        self.assertEqual(set(self.ts.datoms('ave', ('toy.seq:depth',), 25, 50)),
+                         set(t for t in self.triples if t[1] == 'toy.seq:depth' and 25 <= t[2] < 50))
+
+    def test_while_writing(self):
+        # p:a and p:z always change in the same call, so should never differ in a thread safe store's datoms; and
+        # p:n's values are a set the writer adds to and removes from in place
+        n = 50
+        ts = tripl.TripleStore(schema={'p:a': {'db:cardinality': 'db.cardinality:one'},
+                                       'p:z': {'db:cardinality': 'db.cardinality:one'},
+                                       'p:next': {'db:valueType': 'db.type:ref'}}, thread_safe=True)
+        ts.assert_facts([{'db:ident': 'e%d' % i, 'p:a': 0, 'p:z': 0, 'p:n': list(range(300)),
+                          'p:next': ['e%d' % j for j in range(n)]} for i in range(n)])
+        stop = threading.Event()
+        errors = []
+
+        def writer():
+            k = 0
+            try:
+                while not stop.is_set():
+                    k += 1
+                    es = ['e%d' % ((k + i) % n) for i in range(5)]
+                    ts.assert_facts([{'db:ident': e, 'p:a': k, 'p:z': k, 'p:n': list(range(k, k + 300))} for e in es])
+                    ts.retract_facts([(e, 'p:n', v) for e in es for v in range(k, k + 200)])
+                    edge = (es[0], 'p:next', 'e%d' % (k % n))
+                    ts.apply_changes([('-', edge), ('+', edge)])
+            except Exception as e:
+                errors.append(e)
+
+        interval = util.switch_often()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        deadline = time.time() + 1.0
+        try:
+            while time.time() < deadline:
+                values = {}
+                for e, a, v in ts.datoms():
+                    if a in ('p:a', 'p:z'):
+                        values.setdefault(e, set()).add(v)
+                self.assertEqual(len(values), n)
+                self.assertTrue(all(len(vs) == 1 for vs in values.values()), values)
+                self.assertEqual(len(list(ts.datoms('vae'))), n * n)
+        finally:
+            stop.set()
+            thread.join()
+            util.switch_often(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(ts._lock._readers, 0)
@@ -0,0 +1,30 @@
+import unittest
+
+from tripl import tripl
+
+
+class EntityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ts = tripl.TripleStore(schema={'p:parent': {'db:valueType': 'db.type:ref'}},
+                                    facts=[{'db:ident': 'a', 'p:n': list(range(12)), 'p:tag': 'x'},
+                                           {'db:ident': 'b', 'p:parent': ['a'], 'p:tag': ['x', 'y']}])
+
+    def test_values_are_sets(self):
+        a = self.ts.entity('a')
+        self.assertEqual(a['p:tag'], set(['x']))
+        self.assertEqual(self.ts.entity('b')['p:tag'], set(['x', 'y']))
+        self.assertEqual(a['p:n'], set(range(12)))
+        self.assertEqual(a['p:missing'], set())
+
+    def test_values_are_copies(self):
+        a = self.ts.entity('a')
+        a['p:n'].add(99)
+        self.assertEqual(self.ts.match_pattern({'p:n': 99}), set())
+        self.assertEqual(self.ts.stats('p:n')['triples'], 12)
+
+    def test_refs(self):
+        b = self.ts.entity('b')
+        self.assertEqual([e.eid for e in b['p:parent']], ['a'])
+        self.assertIs(self.ts.entity('a'), b['p:parent'][0])
+        self.assertEqual([e.eid for e in self.ts.entity('a')['p:_parent']], ['b'])
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tripl import explain, storage, tripl
+from tests import util
+
+
+class ExplainTest(unittest.TestCase):
+
+    def test_text_clauses_use_text_index(self):
+        ts = util.store(thread_safe=True)
+        ts.index_text('toy.seq:description')
+        pattern = {'toy.seq:description': {'text': 'ebola'}}
+        plan = ts.explain(pattern)
+        self.assertEqual(plan.steps[0]['index'], 'text index')
+        self.assertEqual(plan.steps[0]['actual'], len(util.scan(ts, pattern)))
+        self.assertEqual(plan.scans, [])
+        # Released once done
+        ts.assert_fact({'db:ident': 'seq-1', 'toy.seq:description': 'ebola'})
+
+    def test_all_clauses_step(self):
+        ts = util.store()
+        ts.index_text('toy.seq:description')
+        pattern = {'toy.seq:description': {'text': 'ebola'}, 'toy.seq:depth': {'<': 50}}
+        step = ts.explain(pattern).steps[-1]
+        self.assertEqual(step['what'], '(all clauses)')
+        self.assertEqual(step['index'], 'text index, column')
+        self.assertEqual(step['actual'], len(util.scan(ts, pattern)))
+        # From the clauses' estimates, rather than the other steps' actual counts
+        n_entities = len(list(ts._eav_index.keys()))
+        expected = float(n_entities)
+        for attr, value in pattern.items():
+            expected *= float(explain.estimate_clause(ts, attr, value)) / n_entities
+        self.assertEqual(step['estimated'], int(round(expected)))
+
+    def test_storage_match(self):
+        dirname = tempfile.mkdtemp()
+        try:
+            ts = tripl.TripleStore(schema=util.schema, facts=util.facts(),
+                                   storage=storage.SQLiteStorage(os.path.join(dirname, 'graph.db')))
+            pattern = {'toy:type': 'toy.type:seq', 'toy.seq:tags': 'x'}
+            plan = ts.explain(pattern)
+            self.assertEqual([step['index'] for step in plan.steps], ['storage match'] * 3)
+            self.assertEqual(plan.steps[-1]['actual'], len(util.scan(ts, pattern)))
+            ts.close()
+        finally:
+            shutil.rmtree(dirname)
+
+    def test_partitions_load_as_matching_would(self):
+        dirname = tempfile.mkdtemp()
+        try:
+            util.store().dump_partitions(dirname)
+            ts = tripl.TripleStore.load_partitions(dirname)
+            for pattern in [{'toy:type': 'toy.type:sample'}, {'toy:type': 'toy.type:sample', 'db:ident': 'sample-1'}]:
+                plan = ts.explain(pattern)
+                self.assertEqual(plan.steps[-1]['actual'], len(util.scan(util.store(), pattern)))
+                self.assertEqual(ts._storage.resident(), ['_schema', 'toy.type:sample'])
+        finally:
+            shutil.rmtree(dirname)
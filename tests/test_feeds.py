@@ -0,0 +1,51 @@
+import unittest
+
+from tripl import tripl
+
+
+class FeedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ts = tripl.TripleStore(facts=[{'db:ident': 'a', 'p:type': 'x', 'p:n': 1}])
+        self.batches = []
+
+    def listener(self, added, retracted):
+        self.batches.append((sorted(added), sorted(retracted)))
+
+    def test_attrs(self):
+        self.ts.subscribe(self.listener, attrs=['p:n'])
+        self.ts.assert_facts([{'db:ident': 'a', 'p:n': 2, 'p:m': 3}])
+        self.assertEqual(self.batches, [([('a', 'p:n', 2)], [])])
+
+    def test_pattern_hears_entities_leaving(self):
+        self.ts.subscribe(self.listener, pattern={'p:type': 'x'})
+        self.ts.retract_fact(('a', 'p:type', 'x'))
+        self.ts.assert_fact({'db:ident': 'b', 'p:type': 'y'})
+        self.assertEqual(self.batches, [([], [('a', 'p:type', 'x')])])
+
+    def test_net_of_undone(self):
+        subscription = self.ts.subscribe(self.listener)
+        self.ts.apply_changes([('+', ('a', 'p:n', 5)), ('-', ('a', 'p:n', 5))])
+        self.assertEqual(self.batches, [])
+        self.ts.unsubscribe(subscription)
+        self.ts.assert_fact({'db:ident': 'a', 'p:n': 6})
+        self.assertEqual(self.batches, [])
+
+    def test_comparison_and_text_patterns(self):
+        self.ts.subscribe(self.listener, pattern={'p:n': {'>': 5}})
+        self.ts.assert_fact({'db:ident': 'a', 'p:n': 6})
+        self.ts.assert_fact({'db:ident': 'b', 'p:n': 2})
+        self.assertEqual(self.batches, [([('a', 'p:n', 6)], [])])
+        text_batches = []
+        self.ts.subscribe(lambda added, retracted: text_batches.append(added),
+                          pattern={'p:name': {'text': 'jena'}, 'p:type': 'x'})
+        self.ts.assert_fact({'db:ident': 'a', 'p:name': 'Jena sample'})
+        self.ts.assert_fact({'db:ident': 'b', 'p:name': 'Jena sample', 'p:type': 'y'})
+        self.assertEqual(text_batches, [[('a', 'p:name', 'Jena sample')]])
+        self.assertRaises(ValueError, self.ts.subscribe, self.listener, pattern={'p:n': {'~': 1}})
+
+    def test_typed_patterns_are_coerced(self):
+        ts = tripl.TripleStore(schema={'p:n': {'db:valueType': 'db.type:long'}})
+        ts.subscribe(self.listener, pattern={'p:n': '10'})
+        ts.assert_fact({'db:ident': 'a', 'p:n': '10'})
+        self.assertEqual(self.batches, [([('a', 'db:ident', 'a'), ('a', 'p:n', 10)], [])])
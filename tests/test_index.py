@@ -0,0 +1,24 @@
+import unittest
+
+from tripl.index import TripleIndex, as_values, get_values, max_tuple
+
+
+class TripleIndexTest(unittest.TestCase):
+
+    def test_compact_forms(self):
+        index = TripleIndex()
+        self.assertEqual(index.add('e', 'a', 1), 1)
+        self.assertEqual(index['e']['a'], 1)
+        index.add('e', 'a', 2)
+        self.assertEqual(index['e']['a'], (1, 2))
+        for v in range(3, max_tuple + 2):
+            index.add('e', 'a', v)
+        self.assertEqual(type(index['e']['a']), set)
+        self.assertEqual(set(get_values(index['e'], 'a')), set(range(1, max_tuple + 2)))
+        for v in range(2, max_tuple + 2):
+            index.remove('e', 'a', v)
+        self.assertEqual(index['e']['a'], 1)
+        self.assertRaises(KeyError, index.remove, 'e', 'a', 5)
+        index.remove('e', 'a', 1)
+        self.assertNotIn('e', index)
+        self.assertEqual(as_values('x'), ('x',))
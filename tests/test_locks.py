@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+import unittest
+
+from tripl import tripl
+from tripl.locks import RWLock
+from tests import util
+
+
+class RWLockTest(unittest.TestCase):
+
+    def test_reentrant(self):
+        lock = RWLock()
+        with lock.writing():
+            with lock.reading():
+                with lock.writing():
+                    pass
+        with lock.reading():
+            with lock.reading():
+                self.assertRaises(RuntimeError, lock.acquire_write)
+        self.assertEqual(lock._readers, 0)
+
+    def test_writer_excludes_readers(self):
+        lock = RWLock()
+        events = []
+        lock.acquire_write()
+        reader = threading.Thread(target=lambda: (lock.acquire_read(), events.append('read'), lock.release_read()))
+        reader.start()
+        time.sleep(0.05)
+        events.append('written')
+        lock.release_write()
+        reader.join()
+        self.assertEqual(events, ['written', 'read'])
+
+
+class StressTest(unittest.TestCase):
+    "Readers running every kind of query (pull, match, datoms, aggregate, reachable, diff) while a writer writes."
+
+    n = 200
+    duration = 2.0
+
+    def test_concurrent_readers_and_writer(self):
+        n = self.n
+        ts = tripl.TripleStore(schema={'p:parent': {'db:valueType': 'db.type:ref'},
+                                       'p:age': {'db:cardinality': 'db.cardinality:one'},
+                                       'p:age2': {'db:cardinality': 'db.cardinality:one'}}, thread_safe=True)
+        ts.assert_facts([{'db:ident': 'e%d' % i, 'p:age': 0, 'p:age2': 0, 'p:type': 'x'} for i in range(n)])
+        idents = set('e%d' % i for i in range(n))
+        stop = threading.Event()
+        errors = []
+        rand = random.Random(0)
+
+        def writer():
+            k = 0
+            try:
+                while not stop.is_set():
+                    k += 1
+                    # p:age and p:age2 always change in the same call, so no reader should ever see them differ
+                    ts.assert_facts([{'db:ident': 'e%d' % i, 'p:age': k, 'p:age2': k,
+                                      'p:parent': 'e%d' % rand.randrange(n)} for i in rand.sample(range(n), 20)])
+                    ts.retract_facts([('e%d' % rand.randrange(n), 'p:parent', 'e%d' % rand.randrange(n))])
+            except Exception as e:
+                errors.append(e)
+
+        def reader():
+            try:
+                while not stop.is_set():
+                    for result in ts.pull_many(['p:age', 'p:age2', {'p:_parent': ['db:ident']}], {'p:type': 'x'}):
+                        assert result['p:age'] == result['p:age2'], result
+                    snapshot = ts.snapshot()
+                    ages = [r['p:age'] for r in snapshot.pull_many(['p:age'], snapshot.match_pattern({'p:type': 'x'}))]
+                    assert len(ages) == n
+                    ages = {}
+                    for e, a, v in ts.datoms():
+                        if a in ('p:age', 'p:age2'):
+                            ages.setdefault(e, set()).add(v)
+                    assert len(ages) == n and all(len(vs) == 1 for vs in ages.values()), ages
+                    # Grouping by p:age, each group's p:age2s sum to the group's age times its size
+                    groups = list(ts.aggregate({'n': 'count', 'sum': ('sum', 'p:age2')}, group_by='p:age'))
+                    assert sum(row['n'] for _, row in groups) == n, groups
+                    assert all(row['sum'] == age * row['n'] for age, row in groups), groups
+                    for attr in ['p:parent', 'p:_parent']:
+                        eids = list(ts.reachable('e0', attr))
+                        assert len(eids) == len(set(eids)) and set(eids) <= idents, eids
+                    # Any entity whose p:age changed, had its p:age2 changed with it
+                    changed = {}
+                    for op, (e, a, v) in ts.diff_changes(snapshot):
+                        if a in ('p:age', 'p:age2'):
+                            changed.setdefault((op, e), {}).setdefault(a, set()).add(v)
+                    assert all(len(values) == 2 and values['p:age'] == values['p:age2']
+                               for values in changed.values()), changed
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(4)]
+        interval = util.switch_often()
+        for thread in threads:
+            thread.start()
+        time.sleep(self.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        util.switch_often(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(ts._lock._readers, 0)
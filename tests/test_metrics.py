@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tripl import storage, tripl
+from tests import util
+
+
+class PullTest(unittest.TestCase):
+
+    def test_nested_pulls_timed_once(self):
+        ts = util.store(thread_safe=True)
+        metrics = ts.instrument()
+        ts.pull(['*', {'toy.seq:parent': ['*', {'toy.seq:sample': ['*']}]}], 'seq-100')
+        self.assertEqual(metrics.timers['pull'][0], 1)
+        self.assertEqual(metrics.maxima['pull_depth'], 3)
+        self.assertEqual(metrics.counts['entities_pulled'], 3)
+
+
+class CacheCountsTest(unittest.TestCase):
+
+    def counts(self, ts, f):
+        metrics = ts.instrument()
+        f()
+        ts.metrics = None
+        return metrics.counts['cache_hits'], metrics.counts['cache_misses']
+
+    def test_in_memory_caches(self):
+        ts = util.store()
+        entity = ts.entity('seq-1')
+        self.assertEqual(self.counts(ts, lambda: ts.entity('seq-1')), (1, 0))
+        del entity
+        pattern = {'toy.seq:depth': {'>': 50}}
+        self.assertEqual(self.counts(ts, lambda: ts.match_pattern(pattern)), (0, 1))
+        self.assertEqual(self.counts(ts, lambda: ts.match_pattern(pattern)), (1, 0))
+        self.assertEqual(self.counts(ts, lambda: ts.ancestors('seq-100', 'toy.seq:parent')), (0, 1))
+        ts.cache_closure('toy.seq:parent')
+        self.assertEqual(self.counts(ts, lambda: ts.ancestors('seq-100', 'toy.seq:parent')), (1, 0))
+
+    def test_storage_caches(self):
+        dirname = tempfile.mkdtemp()
+        try:
+            ts = tripl.TripleStore(schema=util.schema, facts=util.facts(),
+                                   storage=storage.SQLiteStorage(os.path.join(dirname, 'graph.db'), cache_size=10))
+            # Schema lookups hit the cache too
+            self.assertEqual(self.counts(ts, lambda: ts.pull(['*'], 'seq-150'))[1], 1)
+            hits, misses = self.counts(ts, lambda: ts.pull(['*'], 'seq-150'))
+            self.assertTrue(hits)
+            self.assertEqual(misses, 0)
+            ts.close()
+            util.store().dump_partitions(os.path.join(dirname, 'parts'))
+            ts = tripl.TripleStore.load_partitions(os.path.join(dirname, 'parts'), max_partitions=2)
+            pattern = {'toy:type': 'toy.type:sample'}
+            # Loads the partition, then finds it resident
+            self.assertEqual(self.counts(ts, lambda: ts.match_pattern(pattern))[1], 1)
+            self.assertEqual(self.counts(ts, lambda: ts.match_pattern(pattern))[1], 0)
+        finally:
+            shutil.rmtree(dirname)
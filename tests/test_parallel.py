@@ -0,0 +1,35 @@
+import unittest
+
+from tripl import parallel
+from tests import util
+
+
+@unittest.skipIf(parallel._fork_context() is None, "needs fork")
+class ParallelPullTest(unittest.TestCase):
+
+    expr = ['*', {'toy.seq:sample': ['*', {'toy.seq:_sample': ['db:ident']}]}]
+    pattern = {'toy:type': 'toy.type:seq'}
+
+    def setUp(self):
+        self.ts = util.store(thread_safe=True)
+        self.eids = sorted(self.ts.match_pattern(self.pattern))
+
+    def test_ordered(self):
+        serial = list(self.ts.pull_many(self.expr, self.eids))
+        self.assertEqual(list(self.ts.pull_many(self.expr, self.eids, processes=2, chunk_size=7)), serial)
+
+    def test_unordered(self):
+        results = self.ts.pull_many(self.expr, self.eids, processes=2, chunk_size=7, ordered=False)
+        self.assertEqual(util.by_ident(results), util.by_ident(self.ts.pull_many(self.expr, self.eids)))
+
+    def test_sort_and_limit(self):
+        for sort_by in ('toy.seq:depth', 'toy.seq:description'):
+            expected = list(self.ts.pull_many(['*'], self.pattern, sort_by=sort_by))[:10]
+            results = list(self.ts.pull_many(['*'], self.pattern, sort_by=sort_by, limit=10, processes=2))
+            self.assertEqual([r[sort_by] for r in results], [r[sort_by] for r in expected])
+        self.assertEqual(len(list(self.ts.pull_many(['*'], self.eids, limit=5, processes=2))), 5)
+
+    def test_early_close(self):
+        results = self.ts.pull_many(['*'], self.eids, processes=2, chunk_size=5)
+        next(results)
+        results.close()
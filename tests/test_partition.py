@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tripl import tripl
+from tests import util
+
+
+class PartitionTest(unittest.TestCase):
+
+    expr = ['*', {'toy.seq:sample': ['*', {'toy.seq:_sample': ['db:ident']}]}]
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.ts = util.store()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def lazy(self, by, max_partitions=2):
+        path = os.path.join(self.dirname, by)
+        self.ts.dump_partitions(path, by=by, n_partitions=4)
+        return tripl.TripleStore.load_partitions(path, max_partitions=max_partitions)
+
+    def test_only_touched_partitions_load(self):
+        lazy = self.lazy('type')
+        storage = lazy._storage
+        self.assertEqual(storage.resident(), ['_schema'])
+        self.assertEqual(lazy.match_pattern({'toy:type': 'toy.type:sample'}),
+                         self.ts.match_pattern({'toy:type': 'toy.type:sample'}))
+        self.assertEqual(storage.resident(), ['_schema', 'toy.type:sample'])
+        entity = storage.read_entity('seq-3')
+        self.assertEqual(dict((a, sorted(vs)) for a, vs in entity.items()),
+                         dict((a, sorted(vs) if isinstance(vs, set) else [vs])
+                              for a, vs in self.ts.pull(['*'], 'seq-3').items()))
+        self.assertEqual(storage.resident(), ['_schema', 'toy.type:sample'])
+
+    def test_same_answers(self):
+        for by in ('type', 'hash'):
+            lazy = self.lazy(by)
+            for pattern in [{'toy:type': 'toy.type:seq'}, {'toy.sample:geo': 'a'}, {'toy.seq:depth': {'>': 50}}]:
+                self.assertEqual(util.by_ident(lazy.pull_many(self.expr, pattern)),
+                                 util.by_ident(self.ts.pull_many(self.expr, pattern)))
+            self.assertTrue(len(lazy._storage.resident()) <= 3)
+            self.assertEqual(lazy.stats(), self.ts.stats())
+
+    def test_writes(self):
+        lazy = self.lazy('type')
+        fact = {'db:ident': 'seq-new', 'toy:type': 'toy.type:seq', 'toy.seq:sample': 'sample-1'}
+        for graph in (lazy, self.ts):
+            graph.assert_fact(fact)
+            graph.retract_fact(('seq-2', 'toy:type', 'toy.type:seq'))
+        for pattern in [{'toy:type': 'toy.type:seq'}, {'toy.seq:sample': 'sample-1'}]:
+            self.assertEqual(lazy.match_pattern(pattern), self.ts.match_pattern(pattern))
+        self.assertEqual(util.normalized(lazy.pull(self.expr, 'seq-new')),
+                         util.normalized(self.ts.pull(self.expr, 'seq-new')))
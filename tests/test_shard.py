@@ -0,0 +1,20 @@
+import unittest
+
+from tripl.shard import ShardedTripleStore
+from tests import util
+
+
+class ShardTest(unittest.TestCase):
+
+    def test_same_answers_as_one_store(self):
+        ts = util.store()
+        expr = ['*', {'toy.seq:sample': ['*', {'toy.seq:_sample': ['db:ident']}]}]
+        with ShardedTripleStore(n_shards=3, schema=util.schema, facts=util.facts()) as sts:
+            for pattern in [{'toy:type': 'toy.type:seq'}, {'toy.sample:geo': 'b'}]:
+                self.assertEqual(sts.match_pattern(pattern), ts.match_pattern(pattern))
+                self.assertEqual(util.by_ident(sts.pull_many(expr, pattern)),
+                                 util.by_ident(ts.pull_many(expr, pattern)))
+            sts.retract_fact(('seq-1', 'toy:type', 'toy.type:seq'))
+            ts.retract_fact(('seq-1', 'toy:type', 'toy.type:seq'))
+            pattern = {'toy:type': 'toy.type:seq'}
+            self.assertEqual(sts.match_pattern(pattern), ts.match_pattern(pattern))
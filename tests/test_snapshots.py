@@ -0,0 +1,69 @@
+import unittest
+
+from tests import util
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_isolated_from_writes(self):
+        ts = util.store()
+        before = util.by_ident(ts.pull_many(['*'], {'toy:type': 'toy.type:seq'}))
+        snapshot = ts.snapshot()
+        ts.assert_fact({'db:ident': 'seq-1', 'toy.seq:depth': -1.0})
+        ts.retract_fact(('seq-2', 'toy.seq:sample', ts.pull(['*'], 'seq-2')['toy.seq:sample']))
+        ts.assert_fact({'db:ident': 'seq-new', 'toy:type': 'toy.type:seq'})
+        self.assertEqual(util.by_ident(snapshot.pull_many(['*'], {'toy:type': 'toy.type:seq'})), before)
+        self.assertEqual(ts.pull(['toy.seq:depth'], 'seq-1')['toy.seq:depth'], -1.0)
+
+    def test_diff(self):
+        ts = util.store()
+        snapshot = ts.snapshot()
+        ts.assert_fact({'db:ident': 'seq-1', 'toy.seq:depth': -1.0})
+        added, retracted = snapshot.diff(ts)
+        self.assertEqual(added, [('seq-1', 'toy.seq:depth', -1.0)])
+        self.assertEqual(len(retracted), 1)
+
+    def test_items_while_writing(self):
+        ts = util.store()
+        snapshot = ts.snapshot()
+        ts.assert_fact({'db:ident': 'seq-0', 'toy.seq:depth': -2.0})
+        expected = dict((e, dict(attrs)) for e, attrs in snapshot._eav_index.items())
+        items = snapshot._eav_index.items()
+        seen = dict((e, dict(attrs)) for e, attrs in (next(items) for _ in range(len(expected) // 2)))
+        # Entities written to part way through (whether already generated or not) still come out once, as they were
+        for i in range(200):
+            ts.assert_fact({'db:ident': 'seq-%d' % i, 'toy.seq:depth': -1.0})
+        ts.assert_fact({'db:ident': 'seq-new', 'toy:type': 'toy.type:seq'})
+        for e, attrs in items:
+            self.assertNotIn(e, seen)
+            seen[e] = dict(attrs)
+        self.assertEqual(seen, expected)
+
+    def test_diff_changes_holds_still(self):
+        ts = util.store(thread_safe=True)
+        other = util.store()
+        other.assert_fact({'db:ident': 'seq-1', 'toy.seq:depth': -1.0})
+        expected = sorted(ts.diff_changes(other), key=repr)
+        changes = ts.diff_changes(other)
+        first = [next(changes)]
+        # Writes made while the diff is being generated don't show up in it
+        ts.assert_facts([{'db:ident': 'new-%d' % i, 'p:n': i} for i in range(100)])
+        ts.assert_fact({'db:ident': 'seq-1', 'toy.seq:depth': -1.0})
+        self.assertEqual(sorted(first + list(changes), key=repr), expected)
+
+    def test_indexed_clauses_after_writes(self):
+        ts = util.store()
+        ts.index_text('toy.seq:description')
+        patterns = [{'toy.seq:description': {'text': 'ebola'}}, {'toy.seq:depth': {'>': 50}},
+                    {'toy.seq:description': {'text': 'zika'}, 'toy.seq:depth': {'<': 50}}]
+        ts.match_pattern(patterns[1])
+        snapshot = ts.snapshot()
+        expected = [util.scan(snapshot, pattern) for pattern in patterns]
+        # Answered from the live store's indexes while they're in step
+        self.assertIs(snapshot._column('toy.seq:depth'), ts._column('toy.seq:depth'))
+        ts.assert_fact({'db:ident': 'seq-1', 'toy.seq:description': 'zika', 'toy.seq:depth': 99.0})
+        ts.assert_fact({'db:ident': 'seq-new', 'toy.seq:description': 'ebola', 'toy.seq:depth': 99.0})
+        ts.retract_fact(('seq-2', 'toy.seq:description', ts.pull(['*'], 'seq-2')['toy.seq:description']))
+        self.assertEqual([snapshot.match_pattern(pattern) for pattern in patterns], expected)
+        self.assertEqual([step['index'] for step in snapshot.explain(patterns[2]).steps],
+                         ['text index', 'column', 'text index, column'])
@@ -0,0 +1,26 @@
+import unittest
+
+from tripl import stats, tripl
+
+
+class StatsTest(unittest.TestCase):
+
+    def setUp(self):
+        # More distinct names than AttrStats.max_values, but only three kinds
+        self.ts = tripl.TripleStore(facts=[{'db:ident': 'e-%d' % i, 'p:name': 'name-%d' % i,
+                                            'p:kind': 'kind-%d' % (i % 3)} for i in range(3000)])
+
+    def test_value_counts_are_bounded(self):
+        attr_stats = self.ts._attr_stats()
+        self.assertIsNone(attr_stats['p:name'].values)
+        self.assertEqual(attr_stats['p:kind'].values, {'kind-0': 1000, 'kind-1': 1000, 'kind-2': 1000})
+        distinct = self.ts.stats('p:name')['distinct_values']
+        self.assertTrue(abs(distinct - 3000) < 150, distinct)
+        self.assertEqual(stats.estimate(attr_stats['p:name'], ['name-1']), 1)
+
+    def test_aggregates_without_value_counts(self):
+        self.assertEqual(self.ts.aggregate({'n': ('count_distinct', 'p:name')}), {'n': 3000})
+        self.assertEqual(self.ts.aggregate({'n': ('count', 'p:name')}), {'n': 3000})
+        groups = dict(self.ts.aggregate({'n': 'count'}, group_by='p:name'))
+        self.assertEqual(len(groups), 3000)
+        self.assertEqual(groups['name-7'], {'n': 1})
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tripl import storage, tripl
+from tests import util
+
+
+class SQLiteStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'graph.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_same_answers_as_memory(self):
+        memory = util.store()
+        ts = tripl.TripleStore(schema=util.schema, facts=util.facts(),
+                               storage=storage.SQLiteStorage(self.filename, cache_size=10))
+        expr = ['*', {'toy.seq:sample': ['*', {'toy.seq:_sample': ['db:ident']}]}]
+        for pattern in [{'toy:type': 'toy.type:seq'}, {'toy.seq:tags': ['x', 'z']}, {'toy.seq:depth': {'>': 50}}]:
+            self.assertEqual(ts.match_pattern(pattern), memory.match_pattern(pattern))
+            self.assertEqual(util.by_ident(ts.pull_many(expr, pattern)), util.by_ident(memory.pull_many(expr, pattern)))
+        self.assertEqual(ts.stats('toy.seq:sample'), memory.stats('toy.seq:sample'))
+        ts.close()
+
+    def test_reopen(self):
+        ts = tripl.TripleStore(schema=util.schema, storage=storage.SQLiteStorage(self.filename))
+        ts.assert_fact({'db:ident': 'seq-1', 'toy.seq:depth': '1.5'})
+        ts.close()
+        ts = tripl.TripleStore(storage=storage.SQLiteStorage(self.filename))
+        self.assertEqual(ts._attr_type('toy.seq:depth'), 'db.type:double')
+        self.assertEqual(ts.match_pattern({'toy.seq:depth': 1.5}), set(['seq-1']))
+        ts.close()
+
+    def test_snapshot_match(self):
+        ts = tripl.TripleStore(schema=util.schema, facts=util.facts(), storage=storage.SQLiteStorage(self.filename))
+        pattern = {'toy:type': 'toy.type:seq', 'toy.seq:tags': 'x'}
+        expected = ts.match_pattern(pattern)
+        view = ts.snapshot()
+        ts.retract_fact((min(expected), 'toy.seq:tags', 'x'))
+        ts.assert_fact({'db:ident': 'seq-new', 'toy:type': 'toy.type:seq', 'toy.seq:tags': 'x'})
+        self.assertEqual(view.match_pattern(pattern), expected)
+        self.assertEqual(view.match_pattern(pattern), util.scan(view, pattern))
+        ts.close()
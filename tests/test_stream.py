@@ -0,0 +1,51 @@
+import io
+import unittest
+
+from tripl import stream, tripl
+from tests import util
+
+
+def _dump(ts):
+    fp = io.StringIO() if str is not bytes else io.BytesIO()
+    ts._dump(fp)
+    fp.seek(0)
+    return fp
+
+
+class StreamTest(unittest.TestCase):
+
+    def test_dump_round_trip(self):
+        ts = util.store()
+        entities = list(stream.read_entities(_dump(ts)))
+        self.assertEqual(entities, list(stream.index_entities(ts._eav_index)))
+        loaded = tripl.TripleStore(facts=dict(entities))
+        self.assertEqual(loaded.diff(ts), ([], []))
+
+    def test_merge_and_diff(self):
+        a = tripl.TripleStore(facts=[{'db:ident': 'x', 'p:n': 1}, {'db:ident': 'y', 'p:n': 2}])
+        b = tripl.TripleStore(facts=[{'db:ident': 'y', 'p:n': 3}, {'db:ident': 'z', 'p:n': 4}])
+        merged = dict(stream.merge_entities([stream.read_entities(_dump(a)), stream.read_entities(_dump(b))]))
+        self.assertEqual(sorted(merged['y']['p:n']), [2, 3])
+        changes = set(stream.diff_entities(stream.read_entities(_dump(a)), stream.read_entities(_dump(b))))
+        self.assertEqual(changes, set(a.diff_changes(b)))
+
+    def test_merge_schema_in_one_source_only(self):
+        # An attribute with schema in one dump, and just docs in the other, comes out once, with both
+        a = tripl.TripleStore(schema={'p:n': {'db:cardinality': 'db.cardinality:one'}},
+                              facts=[{'db:ident': 'x', 'p:n': 1}, {'db:ident': 'p:m', 'p:doc': 'no schema'}])
+        b = tripl.TripleStore(facts=[{'db:ident': 'a', 'p:n': 2}, {'db:ident': 'p:n', 'p:doc': 'a number'},
+                                     {'db:ident': 'x', 'p:n': 3}])
+        fp = io.StringIO() if str is not bytes else io.BytesIO()
+        stream.write_entities(stream.merge_entities([stream.read_entities(_dump(a)), stream.read_entities(_dump(b))]),
+                              fp)
+        fp.seek(0)
+        merged = list(stream.read_entities(fp))
+        eids = [eid for eid, _ in merged]
+        self.assertEqual(len(eids), len(set(eids)))
+        merged = dict(merged)
+        self.assertEqual(merged['p:n']['p:doc'], ['a number'])
+        self.assertEqual(merged['p:n']['db:cardinality'], ['db.cardinality:one'])
+        # Cardinality one, so the later source wins
+        self.assertEqual(merged['x']['p:n'], [3])
+        self.assertEqual(set(stream.diff_entities(stream.read_entities(_dump(a)), stream.read_entities(_dump(b)))),
+                         set(a.diff_changes(b)))
@@ -0,0 +1,31 @@
+import unittest
+
+from tripl import text
+from tests import util
+
+
+class TextTest(unittest.TestCase):
+
+    patterns = [{'toy.seq:description': {'text': 'ebola JENA'}},
+                {'toy.seq:description': {'contains': 'bol'}},
+                {'toy.seq:description': {'contains': 'ee'}},
+                {'toy.seq:description': {'text': 'zika'}, 'toy.seq:depth': {'<': 50}}]
+
+    def test_tokens(self):
+        self.assertEqual(text.tokens('Ebola, jena/raw'), set(['ebola', 'jena', 'raw']))
+        self.assertEqual(text.grams('Abcd', 3), set(['abc', 'bcd']))
+
+    def test_index_matches_scan(self):
+        ts = util.store()
+        scans = [util.scan(ts, pattern) for pattern in self.patterns]
+        ts.index_text('toy.seq:description', ngram=3)
+        for pattern, expected in zip(self.patterns, scans):
+            self.assertEqual(ts.match_pattern(pattern), expected)
+
+    def test_index_follows_writes(self):
+        ts = util.store()
+        ts.index_text('toy.seq:description', ngram=3)
+        ts.assert_fact({'db:ident': 'seq-1', 'toy.seq:description': 'Ebola in Jena'})
+        ts.retract_fact(('seq-2', 'toy.seq:description', ts.pull(['*'], 'seq-2')['toy.seq:description']))
+        for pattern in self.patterns:
+            self.assertEqual(ts.match_pattern(pattern), util.scan(ts, pattern))
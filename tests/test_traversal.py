@@ -0,0 +1,87 @@
+import threading
+import time
+import unittest
+
+from tripl import tripl
+from tests import util
+
+
+class TraversalTest(unittest.TestCase):
+
+    def test_reachable(self):
+        ts = tripl.TripleStore(schema={'p:parent': {'db:valueType': 'db.type:ref'}},
+                               facts=[{'db:ident': 'c', 'p:parent': ['b']}, {'db:ident': 'b', 'p:parent': ['a']}])
+        self.assertEqual(list(ts.reachable('c', 'p:parent')), ['b', 'a'])
+        self.assertEqual(list(ts.reachable('c', 'p:parent', max_depth=1)), ['b'])
+        self.assertEqual(list(ts.reachable('a', 'p:_parent')), ['b', 'c'])
+        self.assertEqual(ts.shortest_path('c', 'a', 'p:parent'), ['c', 'b', 'a'])
+        self.assertIsNone(ts.shortest_path('a', 'c', 'p:parent'))
+
+    def test_closure_matches_traversal(self):
+        ts = util.store()
+        uncached = dict((e, (ts.ancestors(e, 'toy.seq:parent'), ts.descendants(e, 'toy.seq:parent')))
+                        for e in ts.match_pattern({'toy:type': 'toy.type:seq'}))
+        ts.cache_closure('toy.seq:parent')
+        for e, (ancestors, descendants) in uncached.items():
+            self.assertEqual(ts.ancestors(e, 'toy.seq:parent'), ancestors)
+            self.assertEqual(ts.descendants(e, 'toy.seq:parent'), descendants)
+
+    def test_closure_on_cycle(self):
+        ts = tripl.TripleStore(schema={'p:parent': {'db:valueType': 'db.type:ref'}},
+                               facts=[{'db:ident': 'a', 'p:parent': ['b']}, {'db:ident': 'b', 'p:parent': ['c']},
+                                      {'db:ident': 'c', 'p:parent': ['a']}])
+        uncached = dict((e, (ts.ancestors(e, 'p:parent'), ts.descendants(e, 'p:parent'))) for e in 'abc')
+        self.assertEqual(uncached['a'], (set(['b', 'c']), set(['b', 'c'])))
+        ts.cache_closure('p:parent')
+        for e, (ancestors, descendants) in uncached.items():
+            self.assertEqual(ts.ancestors(e, 'p:parent'), ancestors)
+            self.assertEqual(ts.descendants(e, 'p:parent'), descendants)
+
+    def test_closure_follows_writes(self):
+        ts = util.store()
+        ts.cache_closure('toy.seq:parent')
+        ts.assert_fact({'db:ident': 'seq-5', 'toy.seq:parent': 'seq-150'})
+        parents = ts.pull(['toy.seq:parent'], 'seq-100')['toy.seq:parent']
+        ts.retract_facts([('seq-100', 'toy.seq:parent', p) for p in parents])
+        seqs = ts.match_pattern({'toy:type': 'toy.type:seq'})
+        cached = dict((e, set(ts.ancestors(e, 'toy.seq:parent'))) for e in seqs)
+        ts.drop_closure('toy.seq:parent')
+        for e, ancestors in cached.items():
+            self.assertEqual(set(ts.ancestors(e, 'toy.seq:parent')), ancestors)
+
+    def test_while_writing(self):
+        # A ring through p:next (and p:link, which isn't typed as a ref), with more edges coming and going in place
+        n = 50
+        ts = tripl.TripleStore(schema={'p:next': {'db:valueType': 'db.type:ref'}}, thread_safe=True)
+        ts.assert_facts([{'db:ident': 'e%d' % i, 'p:next': ['e%d' % ((i + 1) % n)], 'p:link': ['e%d' % ((i + 1) % n)]}
+                         for i in range(n)])
+        everyone = set('e%d' % i for i in range(1, n))
+        stop = threading.Event()
+        errors = []
+
+        def writer():
+            k = 0
+            try:
+                while not stop.is_set():
+                    k += 1
+                    edges = [('e%d' % (k % n), attr, 'x%d' % i) for attr in ['p:next', 'p:link'] for i in range(200)]
+                    ts.assert_facts([{'db:ident': e, a: [v]} for e, a, v in edges])
+                    ts.retract_facts(edges)
+            except Exception as e:
+                errors.append(e)
+
+        interval = util.switch_often()
+        thread = threading.Thread(target=writer)
+        thread.start()
+        deadline = time.time() + 1.0
+        try:
+            while time.time() < deadline:
+                for attr in ['p:next', 'p:_next', 'p:link', 'p:_link']:
+                    self.assertTrue(everyone <= set(ts.reachable('e0', attr)))
+                self.assertTrue(everyone <= set(ts.reachable('e0', 'p:next', order='dfs')))
+        finally:
+            stop.set()
+            thread.join()
+            util.switch_often(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(ts._lock._readers, 0)
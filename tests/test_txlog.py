@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tripl import tripl
+
+
+class TxLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'graph.trip.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_replay(self):
+        ts = tripl.TripleStore.open(self.filename)
+        ts.assert_fact({'db:ident': 'a', 'p:n': 1})
+        ts.retract_fact(('a', 'p:n', 1))
+        ts.assert_fact({'db:ident': 'b', 'p:n': 2})
+        ts.close()
+        self.assertFalse(os.path.exists(self.filename))
+        ts = tripl.TripleStore.open(self.filename)
+        self.assertEqual(ts.match_pattern({'p:n': [1, 2]}), set(['b']))
+        ts.close()
+
+    def test_compact(self):
+        ts = tripl.TripleStore.open(self.filename, compact_every=3)
+        for i in range(5):
+            ts.assert_fact({'db:ident': 'e%d' % i, 'p:n': i})
+        ts.close()
+        self.assertTrue(os.path.exists(self.filename))
+        ts = tripl.TripleStore.open(self.filename)
+        self.assertEqual(ts.match_pattern({'p:n': 4}), set(['e4']))
+        ts.close()
+
+    def test_crash_mid_write(self):
+        ts = tripl.TripleStore.open(self.filename)
+        ts.assert_fact({'db:ident': 'a', 'p:n': 1})
+        ts.close()
+        # As if the process died part way through writing an entry
+        with open(self.filename + '.log', 'a') as fp:
+            fp.write('["+", "a", "p:n"')
+        ts = tripl.TripleStore.open(self.filename)
+        self.assertEqual(ts.match_pattern({'p:n': 1}), set(['a']))
+        ts.assert_fact({'db:ident': 'b', 'p:n': 2})
+        ts.close()
+        ts = tripl.TripleStore.open(self.filename)
+        self.assertEqual(ts.match_pattern({'p:n': [1, 2]}), set(['a', 'b']))
+        ts.close()
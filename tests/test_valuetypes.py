@@ -0,0 +1,68 @@
+import datetime
+import unittest
+
+from tripl import tripl, valuetypes
+from tests import util
+
+
+class CoercionTest(unittest.TestCase):
+
+    def test_coerce(self):
+        self.assertEqual(valuetypes.coerce(valuetypes.LONG, '42'), 42)
+        self.assertEqual(valuetypes.coerce(valuetypes.LONG, 3.0), 3)
+        self.assertRaises(ValueError, valuetypes.coerce, valuetypes.LONG, 3.5)
+        self.assertEqual(valuetypes.coerce(valuetypes.INSTANT, '1970-01-02'), 86400000)
+        self.assertEqual(valuetypes.coerce(valuetypes.INSTANT, '1970-01-01T01:00:00+01:00'), 0)
+        self.assertEqual(valuetypes.to_datetime(86400000), datetime.datetime(1970, 1, 2))
+
+    def test_asserted_values_are_coerced(self):
+        ts = tripl.TripleStore(schema={'p:n': {'db:valueType': 'db.type:long'}})
+        ts.assert_fact({'db:ident': 'a', 'p:n': '10'})
+        self.assertEqual(ts.match_pattern({'p:n': 10}), set(['a']))
+        self.assertEqual(ts.match_pattern({'p:n': '10'}), set(['a']))
+        self.assertRaises(ValueError, ts.assert_fact, {'db:ident': 'b', 'p:n': 'ten'})
+
+    def test_values_from_before_typing(self):
+        ts = tripl.TripleStore(facts=[{'db:ident': 'a', 'p:x': 'n/a', 'p:y': ['1.5', 'n/a']}])
+        ts.assert_schema({'p:x': {'db:valueType': 'db.type:double', 'db:cardinality': 'db.cardinality:one'},
+                          'p:y': {'db:valueType': 'db.type:double'}})
+        # Replaced and retracted as they were given, whether or not they'd coerce
+        ts.assert_fact({'db:ident': 'a', 'p:x': '2'})
+        ts.retract_facts([('a', 'p:y', 'n/a'), ('a', 'p:y', 1.5)])
+        self.assertEqual(ts.pull(['p:x', 'p:y'], 'a'), {'p:x': 2.0, 'p:y': set(['1.5'])})
+        ts.retract_fact(('a', 'p:y', '1.5'))
+        self.assertEqual(ts.pull(['p:y'], 'a'), {'p:y': set()})
+
+
+class ColumnTest(unittest.TestCase):
+
+    def test_ranges_match_scans(self):
+        ts = util.store()
+        for clause in [{'>': 50}, {'>=': 10, '<': 20}, {'<=': 0}, {'>': 20, '<': 10}]:
+            pattern = {'toy.seq:depth': clause}
+            self.assertEqual(ts.match_pattern(pattern), util.scan(ts, pattern))
+        self.assertIsNotNone(ts._column('toy.seq:depth', build=False))
+
+    def test_ranges_follow_writes(self):
+        ts = util.store()
+        pattern = {'toy.seq:depth': {'>': 50}}
+        ts.match_pattern(pattern)
+        column = ts._column('toy.seq:depth', build=False)
+        ts.assert_fact({'db:ident': 'seq-1', 'toy.seq:depth': 99.5})
+        ts.assert_fact({'db:ident': 'seq-new', 'toy.seq:depth': 75})
+        self.assertEqual(ts.match_pattern(pattern), util.scan(ts, pattern))
+        ts.retract_fact(('seq-3', 'toy.seq:depth', ts.pull(['*'], 'seq-3')['toy.seq:depth']))
+        self.assertEqual(ts.match_pattern(pattern), util.scan(ts, pattern))
+        # Kept sorted through the writes, not rebuilt
+        self.assertIs(ts._column('toy.seq:depth', build=False), column)
+        self.assertEqual(list(column.values), sorted(column.values))
+
+    def test_sort(self):
+        ts = util.store()
+        results = list(ts.pull_many(['toy.seq:depth'], {'toy:type': 'toy.type:seq'}, sort_by='toy.seq:depth'))
+        depths = [r['toy.seq:depth'] for r in results]
+        # sort_desc (the default) has always meant ascending
+        self.assertEqual(depths, sorted(depths))
+        results = ts.pull_many(['toy.seq:depth'], {'toy:type': 'toy.type:seq'},
+                               sort_by='toy.seq:depth', sort_desc=False)
+        self.assertEqual([r['toy.seq:depth'] for r in results], sorted(depths, reverse=True))
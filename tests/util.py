@@ -0,0 +1,66 @@
+"Fixtures shared between the tests."
+
+import json
+import random
+import sys
+
+from tripl import tripl
+
+
+schema = {'toy.seq:sample': {'db:valueType': 'db.type:ref', 'db:cardinality': 'db.cardinality:one'},
+          'toy.seq:depth': {'db:valueType': 'db.type:double', 'db:cardinality': 'db.cardinality:one'},
+          'toy.seq:parent': {'db:valueType': 'db.type:ref'},
+          'toy.seq:description': {'db:cardinality': 'db.cardinality:one'}}
+
+_words = ['ebola', 'jena', 'zika', 'raw', 'trimmed', 'seed', 'plasma']
+
+
+def facts(n_samples=20, n_seqs=200, seed=0):
+    "Samples, and seqs referring to them (and to parent seqs, making a forest), with typed and text values."
+    rand = random.Random(seed)
+    result = [{'db:ident': 'sample-%d' % i, 'toy:type': 'toy.type:sample', 'toy.sample:geo': rand.choice('abc')}
+              for i in range(n_samples)]
+    for i in range(n_seqs):
+        seq = {'db:ident': 'seq-%d' % i, 'toy:type': 'toy.type:seq',
+               'toy.seq:sample': 'sample-%d' % rand.randrange(n_samples),
+               'toy.seq:depth': round(rand.random() * 100, 3),
+               'toy.seq:description': ' '.join(rand.sample(_words, 3)),
+               'toy.seq:tags': rand.sample(['x', 'y', 'z'], rand.randrange(3))}
+        if i:
+            seq['toy.seq:parent'] = 'seq-%d' % rand.randrange(i)
+        result.append(seq)
+    return result
+
+
+def store(**kwargs):
+    return tripl.TripleStore(schema=schema, facts=facts(), **kwargs)
+
+
+def normalized(x):
+    "A pull result with lists (whose order follows set iteration) sorted, for comparing results across stores."
+    if isinstance(x, dict):
+        return dict((k, normalized(v)) for k, v in x.items())
+    if isinstance(x, list):
+        # By their json rather than repr, which differs between str and unicode on python 2
+        return sorted((normalized(v) for v in x), key=lambda v: json.dumps(v, sort_keys=True, default=sorted))
+    return x
+
+
+def by_ident(results):
+    return dict((min(r['db:ident']), normalized(r)) for r in results)
+
+
+def scan(graph, pattern):
+    "match_pattern's answer, by brute force."
+    pattern = graph._coerce_pattern(pattern)
+    return set(e for e, entry in graph._eav_index.items() if graph._entity_match(entry, pattern))
+
+
+def switch_often(interval=1e-6):
+    "Have threads switch more often than usual (on python 3), to give races a chance to show; returns the old interval."
+    if not hasattr(sys, 'setswitchinterval'):
+        return None
+    old = sys.getswitchinterval()
+    if interval is not None:
+        sys.setswitchinterval(interval)
+    return old
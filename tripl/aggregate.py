@@ -0,0 +1,139 @@
+"""
+Aggregates over entities, computed straight off the indexes (see TripleStore.aggregate), rather than by pulling every
+entity and counting in python:
+
+    for geo, row in ts.aggregate({'seqs': 'count', 'samples': ('count_distinct', 'toy.seq:sample')},
+                                 pattern={'toy:type': 'toy.type:seq'}, group_by='toy.seq:geo'):
+        ...  # 'jena', {'seqs': 120, 'samples': 31}
+
+Each aggregate is a function name, or a (function, attr) pair:
+
+* count: entities (with a value for attr, if given)
+* count_distinct: distinct values of attr
+* min, max, sum: over every value of attr (many valued attributes included), missing values ignored
+
+With group_by, results are generated a group at a time, in order of group value, each entity counting towards a
+group for each of its group_by values (entities with none don't count towards any). Where there's no pattern,
+aggregates are answered from the store's attribute stats (see tripl.stats) where they can be, which for counts
+grouped by an attribute means not visiting a single entity (so long as it hasn't too many distinct values for the
+stats to count).
+"""
+
+from . import stats
+from .index import get_values
+
+
+_functions = ('count', 'count_distinct', 'min', 'max', 'sum')
+
+_no_attrs = {}
+
+
+def _specs(aggregates):
+    "aggregates as {name: (function, attr)}, validated."
+    specs = {}
+    for name, spec in aggregates.items():
+        fn, attr = (spec, None) if not isinstance(spec, (tuple, list)) else tuple(spec) + (None,) * (2 - len(spec))
+        if fn not in _functions:
+            raise ValueError("Aggregate %r: function must be one of %s" % (name, ', '.join(_functions)))
+        if attr is None and fn != 'count':
+            raise ValueError("Aggregate %r: %s needs an attribute" % (name, fn))
+        specs[name] = (fn, attr)
+    return specs
+
+
+def _compute(entries, specs):
+    "The aggregates for a list of entity index entries."
+    row = {}
+    for name, (fn, attr) in specs.items():
+        if fn == 'count':
+            row[name] = len(entries) if attr is None else sum(1 for entry in entries if get_values(entry, attr))
+            continue
+        values = (v for entry in entries for v in get_values(entry, attr) if v is not None)
+        if fn == 'count_distinct':
+            row[name] = len(set(values))
+        elif fn == 'sum':
+            row[name] = sum(values)
+        else:
+            row[name] = _extreme(fn, values)
+    return row
+
+
+def _extreme(fn, values):
+    # min/max, or None if there are no values
+    result = None
+    for v in values:
+        if result is None or (v < result if fn == 'min' else v > result):
+            result = v
+    return result
+
+
+def _from_stats(graph, specs):
+    "The aggregates over the whole store from attribute stats, or None if any of them can't be."
+    row = {}
+    for name, (fn, attr) in specs.items():
+        if attr is None:
+            return None
+        attr_stats = graph._attr_stats().get(attr) or stats.AttrStats()
+        values = attr_stats.values
+        if fn == 'count':
+            row[name] = attr_stats.entities
+        elif values is None:
+            # Too many distinct values for the stats to have kept
+            return None
+        elif fn == 'count_distinct':
+            row[name] = len(values)
+        elif fn == 'sum':
+            # value -> entities with it; each (entity, value) is one triple
+            row[name] = sum(v * n for v, n in values.items() if v is not None)
+        else:
+            row[name] = _extreme(fn, (v for v in values if v is not None))
+    return row
+
+
+def aggregate(graph, aggregates, pattern=None, group_by=None):
+    "See TripleStore.aggregate; aggregates are validated up front, even when the results are generated lazily."
+    specs = _specs(aggregates)
+    if group_by is None:
+        if not pattern:
+            row = _from_stats(graph, specs)
+            if row is not None:
+                return row
+        eids = graph.match_pattern(pattern) if pattern else graph._eav_index.keys()
+        return _compute([graph._eav_index.get(e, _no_attrs) for e in eids], specs)
+    return _groups(graph, specs, pattern, group_by)
+
+
+def _groups(graph, specs, pattern, group_by):
+    from .tripl import _order_key
+    index = graph._eav_index
+    if not pattern and all(fn == 'count' and attr is None for fn, attr in specs.values()):
+        # Entities per value is exactly what the stats count
+        attr_stats = graph._attr_stats().get(group_by)
+        counts = attr_stats.values if attr_stats else {}
+        if counts is not None:
+            for v in sorted(counts, key=_order_key):
+                yield v, dict((name, counts[v]) for name in specs)
+            return
+    eids = graph.match_pattern(pattern) if pattern else None
+    column = graph._column(group_by)
+    if column is not None:
+        # Already in value order; each run of equal values is a group
+        run, run_value = [], None
+        for v, e in zip(column.values, column.eids):
+            if eids is not None and e not in eids:
+                continue
+            if run and v != run_value:
+                yield run_value, _compute(run, specs)
+                run = []
+            run_value = v
+            run.append(index.get(e, _no_attrs))
+        if run:
+            yield run_value, _compute(run, specs)
+        return
+    groups = {}
+    for e in (index.keys() if eids is None else eids):
+        for v in get_values(index.get(e, _no_attrs), group_by):
+            groups.setdefault(v, []).append(e)
+    for v in sorted(groups, key=_order_key):
+        # Entries are only looked up (which for storage backends may mean loading them) as each group comes up
+        yield v, _compute([index.get(e, _no_attrs) for e in groups.pop(v)], specs)
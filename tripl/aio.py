@@ -0,0 +1,122 @@
+"""
+asyncio friendly querying of a TripleStore (python 3 only), for embedding in services.
+
+Long pull_many / match_pattern calls are broken into chunks of entities, and control goes back to the event loop
+between chunks, so small queries stay responsive while big exports run. Patterns are matched from the store's
+indexes where match_pattern would be (columns, text indexes, a storage backend's match), just checking the
+candidates chunk by chunk, and otherwise by scanning. Queries run against a snapshot taken when
+they start, so writes made from the loop meanwhile neither block nor disturb them. Cancelling the calling task stops
+the query at the next chunk boundary.
+
+    ats = AsyncTripleStore(ts)
+    eids = await ats.match_pattern({'cft:type': 'cft.type:seq'})
+    async for seq in ats.pull_many(['*'], eids):
+        await response.write(json.dumps(seq, default=list))
+
+With executor set, chunks are evaluated there instead of on the loop thread; this requires a thread_safe store,
+since the loop may write to it while a chunk is being read.
+"""
+
+import asyncio
+import itertools
+import contextlib
+
+from . import tripl
+
+
+def _chunks(xs, n):
+    xs = iter(xs)
+    while True:
+        chunk = list(itertools.islice(xs, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _reading(view):
+    # Only matters when chunks run off the loop thread, which requires a lock
+    return view._lock.reading() if view._lock is not None else contextlib.ExitStack()
+
+
+def _all_eids(view):
+    with _reading(view):
+        return list(view._eav_index.keys())
+
+
+def _index_candidates(view, pattern):
+    with _reading(view):
+        return view._index_candidates(pattern)
+
+
+def _match_chunk(view, eids, pattern):
+    with _reading(view):
+        return [eid for eid in eids
+                if view._entity_match(view._eav_index.get(eid, tripl._no_attrs), pattern)]
+
+
+def _pull_chunk(view, pull_expr, eids):
+    return [view.pull(pull_expr, eid) for eid in eids]
+
+
+class AsyncTripleStore(object):
+    "Wraps a TripleStore with coroutine versions of its query API; see the module docs."
+
+    def __init__(self, graph, chunk_size=256, executor=None):
+        if executor is not None and graph._lock is None:
+            raise ValueError("Running queries in an executor requires a TripleStore with thread_safe=True")
+        self.graph = graph
+        self.chunk_size = chunk_size
+        self.executor = executor
+
+    async def _run(self, f, *args):
+        if self.executor is not None:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, f, *args)
+        result = f(*args)
+        # Let everyone else have a turn (and let cancellation in)
+        await asyncio.sleep(0)
+        return result
+
+    async def match_pattern(self, pattern):
+        "As TripleStore.match_pattern, checking (or scanning) chunk_size entities at a time."
+        return await self._match(self.graph.snapshot(), pattern)
+
+    async def _match(self, view, pattern):
+        pattern = view._coerce_pattern(pattern)
+        found = await self._run(_index_candidates, view, pattern)
+        if found is not None:
+            _, eids, pattern = found
+            if not pattern:
+                return set(eids)
+            eids = list(eids)
+        else:
+            eids = await self._run(_all_eids, view)
+        matches = set()
+        for chunk in _chunks(eids, self.chunk_size):
+            matches.update(await self._run(_match_chunk, view, chunk, pattern))
+        return matches
+
+    async def pull(self, pull_expr, entity):
+        "As TripleStore.pull."
+        view = self.graph.snapshot()
+        if isinstance(entity, dict):
+            entity = tripl.some(await self._match(view, entity))
+        return await self._run(view.pull, pull_expr, entity)
+
+    async def pull_many(self, pull_expr, eids_or_pattern, sort_by=None, sort_desc=True):
+        """As TripleStore.pull_many, but as an async iterator, streaming results a chunk at a time. Sorting (sort_by)
+        necessarily pulls everything before the first result comes out."""
+        view = self.graph.snapshot()
+        if isinstance(eids_or_pattern, dict):
+            eids = await self._match(view, eids_or_pattern)
+        else:
+            eids = eids_or_pattern
+        if sort_by:
+            results = []
+            for chunk in _chunks(eids, self.chunk_size):
+                results.extend(await self._run(_pull_chunk, view, pull_expr, chunk))
+            for result in view._sort_results(results, sort_by, sort_desc):
+                yield result
+        else:
+            for chunk in _chunks(eids, self.chunk_size):
+                for result in await self._run(_pull_chunk, view, pull_expr, chunk):
+                    yield result
@@ -1,4 +1,5 @@
 import csv
+import json
 
 
 def _traverse(obj, callback=None):
@@ -85,7 +86,8 @@ def load_csv(fp, attr_map, ns):
     This map serves to map e.g. column headers of a table (CSV format) into
     tripl semantics like "namespace.entity:attribute" as well as adding the
     corresponding tripl type. This might seem cumbersome but note that the CSV
-    header is ambiguous about the data model.
+    header is ambiguous about the data model. Cells come in as strings; type
+    attributes in the schema (see tripl.valuetypes) to have them converted.
 
     Example:
 
@@ -135,3 +137,177 @@ def load_csv(fp, attr_map, ns):
         reader = csv.DictReader(file)
         for row in reader:
             yield _traverse_modify(data=row, obj=attr_map, ns=ns)
+
+
+# And back out again: the inverse of load_csv
+
+def _attr(attr, ns):
+    return ns + '.' + attr if ns else attr
+
+
+def attr_map_pull_expr(attr_map, ns=None):
+    '''The pull expression which pulls everything an attr_map (as for load_csv)
+    has columns for.'''
+    pull_expr, refs = [], {}
+    for attr, target in attr_map.items():
+        if isinstance(target, list):
+            sub_expr = []
+            for sub_map in target:
+                sub_expr.extend(x for x in attr_map_pull_expr(sub_map, ns) if x not in sub_expr)
+            refs[_attr(attr, ns)] = sub_expr
+        else:
+            pull_expr.append(_attr(attr, ns))
+    if refs:
+        pull_expr.append(refs)
+    return pull_expr
+
+
+def attr_map_columns(attr_map):
+    '''The column names in an attr_map, in order.'''
+    columns = []
+    for target in attr_map.values():
+        if isinstance(target, list):
+            for sub_map in target:
+                columns.extend(c for c in attr_map_columns(sub_map) if c not in columns)
+        elif target not in columns:
+            columns.append(target)
+    return columns
+
+
+def _sorted(values):
+    from .tripl import _order_key
+    return sorted(values, key=_order_key)
+
+
+def _join(cells, sep):
+    # One cell for several values
+    cells = [c for c in cells if c is not None]
+    if not cells:
+        return None
+    if len(cells) == 1:
+        return cells[0]
+    return sep.join(str(c) for c in cells)
+
+
+def _product(rows, options):
+    return [dict(row, **option) if option else row for row in rows for option in options]
+
+
+def flatten(result, attr_map, ns=None, many='explode', sep=';'):
+    '''Turn a pull result (as pulled by attr_map_pull_expr) into rows: dicts
+    of column name to cell, per attr_map. Many valued attributes, and refs to
+    several entities, either explode (a row per value, crossed with every
+    other many valued attribute's) or join (one cell, with values separated
+    by sep). A list of several maps for a ref attribute (as in load_csv's
+    seq:date example) is filled from the refs in order of value, one each,
+    with any left over going to the last.'''
+    rows = [{}]
+    for attr, target in attr_map.items():
+        value = result.get(_attr(attr, ns))
+        if isinstance(target, list):
+            refs = _sorted_refs(value)
+            slots = [refs[i:i + 1] for i in range(len(target) - 1)] + [refs[len(target) - 1:]]
+            for sub_map, sub_refs in zip(target, slots):
+                options = [row for ref in sub_refs for row in flatten(ref, sub_map, ns, many, sep)]
+                if many == 'join' and len(options) > 1:
+                    options = [dict((column, _join([option.get(column) for option in options], sep))
+                                    for column in attr_map_columns(sub_map))]
+                rows = _product(rows, options or [{}])
+        else:
+            values = _sorted(value) if isinstance(value, (set, list, tuple, frozenset)) else [value]
+            if many == 'join' or len(values) < 2:
+                options = [_join(values, sep)]
+            else:
+                options = values
+            rows = [dict(row, **{target: v}) for row in rows for v in options]
+    return rows
+
+
+def _sorted_refs(value):
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        return [value]
+    # By value, so repeat exports come out the same
+    return sorted(value, key=lambda ref: json.dumps(ref, sort_keys=True, default=_sorted))
+
+
+def pull_rows(graph, attr_map, eids_or_pattern, ns=None, pull_expr=None, many='explode', sep=';', sort_by=None,
+              sort_desc=True):
+    '''Generate rows (see flatten) for the entities of graph matching a
+    pattern, or in a list of eids, a pull result at a time, so memory doesn't
+    grow with the size of the export. pull_expr defaults to everything
+    attr_map needs.'''
+    if many not in ('explode', 'join'):
+        raise ValueError("many must be 'explode' or 'join'")
+    pull_expr = pull_expr or attr_map_pull_expr(attr_map, ns)
+    for result in graph.pull_many(pull_expr, eids_or_pattern, sort_by=sort_by, sort_desc=sort_desc):
+        for row in flatten(result, attr_map, ns, many, sep):
+            yield row
+
+
+def write_csv(fp, graph, attr_map, eids_or_pattern, ns=None, delimiter=',', **kwargs):
+    '''The inverse of load_csv: write the entities of graph matching a
+    pattern (or in a list of eids) to fp (a file name or file like object) as
+    CSV, one column per column name in attr_map, streaming rows out as they're
+    pulled. Use delimiter='\\t' for TSV; other options are as for pull_rows.
+
+    Example (with attr_map and namespace as for load_csv):
+
+    write_csv('toy.out.csv', ts, attr_map, {'toy:type': 'toy.type:seq'},
+              ns=namespace, many='join')
+    '''
+    if not hasattr(fp, 'write'):
+        with open(fp, 'w') as file:
+            return write_csv(file, graph, attr_map, eids_or_pattern, ns=ns, delimiter=delimiter, **kwargs)
+    writer = csv.DictWriter(fp, attr_map_columns(attr_map), delimiter=delimiter, extrasaction='ignore')
+    writer.writeheader()
+    for row in pull_rows(graph, attr_map, eids_or_pattern, ns=ns, **kwargs):
+        writer.writerow(row)
+
+
+def arrow_batches(graph, attr_map, eids_or_pattern, ns=None, batch_size=10000, **kwargs):
+    '''Generate pyarrow RecordBatches of up to batch_size rows (see
+    pull_rows). Requires pyarrow.'''
+    pyarrow = _pyarrow()
+    columns = attr_map_columns(attr_map)
+    rows = []
+    for row in pull_rows(graph, attr_map, eids_or_pattern, ns=ns, **kwargs):
+        rows.append(row)
+        if len(rows) == batch_size:
+            yield pyarrow.RecordBatch.from_pydict(dict((c, [r.get(c) for r in rows]) for c in columns))
+            rows = []
+    if rows:
+        yield pyarrow.RecordBatch.from_pydict(dict((c, [r.get(c) for r in rows]) for c in columns))
+
+
+def write_parquet(filename, graph, attr_map, eids_or_pattern, ns=None, batch_size=10000, **kwargs):
+    '''As write_csv, but to a Parquet file, a batch_size row group at a time.
+    Column types are taken from the first batch (columns with nothing in it are
+    written as strings). Requires pyarrow.'''
+    pyarrow = _pyarrow()
+    import pyarrow.parquet
+    writer = None
+    try:
+        for batch in arrow_batches(graph, attr_map, eids_or_pattern, ns=ns, batch_size=batch_size, **kwargs):
+            table = pyarrow.Table.from_batches([batch])
+            if writer is None:
+                schema = pyarrow.schema([pyarrow.field(f.name, pyarrow.string()) if pyarrow.types.is_null(f.type)
+                                         else f for f in table.schema])
+                writer = pyarrow.parquet.ParquetWriter(filename, schema)
+            writer.write_table(table.cast(schema))
+        if writer is None:
+            # Nothing matched; still write the columns
+            schema = pyarrow.schema([pyarrow.field(c, pyarrow.string()) for c in attr_map_columns(attr_map)])
+            writer = pyarrow.parquet.ParquetWriter(filename, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Arrow and Parquet export require pyarrow (pip install pyarrow)")
+    return pyarrow
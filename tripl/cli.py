@@ -1,30 +1,151 @@
 #!/usr/bin/env python
+"""
+The trip command line tool. Reads and writes trip dumps (see tripl.stream), using `-` (the default) for
+stdin/stdout, so commands compose in Unix pipelines:
 
+    trip merge a.trip.json b.trip.json -o out.trip.json
+    trip diff yesterday.trip.json today.trip.json > changes.log
+    trip pull -e '["*"]' -p '{"cft:type": "cft.type:seq"}' < graph.trip.json > seqs.jsonl
+
+merge and diff stream through their inputs in a single pass with bounded memory, as does pull for pull expressions
+which don't follow refs (for those, the input is loaded into a TripleStore).
+"""
+
+from __future__ import print_function
 import argparse
-#from tripy import trip
+import contextlib
+import json
+import sys
+
+from . import stream
+from . import tripl
+
+
+@contextlib.contextmanager
+def _open(filename, mode='r'):
+    if filename in (None, '-'):
+        yield sys.stdout if 'w' in mode else sys.stdin
+    else:
+        with open(filename, mode) as fp:
+            yield fp
+
+
+def _shorthand(argv):
+    # Whether argv is the merge shorthand (`trip -i a.trip.json b.trip.json -o out.trip.json`)
+    return any(arg in ('-i', '--input') or arg.startswith('--input=') for arg in argv)
+
+
+def get_args(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # -o goes before or after the command; suppressed as a default, so a subcommand doesn't clobber one given before it
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('-o', '--output', default=argparse.SUPPRESS, help="output file (default stdout)")
+    inputs = argparse.ArgumentParser(add_help=False)
+    inputs.add_argument('-i', '--input', nargs='+', help="input files to merge (as with the merge command)")
+
+    if _shorthand(argv):
+        # Parsed without the subcommands, which python 2's argparse won't let go missing
+        parser = argparse.ArgumentParser(prog='trip', parents=[output, inputs])
+        args = parser.parse_args(argv)
+        args.command = 'merge'
+        args.inputs = args.input
+        if not hasattr(args, 'output'):
+            args.output = '-'
+        return args
+
+    parser = argparse.ArgumentParser(prog='trip', description="Tools for working with trip data.",
+                                     parents=[output, inputs])
+    subparsers = parser.add_subparsers(dest='command')
+
+    merge = subparsers.add_parser('merge', help="merge trip dumps into one", parents=[output])
+    merge.add_argument('inputs', nargs='*', default=['-'], help="trip dumps (default stdin)")
+
+    diff = subparsers.add_parser('diff', help="changes from one trip dump to another, as a transaction log",
+                                 parents=[output])
+    diff.add_argument('old', help="trip dump to diff from")
+    diff.add_argument('new', help="trip dump to diff to")
 
+    pull = subparsers.add_parser('pull', help="pull query, writing one JSON result per line", parents=[output])
+    pull.add_argument('input', nargs='?', default='-', help="trip dump (default stdin)")
+    pull.add_argument('-e', '--expr', required=True, type=json.loads, help="pull expression, as JSON")
+    pull.add_argument('-p', '--pattern', type=json.loads, help="entity pattern to match, as JSON")
 
-def get_args():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-i', '--input')
-    parser.add_argument('-o', '--output')
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    if not hasattr(args, 'output'):
+        args.output = '-'
+    if not args.command:
+        parser.error("a command (or -i inputs to merge) is required")
+    return args
+
+
+def merge(args):
+    inputs = [sys.stdin if filename == '-' else open(filename) for filename in args.inputs]
+    try:
+        with _open(args.output, 'w') as out:
+            stream.write_entities(stream.merge_entities([stream.read_entities(fp) for fp in inputs]), out)
+    finally:
+        for fp in inputs:
+            if fp is not sys.stdin:
+                fp.close()
+
+
+def diff(args):
+    with _open(args.old) as old, _open(args.new) as new, _open(args.output, 'w') as out:
+        stream.write_changes(stream.diff_entities(stream.read_entities(old), stream.read_entities(new)), out)
+
+
+def _follows_refs(pull_expr):
+    return any(isinstance(x, dict) or tripl.reverse_lookup(x) for x in pull_expr if x != '*')
+
+
+def _stream_pull(entities, pull_expr, pattern=None):
+    """Pull from a stream of entities one at a time, holding only the schema (which comes first) in memory. Only
+    good for pull expressions which don't follow refs."""
+    graph = tripl.TripleStore()
+    for eid, attrs in entities:
+        schema = stream.schema_entity(attrs)
+        if schema:
+            graph.assert_facts({eid: attrs})
+            if eid == 'db:schema' and attrs.get('db.cardinality:default'):
+                graph.default_cardinality = attrs['db.cardinality:default'][0]
+        entity = dict((a, set(vs)) for a, vs in attrs.items())
+        if pattern and not graph._entity_match(entity, pattern):
+            continue
+        if schema:
+            yield graph.pull(pull_expr, eid)
+        else:
+            # Just long enough to pull it
+            graph._eav_index[eid] = entity
+            try:
+                yield graph.pull(pull_expr, eid)
+            finally:
+                del graph._eav_index[eid]
+
+
+def pull(args):
+    with _open(args.input) as fp, _open(args.output, 'w') as out:
+        entities = stream.read_entities(fp)
+        if _follows_refs(args.expr):
+            graph = tripl.TripleStore(facts=dict(entities))
+            eids = graph.match_pattern(args.pattern) if args.pattern else [eid for eid, _ in graph._eav_index.items()]
+            results = graph.pull_many(args.expr, eids)
+        else:
+            results = _stream_pull(entities, args.expr, args.pattern)
+        for result in results:
+            out.write(json.dumps(result, default=list) + '\n')
+
+
+_commands = {'merge': merge, 'diff': diff, 'pull': pull}
 
-# planned subcommand structure:
-# trip
-#   merge
-#   diff
-#   pull
 
 def _main(args):
-    print "Greetings, human"
+    return _commands[args.command](args)
 
 
-def main():
-    args = get_args()
+def main(argv=None):
+    args = get_args(argv)
     return _main(args)
 
 
 if __name__ == '__main__':
     main()
-
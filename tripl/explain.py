@@ -0,0 +1,181 @@
+"""
+Query plans for TripleStore.explain: how a match_pattern / pull_many was answered, step by step.
+
+    print(ts.explain({'cft:type': 'cft.type:seq'}, ['cft.seq:id', {'cft.seq:_timepoint': ['*'], 'cft.seq:subject': ['*']}]))
+
+    step        what                                      index                    estimated      actual    seconds
+    match       {"cft:type": "cft.type:seq"}              eav scan                      3011        3011   0.004100
+    pull ref    cft.seq:_timepoint                        full scan (lazy refs)         6022        6022   1.203112
+    pull ref    cft.seq:subject                           eav                           3011        3011   0.000412
+    pull_many   3011 entities                             -                             3011        3011   1.210451
+
+The query is actually run (against a snapshot, which shares the store's text indexes and closures while explain
+holds its read lock), so actual counts and timings are real, and clauses use the indexes they would live. Pull ref
+steps are aggregated over every entity pulled, and time just the lookups, not the pulls of the entities found. A
+`full scan` against a ref step means a reverse lookup couldn't use the vae index, typically because the attribute
+isn't typed `db.type:ref` in the schema.
+"""
+
+import collections
+import json
+
+from .metrics import _clock
+from . import stats
+from . import valuetypes
+from .index import get_values
+
+
+class Plan(object):
+    "The steps of an explained query, each a dict with step, what, index, estimated, actual and seconds keys."
+
+    def __init__(self):
+        self.steps = []
+        # Ref steps during pulls, aggregated by attribute
+        self._ref_steps = collections.OrderedDict()
+        # The index match_pattern last answered from (set by it)
+        self._match_index = None
+
+    def add(self, step, what, index=None, estimated=None, actual=None, seconds=None):
+        self.steps.append({'step': step, 'what': what, 'index': index, 'estimated': estimated,
+                           'actual': actual, 'seconds': seconds})
+
+    def _ref_step(self, attr, index, n, seconds):
+        # Called from pull for each ref (or reverse ref) followed
+        step = self._ref_steps.get((attr, index))
+        if step is None:
+            step = self._ref_steps[(attr, index)] = {'step': 'pull ref', 'what': attr, 'index': index,
+                                                     'estimated': None, 'actual': 0, 'seconds': 0.0, 'calls': 0}
+            self.steps.append(step)
+        step['actual'] += n
+        step['seconds'] += seconds
+        step['calls'] += 1
+
+    @property
+    def scans(self):
+        "The steps which fell back to scanning every entity."
+        return [step for step in self.steps if 'scan' in (step['index'] or '')]
+
+    def __str__(self):
+        def cell(x, fmt='%s'):
+            return '-' if x is None else fmt % x
+        lines = ['%-10s  %-40s  %-22s  %10s  %10s  %9s' % ('step', 'what', 'index', 'estimated', 'actual',
+                                                           'seconds')]
+        for step in self.steps:
+            lines.append('%-10s  %-40s  %-22s  %10s  %10s  %9s' % (
+                step['step'], step['what'][:40], cell(step['index']), cell(step['estimated']),
+                cell(step['actual']), cell(step['seconds'], '%.6f')))
+        return '\n'.join(lines)
+
+
+def _clause_matches(entity, attr, value):
+    values = get_values(entity, attr)
+    if isinstance(value, dict):
+        return any(valuetypes.compares(v, value) for v in values)
+    return any(v in values for v in (value if isinstance(value, (list, set)) else [value]))
+
+
+def estimate_clause(graph, attr, value):
+    """Estimated candidates for a single match clause, from the store's attribute stats; or for storage backends
+    which can say without reading every entry (partitioned dumps, for type and ident clauses), from the storage."""
+    estimate = getattr(graph._storage, 'estimate', None)
+    if estimate is not None and not isinstance(value, dict):
+        n = estimate({attr: value})
+        if n is not None:
+            return n
+    attr_stats = graph._attr_stats().get(attr)
+    if isinstance(value, dict):
+        if attr_stats is not None and attr_stats.values is None:
+            # Without value counts, the column (if there is one) knows, otherwise anything might match
+            column = graph._column(attr, build=False) if valuetypes.has_bounds(value) else None
+            return len(column.range(value)) if column is not None else attr_stats.entities
+        # The distinct values within the bounds
+        values = [v for v in attr_stats.values if valuetypes.compares(v, value)] if attr_stats else []
+    else:
+        values = value if isinstance(value, (list, set)) else [value]
+    return stats.estimate(attr_stats, values)
+
+
+def estimate_pattern(graph, pattern, n_entities):
+    "Estimated matches for a whole pattern, from the clauses' estimates, taking them to be independent."
+    if not n_entities:
+        return 0
+    estimated = float(n_entities)
+    for attr, value in pattern.items():
+        estimated *= float(estimate_clause(graph, attr, value)) / n_entities
+    return int(round(estimated))
+
+
+def estimate_ref(graph, attr, calls):
+    "Estimated entities found following attr (forward or reverse) from calls entities, from the attribute stats."
+    from .tripl import reverse_lookup
+    reverse = reverse_lookup(attr)
+    attr_stats = graph._attr_stats().get(reverse or attr)
+    if not attr_stats or not attr_stats.triples:
+        return 0
+    # Values per entity going forward; entities per value in reverse
+    per = float(attr_stats.triples) / (attr_stats.n_values() if reverse else attr_stats.entities)
+    return int(round(calls * per))
+
+
+def explain(graph, eids_or_pattern, pull_expr=None):
+    "See TripleStore.explain."
+    lock = graph._lock
+    if lock is not None:
+        # Held throughout, so the live store's closures stay in step with the snapshot
+        lock.acquire_read()
+    try:
+        view = graph.snapshot()
+        # Snapshots otherwise traverse, which isn't how the live store would answer
+        view._closures = dict(graph._closures)
+        return _explain(graph, view, eids_or_pattern, pull_expr)
+    finally:
+        if lock is not None:
+            lock.release_read()
+
+
+def _explain(graph, view, eids_or_pattern, pull_expr):
+    plan = Plan()
+    if isinstance(eids_or_pattern, dict):
+        pattern = view._coerce_pattern(eids_or_pattern)
+        # Only read in full if a clause scans (for storage backends, entries are loaded as they're read)
+        entities = None
+        match = getattr(view._eav_index, 'match', None)
+        for attr, value in pattern.items():
+            start = _clock()
+            found = view._clause_eids(attr, value) if isinstance(value, dict) else None
+            if found is not None:
+                index, eids, exact = found
+                actual = len(eids) if exact else sum(1 for e in eids
+                                                     if _clause_matches(view._eav_index.get(e, {}), attr, value))
+            elif match is not None and not isinstance(value, dict):
+                index = 'storage match'
+                actual = len(match({attr: value}))
+            else:
+                index = 'eav scan'
+                if entities is None:
+                    entities = list(view._eav_index.items())
+                actual = sum(1 for _, entity in entities if _clause_matches(entity, attr, value))
+            plan.add('match', json.dumps({attr: value}, default=list), index,
+                     estimate_clause(graph, attr, value), actual, _clock() - start)
+    view._plan = plan
+    try:
+        if isinstance(eids_or_pattern, dict):
+            start = _clock()
+            eids = view.match_pattern(pattern)
+            if len(pattern) != 1:
+                seconds = _clock() - start
+                n_entities = len(entities) if entities is not None else view._eav_index.count()
+                plan.add('match', '(all clauses)', plan._match_index, estimate_pattern(graph, pattern, n_entities),
+                         len(eids), seconds)
+        else:
+            eids = list(eids_or_pattern)
+        if pull_expr is not None:
+            start = _clock()
+            n = sum(1 for _ in view.pull_many(pull_expr, eids))
+            plan.add('pull_many', '%d entities' % len(eids), None, len(eids), n, _clock() - start)
+    finally:
+        view._plan = None
+    if pull_expr is not None:
+        for step in plan._ref_steps.values():
+            step['estimated'] = estimate_ref(graph, step['what'], step['calls'])
+    return plan
@@ -0,0 +1,185 @@
+"""
+Change feeds for TripleStore (see TripleStore.subscribe): listeners called with the triples each write added and
+retracted, so caches and derived tables can keep up without re-running queries.
+
+    def on_change(added, retracted):
+        ...
+    sub = ts.subscribe(on_change, attrs=['cft.seq:timepoint'])
+    sub = ts.subscribe(on_change, pattern={'cft:type': 'cft.type:seq'})
+    ts.unsubscribe(sub)
+
+Changes are collected as triples are asserted and retracted, and dispatched once per public write call (so one
+assert_facts is one batch), net of anything asserted and retracted again within it. Subscriptions are indexed (by
+attribute, or by the values of one of their pattern's clauses), so dispatch only visits the ones a change could
+concern, however many there are. Pattern subscriptions with nothing but comparison (or text) clauses are indexed by
+the attribute of one of them, so are visited for any change to an entity with a value for it.
+"""
+
+import collections
+
+from . import txlog
+from . import valuetypes
+from .index import get_values
+
+
+class Subscription(object):
+    """A listener, called as listener(added, retracted) with lists of (e, a, v) triples:
+
+    * attrs: only triples of these attributes
+    * pattern: only triples of entities matching pattern (as for match_pattern) before or after the write, so
+      listeners also hear about entities which stop matching
+    * neither: every change"""
+
+    __slots__ = ('listener', 'attrs', 'pattern', '_key')
+
+    def __init__(self, listener, attrs=None, pattern=None):
+        self.listener = listener
+        self.attrs = frozenset(attrs) if attrs is not None else None
+        self.pattern = dict((a, _clause(v)) for a, v in pattern.items()) if pattern else None
+        # The pattern clause this is indexed under; one with values if there are any
+        self._key = min(self.pattern, key=lambda a: (isinstance(self.pattern[a], dict), a)) if self.pattern else None
+
+    def _index_keys(self):
+        # The (attr, value) keys of ChangeFeed._by_clause this is indexed under
+        clause = self.pattern[self._key]
+        if isinstance(clause, dict):
+            return [(self._key, _any_value)]
+        return [(self._key, v) for v in clause]
+
+
+# Stands in for the value in the _by_clause keys of subscriptions keyed on a comparison clause
+_any_value = object()
+
+
+def _clause(v):
+    # Comparisons as they are (validated); values as a frozenset
+    if valuetypes.is_comparison(v):
+        return v
+    return frozenset(v) if isinstance(v, (list, set, frozenset)) else frozenset([v])
+
+
+def _clause_matches(clause, values):
+    if isinstance(clause, dict):
+        return any(valuetypes.compares(v, clause) for v in values)
+    return not clause.isdisjoint(values)
+
+
+class ChangeFeed(object):
+    "A store's subscriptions, and the changes pending dispatch to them."
+
+    def __init__(self):
+        self._all = []
+        # attr -> subscriptions to it (without patterns)
+        self._by_attr = collections.defaultdict(list)
+        # (attr, value) -> pattern subscriptions with that value among those for their keyed clause
+        self._by_clause = collections.defaultdict(list)
+        # attr -> number of pattern subscriptions keyed on it
+        self._clause_attrs = collections.Counter()
+        # triple -> op, in order, net of anything undone
+        self._pending = collections.OrderedDict()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, subscription):
+        if subscription.pattern:
+            for key in subscription._index_keys():
+                self._by_clause[key].append(subscription)
+            self._clause_attrs[subscription._key] += 1
+        elif subscription.attrs is not None:
+            for a in subscription.attrs:
+                self._by_attr[a].append(subscription)
+        else:
+            self._all.append(subscription)
+        self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription.pattern:
+            for key in subscription._index_keys():
+                _remove(self._by_clause, key, subscription)
+            self._clause_attrs[subscription._key] -= 1
+            if not self._clause_attrs[subscription._key]:
+                del self._clause_attrs[subscription._key]
+        elif subscription.attrs is not None:
+            for a in subscription.attrs:
+                _remove(self._by_attr, a, subscription)
+        else:
+            self._all.remove(subscription)
+        self._count -= 1
+
+    def record(self, op, triple):
+        "Called for each triple actually asserted or retracted."
+        if triple in self._pending:
+            # The opposite op, which this undoes
+            del self._pending[triple]
+        else:
+            self._pending[triple] = op
+
+    def dispatch(self, graph):
+        "Deliver the pending changes (to graph, which they've already been applied to) to their subscriptions."
+        if not self._pending:
+            return
+        # Take the batch first, so anything listeners write goes in a batch of its own
+        changes, self._pending = self._pending, collections.OrderedDict()
+        batches = collections.OrderedDict()
+        def deliver(subscription, op, triple):
+            if subscription not in batches:
+                batches[subscription] = ([], [])
+            added, retracted = batches[subscription]
+            (added if op == txlog.ASSERT else retracted).append(triple)
+        by_entity = collections.OrderedDict()
+        for triple, op in changes.items():
+            for subscription in self._all:
+                deliver(subscription, op, triple)
+            for subscription in self._by_attr.get(triple[1], ()):
+                deliver(subscription, op, triple)
+            if self._clause_attrs:
+                by_entity.setdefault(triple[0], []).append((op, triple))
+        for e, entity_changes in by_entity.items():
+            for subscription in self._entity_subscriptions(graph, e, entity_changes):
+                for op, triple in entity_changes:
+                    if subscription.attrs is None or triple[1] in subscription.attrs:
+                        deliver(subscription, op, triple)
+        errors = []
+        for subscription, (added, retracted) in batches.items():
+            if added or retracted:
+                try:
+                    subscription.listener(added, retracted)
+                except Exception as e:
+                    errors.append(e)
+        # Every listener gets its changes, even if one fails
+        if errors:
+            raise errors[0]
+
+    def _entity_subscriptions(self, graph, e, entity_changes):
+        # Pattern subscriptions which e matched before or after its changes
+        after = graph._eav_index.get(e) or {}
+        added, retracted = collections.defaultdict(set), collections.defaultdict(set)
+        for op, (_, a, v) in entity_changes:
+            (added if op == txlog.ASSERT else retracted)[a].add(v)
+        candidates = []
+        for a in self._clause_attrs:
+            values = set(get_values(after, a)) | retracted.get(a, set())
+            for v in values:
+                candidates.extend(self._by_clause.get((a, v), ()))
+            if values:
+                candidates.extend(self._by_clause.get((a, _any_value), ()))
+        seen = set()
+        for subscription in candidates:
+            if subscription in seen:
+                continue
+            seen.add(subscription)
+            pattern = subscription.pattern
+            if all(_clause_matches(clause, get_values(after, a)) for a, clause in pattern.items()) or \
+               all(_clause_matches(clause, (set(get_values(after, a)) - added[a]) | retracted[a])
+                   for a, clause in pattern.items()):
+                yield subscription
+
+
+def _remove(index, key, subscription):
+    subscriptions = index[key]
+    subscriptions.remove(subscription)
+    if not subscriptions:
+        del index[key]
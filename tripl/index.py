@@ -0,0 +1,90 @@
+"""
+The in memory triple index behind TripleStore's eav and vae indexes: a dict of k1 -> {k2: values}.
+
+Values are stored as compactly as they can be: a single value (which every `db.cardinality:one` attribute has) is
+stored bare, a few as a tuple, and only past that as a set. Empty entries are dropped. So anything reading the index
+should go through `get_values` (or `as_values`), which always hands back something iterable, with `in` and `len`.
+Tuples can't themselves be values, as they'd be taken for a collection of values (JSON has no tuples, so facts loaded
+from JSON are fine).
+"""
+
+
+_no_vals = frozenset()
+
+# What's a collection of values, rather than a single value; lists are for facts from JSON, not the index itself
+_collection_types = frozenset([set, tuple, frozenset, list])
+
+# Values are held as a tuple up to this many, and a set beyond
+max_tuple = 8
+
+
+def as_values(raw):
+    "The values of a raw index entry."
+    return raw if type(raw) in _collection_types else (raw,)
+
+
+def get_values(attrs, k2):
+    "The values for k2 in an index entry (or a dict of value lists, as loaded from JSON)."
+    raw = attrs.get(k2, _no_vals)
+    return raw if type(raw) in _collection_types else (raw,)
+
+
+class TripleIndex(dict):
+    "k1 -> {k2: values}, with values stored compactly (see the module docs)."
+
+    def add(self, k1, k2, k3):
+        "Add k3 under k1, k2, returning the number of values there now."
+        entry = self.get(k1)
+        if entry is None:
+            entry = self[k1] = {}
+        raw = entry.get(k2, _no_vals)
+        if raw is _no_vals:
+            entry[k2] = k3
+            return 1
+        kind = type(raw)
+        if kind is set:
+            raw.add(k3)
+            return len(raw)
+        if kind is tuple:
+            if k3 in raw:
+                return len(raw)
+            if len(raw) < max_tuple:
+                entry[k2] = raw + (k3,)
+                return len(raw) + 1
+            entry[k2] = raw = set(raw)
+            raw.add(k3)
+            return len(raw)
+        if raw == k3:
+            return 1
+        entry[k2] = (raw, k3)
+        return 2
+
+    def remove(self, k1, k2, k3):
+        "Remove k3 from under k1, k2 (KeyError if it isn't there), returning the number of values left."
+        entry = self[k1]
+        raw = entry[k2]
+        kind = type(raw)
+        if kind is set:
+            raw.remove(k3)
+            n = len(raw)
+            # Sets which have shrunk right down go back to being bare; no flapping between tuple and set
+            if n == 1:
+                entry[k2] = next(iter(raw))
+        elif kind is tuple:
+            rest = tuple(x for x in raw if x != k3)
+            if len(rest) == len(raw):
+                raise KeyError(k3)
+            n = len(rest)
+            if n == 1:
+                entry[k2] = rest[0]
+            else:
+                entry[k2] = rest
+        else:
+            if raw != k3:
+                raise KeyError(k3)
+            n = 0
+        if not n:
+            del entry[k2]
+            if not entry:
+                del self[k1]
+        return n
@@ -0,0 +1,112 @@
+"""
+Locking for TripleStores shared between threads (see the thread_safe option of TripleStore).
+"""
+
+import threading
+import functools
+import contextlib
+
+
+class RWLock(object):
+    """A reader-writer lock: any number of threads may hold it for reading at once, or a single thread for writing.
+    Both sides are reentrant (a thread already reading or writing can re-acquire freely, and the writer can also
+    read), and waiting writers take precedence over new readers, so a steady stream of queries can't starve
+    ingestion."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        depth = getattr(self._local, 'depth', 0)
+        if depth or self._writer is threading.current_thread():
+            self._local.depth = depth + 1
+            return
+        with self._cond:
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        self._local.depth = 1
+
+    def release_read(self):
+        self._local.depth -= 1
+        if self._local.depth or self._writer is threading.current_thread():
+            return
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.current_thread()
+        if self._writer is me:
+            self._writer_depth += 1
+            return
+        if getattr(self._local, 'depth', 0):
+            # Upgrading would deadlock against another upgrading reader
+            raise RuntimeError("Can't write to a TripleStore from within a read on the same thread")
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        self._writer_depth -= 1
+        if self._writer_depth:
+            return
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def reads(method):
+    "Decorate a TripleStore method to hold the store's lock (if it has one) for reading."
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        lock = self._lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return locked
+
+
+def writes(method):
+    "Decorate a TripleStore method to hold the store's lock (if it has one) for writing."
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        lock = self._lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_write()
+    return locked
@@ -0,0 +1,156 @@
+"""
+Opt in instrumentation for TripleStore. Nothing is collected until you call `TripleStore.instrument()`:
+
+    metrics = ts.instrument()
+    ts.pull_many(expr, pattern)
+    metrics.as_dict()
+    # {'counts': {'entities_scanned': 12034, 'index_hits': 311, ...},
+    #  'timers': {'match_pattern': {'calls': 1, 'seconds': 0.011, 'max_seconds': 0.011}, ...},
+    #  'maxima': {'pull_depth': 3}}
+
+    with ts.trace() as trace:
+        ts.pull(expr, eid)
+    print(trace.summary())
+
+Counters:
+
+* triples_asserted / triples_retracted: triples actually added to / removed from the index
+* entities_scanned: entities visited by full scans (match_pattern, lazy reverse lookups in pull)
+* index_hits / index_scans: lookups answered from an index, vs by scanning
+* schema_lookups: attribute schema reads behind cardinality and ref typing
+* entities_pulled: entities visited by pull, at any depth
+* cache_hits / cache_misses: lookups answered from one of the store's caches, vs having to build or load what
+  was wanted: Entity objects (entity), typed columns (comparison clauses), closures (ancestors and descendants; a
+  miss is a traversal) and a storage backend's entry or partition cache
+
+Hooks (see Metrics.add_hook) see every event as it happens, for exporting to statsd, prometheus and the like.
+Counts are not locked, so may come up a little short when several threads share a store.
+"""
+
+import collections
+import contextlib
+import functools
+import threading
+import time
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class Trace(object):
+    """The operations run (as (name, depth, start, seconds) spans, start relative to the start of the trace) and the
+    counts accumulated over a `with TripleStore.trace()` block. Only max_spans spans are kept."""
+
+    def __init__(self, max_spans=10000):
+        self.spans = []
+        self.counts = collections.Counter()
+        self.max_spans = max_spans
+        self.dropped_spans = 0
+        self.start = _clock()
+        self.seconds = None
+
+    def _span(self, name, depth, start, seconds):
+        if len(self.spans) < self.max_spans:
+            self.spans.append((name, depth, start - self.start, seconds))
+        else:
+            self.dropped_spans += 1
+
+    def summary(self):
+        "A human readable rundown of the trace."
+        lines = ['%.6fs total' % (self.seconds or 0)]
+        for name, depth, start, seconds in self.spans:
+            lines.append('%s%s  +%.6fs  %.6fs' % ('  ' * depth, name, start, seconds))
+        if self.dropped_spans:
+            lines.append('... %d more spans' % self.dropped_spans)
+        for name, n in sorted(self.counts.items()):
+            lines.append('%s: %d' % (name, n))
+        return '\n'.join(lines)
+
+
+class Metrics(object):
+    "Counters, timers and maxima for a TripleStore's operations; see the module docs."
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        # name -> [calls, total seconds, max seconds]; only outermost calls of recursive operations are timed
+        self.timers = {}
+        self.maxima = {}
+        self._hooks = []
+        self._traces = []
+        self._local = threading.local()
+
+    def add_hook(self, hook):
+        """Call hook(kind, name, value) on every event: kind 'count' (value is the increment), 'time' (seconds) or
+        'max' (a new maximum)."""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+        for trace in self._traces:
+            trace.counts[name] += n
+        for hook in self._hooks:
+            hook('count', name, n)
+
+    def observe_max(self, name, value):
+        if value > self.maxima.get(name, value - 1):
+            self.maxima[name] = value
+            for hook in self._hooks:
+                hook('max', name, value)
+
+    def _timed_call(self, name, method, args, kwargs):
+        depths = self._local.__dict__.setdefault('depths', collections.defaultdict(int))
+        depth = depths[name]
+        depths[name] = depth + 1
+        start = _clock()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            seconds = _clock() - start
+            depths[name] = depth
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            if not depth:
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+                for trace in self._traces:
+                    trace._span(name, sum(depths.values()), start, seconds)
+                for hook in self._hooks:
+                    hook('time', name, seconds)
+
+    @contextlib.contextmanager
+    def trace(self, max_spans=10000):
+        "Capture a Trace of everything this Metrics sees within the with block."
+        trace = Trace(max_spans)
+        self._traces.append(trace)
+        try:
+            yield trace
+        finally:
+            trace.seconds = _clock() - trace.start
+            self._traces.remove(trace)
+
+    def as_dict(self):
+        return {'counts': dict(self.counts),
+                'timers': dict((name, {'calls': calls, 'seconds': seconds, 'max_seconds': max_seconds})
+                               for name, (calls, seconds, max_seconds) in self.timers.items()),
+                'maxima': dict(self.maxima)}
+
+    def reset(self):
+        self.counts.clear()
+        self.timers.clear()
+        self.maxima.clear()
+
+
+def timed(name):
+    "Decorate a TripleStore method to be timed (as name) when the store is instrumented."
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapped(self, *args, **kwargs):
+            metrics = self.metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            return metrics._timed_call(name, method, (self,) + args, kwargs)
+        return wrapped
+    return decorate
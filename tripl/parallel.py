@@ -0,0 +1,85 @@
+"""
+Parallel pulls (see TripleStore.pull_many's processes option), for big exports from a single in memory store:
+
+    for seq in ts.pull_many(expr, {'cft:type': 'cft.type:seq'}, processes=8, ordered=False):
+        ...
+
+The eids are split into chunks, which a pool of worker processes pulls, results streaming back a chunk at a time,
+either in eid order or as they're done. Workers are forked from the calling process, so they share its indexes
+(copy on write) rather than having them pickled over; which means this needs a platform which can fork, and an in
+memory store (a storage backend's database connections don't survive a fork). Where there's no fork, results are
+pulled in process instead, just the same. Each worker sees the store as it was when the pool was forked.
+"""
+
+import itertools
+import multiprocessing
+import os
+
+
+# The store a worker pulls from; set in each worker as the pool starts
+_graph = None
+
+
+def _chunks(xs, n):
+    xs = iter(xs)
+    while True:
+        chunk = list(itertools.islice(xs, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _init(graph):
+    global _graph
+    # The forked copy is the worker's alone, so there's nothing to lock against (and a lock copied mid-use, say
+    # with a writer waiting, would never be released); nor anything to report metrics to
+    graph._lock = None
+    graph.metrics = None
+    _graph = graph
+
+
+def _pull_chunk(args):
+    pull_expr, eids = args
+    return [_graph.pull(pull_expr, eid) for eid in eids]
+
+
+def _fork_context():
+    # The fork start method's context, or None where processes can't be forked
+    if not hasattr(os, 'fork'):
+        return None
+    get_context = getattr(multiprocessing, 'get_context', None)
+    # Python 2 has no contexts, and forks anyway
+    return get_context('fork') if get_context is not None else multiprocessing
+
+
+def pull(graph, pull_expr, eids, processes, chunk_size=1000, ordered=True):
+    """Generate graph's pulls of eids, from a pool of processes, forked once the first result is asked for; see the
+    module docs."""
+    if graph._storage is not None:
+        raise ValueError("Parallel pulls need an in memory store, not one kept in a storage backend")
+    context = _fork_context()
+    if context is None:
+        return (graph.pull(pull_expr, eid) for eid in eids)
+    return _results(context, graph, pull_expr, eids, processes, chunk_size, ordered)
+
+
+def _results(context, graph, pull_expr, eids, processes, chunk_size, ordered):
+    lock = graph._lock
+    if lock is not None:
+        # Forked under the read lock, so no write is half done in the workers' copies
+        lock.acquire_read()
+    try:
+        pool = context.Pool(processes, initializer=_init, initargs=(graph,))
+    finally:
+        if lock is not None:
+            lock.release_read()
+    try:
+        tasks = ((pull_expr, chunk) for chunk in _chunks(eids, chunk_size))
+        for results in (pool.imap if ordered else pool.imap_unordered)(_pull_chunk, tasks):
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        # Stops the workers straight away if the results weren't all wanted (or something went wrong)
+        pool.terminate()
+        pool.join()
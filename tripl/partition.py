@@ -0,0 +1,347 @@
+"""
+Partitioned dumps, for graphs too big to load whole when only a corner of them is wanted:
+
+    ts.dump_partitions('graph.parts', by='type')                 # a partition per ns:type value
+    ts = tripl.TripleStore.load_partitions('graph.parts', max_partitions=4)
+    ts.pull_many(['*'], {'cft:type': 'cft.type:subject'})       # just loads the cft.type:subject partition
+
+A partitioned dump is a directory holding:
+
+* a dump file (in the usual line per entity layout, see tripl.stream) per partition, plus one of its vae entries (the
+  reverse refs to its entities) alongside it
+* `index.json`: how it's partitioned, and each partition's files and entity types
+* `offsets.jsonl`: the sidecar index, a line `[eid, partition, offset, length]` per entity, giving the position of the
+  entity's line in its partition's dump (eids being idents, this maps idents to partitions and byte offsets)
+
+Entities are partitioned by the values of their `ns:type` attributes (those with none in `_untyped`), or with
+`by='hash'`, over n_partitions by a hash of their eid. Schema entities always go in a partition of their own.
+
+PartitionedStorage is a storage backend (see tripl.storage) over such a directory: only the sidecar index and schema
+are loaded up front, and any other partition as soon as anything touches one of its entities, with at most
+max_partitions held in memory at once (least recently used dropped first). match_pattern clauses on a type attribute
+(or the ident attribute) only load the partitions which can match; anything else loads each partition in turn. Writes
+are applied in memory, and keep their partition resident from then on; dump the store again to save them.
+"""
+
+import collections
+import json
+import os
+import threading
+
+from . import stats
+from . import stream
+from .index import TripleIndex, as_values, get_values
+from .shard import shard_of
+from .storage import _LRU, _count_cache, _untracked
+
+
+SCHEMA = '_schema'
+UNTYPED = '_untyped'
+
+_partitionings = ('type', 'hash')
+
+
+def _type_attr(attr):
+    # An ns:type attribute (db namespace aside)
+    return str(attr).split(':')[-1] == 'type' and not stream._schema_attr(attr)
+
+
+def entity_types(attrs):
+    "The values of an entity's ns:type attributes, as strings."
+    return set(str(v) for a, vs in attrs.items() if _type_attr(a) for v in as_values(vs))
+
+
+def _fallback(by, n_partitions, eid):
+    # The partition of an eid with no entity to go by (refs to it, and new entities in a loaded store)
+    return str(shard_of(eid, n_partitions)) if by == 'hash' else UNTYPED
+
+
+def _entries(index, keys, ident_attr):
+    # (key, {k2: [values]}) for keys, in dump order
+    keys = sorted(keys, key=lambda k: stream._entity_key(k, index.get(k), ident_attr))
+    for k in keys:
+        yield k, dict((k2, list(as_values(vs))) for k2, vs in index.get(k).items())
+
+
+def write_partitions(graph, dirname, by='type', n_partitions=16):
+    "See TripleStore.dump_partitions."
+    if by not in _partitionings:
+        raise ValueError("Partition by one of %s, not %r" % (', '.join(_partitionings), by))
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    ident_attr = graph.ident_attr
+    members = collections.defaultdict(list)
+    types = collections.defaultdict(set)
+    for e, attrs in graph._eav_index.items():
+        if not attrs:
+            continue
+        if stream.schema_entity(attrs, ident_attr):
+            name = SCHEMA
+        elif by == 'hash':
+            name = str(shard_of(e, n_partitions))
+        else:
+            entity_type = entity_types(attrs)
+            name = min(entity_type) if entity_type else UNTYPED
+            for t in entity_type:
+                types[t].add(name)
+        members[name].append(e)
+    where = dict((e, name) for name, eids in members.items() for e in eids)
+    refs = collections.defaultdict(list)
+    for v, attrs in graph._vae_index.items():
+        if attrs:
+            refs[where.get(v) or _fallback(by, n_partitions, v)].append(v)
+    names = sorted(set(members) | set(refs), key=lambda name: (name != SCHEMA, name))
+    partitions = []
+    with open(os.path.join(dirname, 'offsets.jsonl'), 'w') as offsets_fp:
+        for i, name in enumerate(names):
+            filename, refs_filename = 'partition-%04d.trip.json' % i, 'partition-%04d.refs.trip.json' % i
+            offsets = {}
+            with open(os.path.join(dirname, filename), 'w') as fp:
+                stream.write_entities(_entries(graph._eav_index, members[name], ident_attr), fp, offsets)
+            with open(os.path.join(dirname, refs_filename), 'w') as fp:
+                stream.write_entities(_entries(graph._vae_index, refs[name], ident_attr), fp)
+            for e in members[name]:
+                offset, length = offsets[e]
+                offsets_fp.write(json.dumps([e, name, offset, length]) + '\n')
+            partitions.append({'name': name, 'file': filename, 'refs': refs_filename, 'entities': len(members[name])})
+    manifest = {'by': by, 'n_partitions': n_partitions, 'ident_attr': ident_attr, 'partitions': partitions,
+                'types': dict((t, sorted(names)) for t, names in types.items())}
+    with open(os.path.join(dirname, 'index.json'), 'w') as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
+
+
+class _Partition(object):
+    "A partition's eav and vae entries, as loaded."
+
+    __slots__ = ('eav', 'vae')
+
+    def __init__(self, eav=None, vae=None):
+        self.eav = eav or TripleIndex()
+        self.vae = vae or TripleIndex()
+
+
+def _read_index(filename, ident_attr):
+    index = TripleIndex()
+    with open(filename) as fp:
+        for k1, entry in stream.read_entities(fp, ident_attr):
+            for k2, values in entry.items():
+                for k3 in values:
+                    index.add(k1, k2, k3)
+    return index
+
+
+def _matches(entry, pattern):
+    # As TripleStore._entity_match, for the equality only patterns storage match is given
+    for a, clause in pattern.items():
+        vals = get_values(entry, a)
+        if not any(v in vals for v in (clause if isinstance(clause, (list, set)) else [clause])):
+            return False
+    return True
+
+
+class _PartitionedIndex(object):
+    "The eav or vae index of a PartitionedStorage, loading partitions as their entries are asked for."
+
+    def __init__(self, storage, which):
+        self._storage = storage
+        self._which = which
+
+    def _index(self, name):
+        return getattr(self._storage._partition(name), self._which)
+
+    def _known(self, k1):
+        # Whether k1 might have an entry, without loading anything; reverse refs aren't in the sidecar index
+        return self._which == 'vae' or k1 in self._storage._where
+
+    def get(self, k1, default=None):
+        if not self._known(k1):
+            return default
+        return self._index(self._storage._partition_of(k1)).get(k1, default)
+
+    def __contains__(self, k1):
+        if self._which == 'eav' and k1 in self._storage._where and not self._storage._dirty(k1):
+            return True
+        return bool(self.get(k1))
+
+    def add(self, k1, k2, k3):
+        storage = self._storage
+        with storage._lock:
+            name = storage._partition_of(k1)
+            if self._which == 'eav' and k1 not in storage._where:
+                storage._where[k1] = (name, None, None)
+            return getattr(storage._pin(name), self._which).add(k1, k2, k3)
+
+    def remove(self, k1, k2, k3):
+        storage = self._storage
+        with storage._lock:
+            return getattr(storage._pin(storage._partition_of(k1)), self._which).remove(k1, k2, k3)
+
+    def _scan(self, names):
+        for name in names:
+            for k1, entry in list(self._index(name).items()):
+                yield k1, entry
+
+    def items(self):
+        return self._scan(self._storage.partitions())
+
+    def keys(self):
+        if self._which == 'vae':
+            return (k1 for k1, _ in self.items())
+        return (e for e in list(self._storage._where) if e in self)
+
+    __iter__ = keys
+
+    def match(self, pattern):
+        """The eids matching an equality pattern, scanning only the partitions which hold entities of the types asked
+        for, or the ones with the idents asked for (plus any written to since loading)."""
+        names = self._storage._candidates(pattern)
+        return set(e for e, entry in self._scan(names) if _matches(entry, pattern))
+
+
+class _PartitionedStats(object):
+    "Attribute stats, computed by loading each partition in turn when asked for, as for SQLiteStorage."
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __getitem__(self, attr):
+        return _untracked
+
+    def get(self, attr, default=None):
+        attr_stats = stats.AttrStats()
+        for e, entry in self._storage.eav.items():
+            for size, v in enumerate(get_values(entry, attr), 1):
+                attr_stats.add(v, size)
+        return attr_stats if attr_stats.triples else default
+
+    def items(self):
+        return stats.collect(self._storage.eav).items()
+
+
+class PartitionedStorage(object):
+    """A storage backend over a partitioned dump (as written by write_partitions), loading partitions as they're
+    needed, with up to max_partitions of them (schema and those written to aside) held in memory."""
+
+    # A weak reference to the TripleStore this backs, set by it
+    _graph = None
+
+    def __init__(self, dirname, max_partitions=8):
+        self.dirname = dirname
+        with open(os.path.join(dirname, 'index.json')) as fp:
+            manifest = json.load(fp)
+        self.by = manifest['by']
+        self.n_partitions = manifest['n_partitions']
+        self.ident_attr = manifest['ident_attr']
+        self._files = dict((p['name'], (p['file'], p['refs'])) for p in manifest['partitions'])
+        self._types = manifest['types']
+        # eid -> (partition, offset, length); offset is None for entities asserted since loading
+        self._where = {}
+        with open(os.path.join(dirname, 'offsets.jsonl')) as fp:
+            for line in fp:
+                if line.strip():
+                    e, name, offset, length = json.loads(line)
+                    self._where[e] = (name, offset, length)
+        self._lock = threading.RLock()
+        self._cache = _LRU(max_partitions)
+        # Partitions which stay loaded: schema, and any written to
+        self._pinned = {}
+        self.loads = 0
+        self.eav = _PartitionedIndex(self, 'eav')
+        self.vae = _PartitionedIndex(self, 'vae')
+        self.stats = _PartitionedStats(self)
+        if SCHEMA in self._files:
+            self._pin(SCHEMA)
+
+    def _partition_of(self, k1):
+        where = self._where.get(k1)
+        return where[0] if where is not None else _fallback(self.by, self.n_partitions, k1)
+
+    def _load(self, name):
+        if name not in self._files:
+            return _Partition()
+        filename, refs_filename = self._files[name]
+        self.loads += 1
+        return _Partition(_read_index(os.path.join(self.dirname, filename), self.ident_attr),
+                          _read_index(os.path.join(self.dirname, refs_filename), self.ident_attr))
+
+    def _partition(self, name):
+        "The named partition, loading it (and dropping the least recently used, if need be) if it isn't resident."
+        with self._lock:
+            partition = self._pinned.get(name) or self._cache.get(name)
+            _count_cache(self, partition is not None)
+            if partition is None:
+                partition = self._load(name)
+                self._cache.put(name, partition)
+            return partition
+
+    def _pin(self, name):
+        # The named partition, kept resident from now on (as it's about to be written to)
+        with self._lock:
+            partition = self._pinned.get(name)
+            if partition is None:
+                partition = self._cache.pop(name) or self._load(name)
+                self._pinned[name] = partition
+            return partition
+
+    def _dirty(self, e):
+        # Whether e's partition may have changed since it was loaded
+        return self._where[e][0] in self._pinned
+
+    def partitions(self):
+        "The names of every partition, schema first."
+        return sorted(set(self._files) | set(self._pinned), key=lambda name: (name != SCHEMA, name))
+
+    def resident(self):
+        "The names of the partitions held in memory."
+        with self._lock:
+            return sorted(set(self._pinned) | set(self._cache.keys()))
+
+    def _candidates(self, pattern):
+        # The partitions which can hold matches for an equality pattern
+        names = None
+        for a, clause in pattern.items():
+            values = clause if isinstance(clause, (list, set)) else [clause]
+            if a == self.ident_attr:
+                found = set(self._where[v][0] for v in values if v in self._where)
+            elif self.by == 'type' and _type_attr(a):
+                found = set(name for v in values for name in self._types.get(str(v), ()))
+            else:
+                continue
+            names = found if names is None else names & found
+        if names is None:
+            return self.partitions()
+        return sorted(names | set(self._pinned))
+
+    def estimate(self, pattern):
+        """An upper bound on the matches for an equality pattern, from the sidecar index alone: the entities in the
+        partitions which can hold them. None if that's every partition."""
+        names = set(self._candidates(pattern))
+        if names == set(self.partitions()):
+            return None
+        names.discard(SCHEMA)
+        with self._lock:
+            return sum(1 for name, _, _ in self._where.values() if name in names)
+
+    def read_entity(self, eid):
+        """eid's {attr: [values]}, from memory if its partition is resident, otherwise read straight off disk at its
+        offset (without loading the partition); None if there's no such entity."""
+        with self._lock:
+            where = self._where.get(eid)
+            if where is None:
+                return None
+            name, offset, length = where
+            partition = self._pinned.get(name) or self._cache.peek(name)
+        if partition is not None or offset is None:
+            entry = self.eav.get(eid)
+            return dict((a, list(as_values(vs))) for a, vs in entry.items()) if entry else None
+        with open(os.path.join(self.dirname, self._files[name][0]), 'rb') as fp:
+            return stream.read_entity(fp, offset, length)[1]
+
+    def commit(self):
+        # Writes are only ever held in memory
+        pass
+
+    def close(self):
+        with self._lock:
+            self._cache.clear()
+            self._pinned.clear()
@@ -0,0 +1,347 @@
+"""
+A TripleStore sharded over worker processes, for using more than one core on big pull_many / match_pattern jobs.
+
+Entities are hash partitioned by eid, each worker process holding the eav entries of its own entities, and the vae
+(reverse ref) entries of the entities referred to. Schema triples (attributes in the `db` namespace) go to every
+shard, so each can apply cardinality and ref typing on its own.
+
+Queries fan out to all shards at once and are merged. When a shard's pull follows a ref (or reverse ref) to an
+entity which lives on another shard, it leaves a placeholder in its result, which the parent then resolves by
+pulling from the owning shard, batched per shard and again in parallel, until no placeholders are left.
+
+    with ShardedTripleStore(n_shards=8, schema=schema) as sts:
+        sts.assert_facts(facts)
+        seqs = sts.pull_many(['*', {'cft.seq:timepoint': ['*']}], {'cft:type': 'cft.type:seq'})
+
+Reverse lookups across shards need the ref attribute to be typed `db.type:ref` in the schema; the lazy_refs scan
+only sees the shard it runs on.
+"""
+
+import collections
+import json
+import multiprocessing
+import traceback
+import zlib
+
+from . import tripl
+from . import txlog
+from . import stream
+from .stream import _schema_attr
+from .index import as_values
+
+
+def shard_of(key, n_shards):
+    "Which of n_shards shards a given eid lives on. Stable across processes and runs (unlike hash)."
+    return zlib.crc32(str(key).encode('utf8')) % n_shards
+
+
+# A shard's stand in for pull results it can't produce itself
+_Remote = collections.namedtuple('_Remote', ['eid', 'pull_expr', 'base_pattern'])
+
+# Ops for maintaining a vae entry on behalf of the shard owning the triple
+_VAE_ASSERT = 'vae+'
+_VAE_RETRACT = 'vae-'
+
+
+class _ShardStore(tripl.TripleStore):
+    "The TripleStore living in each worker process."
+
+    def __init__(self, shard, n_shards, **kwargs):
+        self.shard = shard
+        self.n_shards = n_shards
+        # vae ops for refs to entities on other shards, for the parent to forward
+        self._outbox = []
+        tripl.TripleStore.__init__(self, **kwargs)
+
+    def _owns(self, key):
+        return shard_of(key, self.n_shards) == self.shard
+
+    def _index_ref(self, e, a, v):
+        if self._owns(v) or _schema_attr(a, self.ident_attr):
+            tripl.TripleStore._index_ref(self, e, a, v)
+        else:
+            self._outbox.append((_VAE_ASSERT, (e, a, v)))
+
+    def _unindex_ref(self, e, a, v):
+        if self._owns(v) or _schema_attr(a, self.ident_attr):
+            tripl.TripleStore._unindex_ref(self, e, a, v)
+        else:
+            self._outbox.append((_VAE_RETRACT, (e, a, v)))
+
+    def _pull(self, pull_expr, entity, _seen_entities=None, _base_pattern=None, _depth=1):
+        if not isinstance(entity, dict) and entity not in self._eav_index and not self._owns(entity):
+            return _Remote(entity, pull_expr, _base_pattern)
+        return tripl.TripleStore._pull(self, pull_expr, entity, _seen_entities=_seen_entities,
+                                       _base_pattern=_base_pattern, _depth=_depth)
+
+    # The requests served to the parent process
+
+    def _serve_apply(self, ops):
+        for op, triple in ops:
+            if op == txlog.ASSERT:
+                self._assert_triple(triple)
+            elif op == txlog.RETRACT:
+                self._retract_triple(triple)
+            elif op == _VAE_ASSERT:
+                tripl.TripleStore._index_ref(self, *triple)
+            else:
+                tripl.TripleStore._unindex_ref(self, *triple)
+        outbox, self._outbox = self._outbox, []
+        return outbox
+
+    def _serve_match_pattern(self, pattern):
+        # Schema entities are on every shard; only their owner reports them
+        return set(eid for eid in self.match_pattern(pattern) if self._owns(eid))
+
+    def _serve_pull_many(self, pull_expr, eids):
+        return [self.pull(pull_expr, eid) for eid in eids]
+
+    def _serve_pull_matching(self, pull_expr, pattern):
+        return self._serve_pull_many(pull_expr, self._serve_match_pattern(pattern))
+
+    def _serve_pull_remotes(self, remotes):
+        return [self.pull(r.pull_expr, r.eid, _base_pattern=r.base_pattern) for r in remotes]
+
+    def _serve_eav_index(self):
+        return {e: {a: list(as_values(vs)) for a, vs in attrs.items()}
+                for e, attrs in self._eav_index.items() if attrs and self._owns(e)}
+
+
+def _serve(conn, shard, n_shards, kwargs):
+    "Worker process main loop: apply (method, args) requests from the parent until sent None."
+    graph = _ShardStore(shard, n_shards, **kwargs)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            conn.send(('ok', getattr(graph, '_serve_' + method)(*args)))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+    conn.close()
+
+
+class _Router(tripl.TripleStore):
+    """Resolves facts into triples just as a TripleStore would (eids, nested dicts, id_attrs), but queues them up for
+    the shards rather than indexing them. Keeps the schema triples locally too."""
+
+    def __init__(self, sharded, **kwargs):
+        self._sharded = sharded
+        self._batches = None
+        tripl.TripleStore.__init__(self, **kwargs)
+        self._batches = [[] for _ in range(sharded.n_shards)]
+        self._queued = 0
+
+    def _route(self, op, triple):
+        e, a, v = triple
+        if _schema_attr(a, self.ident_attr):
+            for batch in self._batches:
+                batch.append((op, triple))
+        else:
+            self._batches[shard_of(e, len(self._batches))].append((op, triple))
+        self._queued += 1
+        if self._queued >= self._sharded.batch_size:
+            self._sharded._flush()
+
+    def _assert_triple(self, triple):
+        if self._batches is None or _schema_attr(triple[1], self.ident_attr):
+            tripl.TripleStore._assert_triple(self, triple)
+        if self._batches is not None:
+            self._route(txlog.ASSERT, triple)
+
+    def _retract_triple(self, triple):
+        if self._batches is None or _schema_attr(triple[1], self.ident_attr):
+            tripl.TripleStore._retract_triple(self, triple)
+        if self._batches is not None:
+            self._route(txlog.RETRACT, triple)
+
+    def _take_batches(self):
+        batches = self._batches
+        self._batches = [[] for _ in batches]
+        self._queued = 0
+        return batches
+
+
+class ShardedTripleStore(object):
+    """A triple store hash partitioned over n_shards worker processes (one per cpu by default); see the module docs.
+    Takes the same schema options as TripleStore, and supports the same assert/retract and pull/pull_many/
+    match_pattern API (though pull_many returns a list rather than a generator). Writes are sent to the workers in
+    batches of up to batch_size triples."""
+
+    def __init__(self, n_shards=None, schema=None, facts=None, lazy_refs=None, default_cardinality=None,
+                 ident_attr="db:ident", batch_size=100000):
+        self.n_shards = n_shards or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        kwargs = dict(schema=schema, lazy_refs=lazy_refs, default_cardinality=default_cardinality,
+                      ident_attr=ident_attr)
+        self._conns = []
+        self._workers = []
+        for shard in range(self.n_shards):
+            conn, worker_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_serve, args=(worker_conn, shard, self.n_shards, kwargs))
+            worker.daemon = True
+            worker.start()
+            self._conns.append(conn)
+            self._workers.append(worker)
+        self._router = _Router(self, **kwargs)
+        self.ident_attr = ident_attr
+        if facts:
+            self.assert_facts(facts)
+
+    def _call(self, requests):
+        """Send each shard in requests ({shard: (method, args)}) its request, and then gather the replies, so the
+        shards all work at once."""
+        for shard, request in requests.items():
+            self._conns[shard].send(request)
+        replies = {}
+        errors = []
+        for shard in requests:
+            status, value = self._conns[shard].recv()
+            if status == 'error':
+                errors.append(value)
+            replies[shard] = value
+        if errors:
+            raise RuntimeError("Error in shard worker:\n" + errors[0])
+        return replies
+
+    def _call_all(self, method, *args):
+        return self._call({shard: (method, args) for shard in range(self.n_shards)})
+
+    def _flush(self):
+        batches = self._router._take_batches()
+        outboxes = self._call({shard: ('apply', (ops,)) for shard, ops in enumerate(batches) if ops})
+        # Forward vae ops for refs which crossed shards
+        forwards = collections.defaultdict(list)
+        for ops in outboxes.values():
+            for op, triple in ops:
+                forwards[shard_of(triple[2], self.n_shards)].append((op, triple))
+        if forwards:
+            self._call({shard: ('apply', (ops,)) for shard, ops in forwards.items()})
+
+    # Writes
+
+    def assert_fact(self, fact, id_attrs=None, _ids=None):
+        "As TripleStore.assert_fact."
+        eid = self._router._assert_fact(fact, id_attrs=id_attrs, _ids=_ids)
+        self._flush()
+        return eid
+
+    def assert_facts(self, facts, id_attrs=None):
+        "As TripleStore.assert_facts."
+        self._router.assert_facts(facts, id_attrs=id_attrs)
+        self._flush()
+
+    def retract_fact(self, triple):
+        "As TripleStore.retract_fact."
+        self.retract_facts([triple])
+
+    def retract_facts(self, triples):
+        "As TripleStore.retract_facts."
+        for triple in triples:
+            self._router._retract_triple(triple)
+        self._flush()
+
+    def schema(self, attr=None, meta_attr=None):
+        return self._router.schema(attr, meta_attr)
+
+    # Queries
+
+    def match_pattern(self, pattern):
+        "As TripleStore.match_pattern, in parallel over the shards."
+        eids = set()
+        for shard_eids in self._call_all('match_pattern', pattern).values():
+            eids.update(shard_eids)
+        return eids
+
+    def _resolve(self, results):
+        "Replace the _Remote placeholders (at any depth) in a list of pull results, in place."
+        pending = []
+        _find_remotes(results, pending)
+        while pending:
+            by_shard = collections.defaultdict(list)
+            for slot in pending:
+                by_shard[shard_of(slot[2].eid, self.n_shards)].append(slot)
+            replies = self._call({shard: ('pull_remotes', ([remote for _, _, remote in slots],))
+                                  for shard, slots in by_shard.items()})
+            pending = []
+            for shard, slots in by_shard.items():
+                for (container, key, _), value in zip(slots, replies[shard]):
+                    container[key] = value
+                    _find_remotes(value, pending)
+        return results
+
+    def pull(self, pull_expr, entity):
+        "As TripleStore.pull."
+        if isinstance(entity, dict):
+            entity = tripl.some(self.match_pattern(entity))
+        return self._resolve([_Remote(entity, pull_expr, None)])[0]
+
+    def pull_many(self, pull_expr, eids_or_pattern, sort_by=None, sort_desc=True):
+        """As TripleStore.pull_many, with each shard pulling its own entities in parallel. Given a list of eids,
+        results come back in the same order."""
+        if isinstance(eids_or_pattern, dict):
+            replies = self._call_all('pull_matching', pull_expr, eids_or_pattern)
+            results = [result for shard in sorted(replies) for result in replies[shard]]
+        else:
+            eids = list(eids_or_pattern)
+            by_shard = collections.defaultdict(list)
+            for i, eid in enumerate(eids):
+                by_shard[shard_of(eid, self.n_shards)].append(i)
+            replies = self._call({shard: ('pull_many', (pull_expr, [eids[i] for i in positions]))
+                                  for shard, positions in by_shard.items()})
+            results = [None] * len(eids)
+            for shard, positions in by_shard.items():
+                for i, result in zip(positions, replies[shard]):
+                    results[i] = result
+        self._resolve(results)
+        if sort_by:
+            results = self._router._sort_results(results, sort_by, sort_desc)
+        return results
+
+    # Files
+
+    @classmethod
+    def load_file(cls, filename, schema=None, n_shards=None):
+        "Load data from a JSON file (e.g. as written by TripleStore.dump_file), and assert as with assert_facts."
+        with open(filename, 'rb') as fp:
+            return cls(n_shards=n_shards, facts=json.load(fp), schema=schema)
+
+    def dump_file(self, filename):
+        "Save semantic graph to a json file as an EAV index (loadable by TripleStore.load_file)."
+        index = {}
+        for shard_index in self._call_all('eav_index').values():
+            index.update(shard_index)
+        with open(filename, 'w') as fp:
+            stream.write_entities(stream.index_entities(index, self.ident_attr), fp)
+
+    def close(self):
+        "Shut down the worker processes."
+        for conn in self._conns:
+            conn.send(None)
+            conn.close()
+        for worker in self._workers:
+            worker.join()
+        self._conns = []
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _find_remotes(obj, pending):
+    "Collect (container, key, remote) for every _Remote placeholder nested in obj."
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return
+    for key, value in items:
+        if isinstance(value, _Remote):
+            pending.append((obj, key, value))
+        else:
+            _find_remotes(value, pending)
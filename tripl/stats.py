@@ -0,0 +1,171 @@
+"""
+Per attribute statistics, kept up to date as triples are asserted and retracted (see TripleStore.stats), for query
+planning and cache sizing without walking the index:
+
+    ts.stats('cft.seq:timepoint')
+    # {'triples': 6022, 'entities': 3011, 'distinct_values': 150, 'max_values': 2, 'avg_values': 2.0,
+    #  'value_types': {'str': 6022}}
+
+Counts of each distinct value are kept, so the number of entities a `{attr: value}` pattern clause can match is
+known up front (see estimate), for up to AttrStats.max_values distinct values per attribute. Past that (ids,
+descriptions, and the like), holding them would cost about as much memory as the values themselves, so the counts
+are dropped, and the number of distinct values is estimated with a sketch instead (to within a few percent; values
+retracted since stay counted). Clauses on such attributes are estimated from the average entities per value.
+"""
+
+import collections
+import math
+
+from .index import as_values
+from .text import _string_types
+
+
+_mask = (1 << 64) - 1
+
+
+def _mix(x):
+    # splitmix64's finalizer, so that small ints (which hash to themselves) spread over all the bits
+    x = (x + 0x9E3779B97F4A7C15) & _mask
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _mask
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _mask
+    return x ^ (x >> 31)
+
+
+class Distinct(object):
+    "A HyperLogLog sketch of the number of distinct values added, in 2 ** p bytes."
+
+    __slots__ = ('p', 'registers')
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, v):
+        h = _mix(hash(v) & _mask)
+        bits = 64 - self.p
+        rest = h & ((1 << bits) - 1)
+        i, rank = h >> bits, bits - rest.bit_length() + 1
+        if rank > self.registers[i]:
+            self.registers[i] = rank
+
+    def __len__(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(b'\x00')
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting does better while the sketch is mostly empty
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+
+class AttrStats(object):
+    "Running statistics for one attribute."
+
+    __slots__ = ('triples', 'entities', 'values', 'distinct', 'sizes', 'types')
+
+    # Distinct values counted before the counts are dropped for a sketch
+    max_values = 1000
+
+    def __init__(self):
+        self.triples = 0
+        # Entities with at least one value
+        self.entities = 0
+        # value -> number of entities with it; None once there are more than max_values of them
+        self.values = {}
+        # A Distinct sketch, in place of values
+        self.distinct = None
+        # number of values -> number of entities with that many
+        self.sizes = {}
+        # type -> number of triples
+        self.types = {}
+
+    # These are on the path of every triple asserted, so are kept to plain dict operations
+
+    def add(self, v, size):
+        "Count v, just added to an entity which now has size values of the attribute."
+        self.triples += 1
+        values = self.values
+        if values is None:
+            self.distinct.add(v)
+        elif v in values:
+            values[v] += 1
+        elif len(values) < self.max_values:
+            values[v] = 1
+        else:
+            self._drop_values()
+            self.distinct.add(v)
+        types = self.types
+        t = type(v)
+        types[t] = types.get(t, 0) + 1
+        sizes = self.sizes
+        if size == 1:
+            self.entities += 1
+        else:
+            _decrement(sizes, size - 1)
+        sizes[size] = sizes.get(size, 0) + 1
+
+    def remove(self, v, size):
+        "Uncount v, just removed from an entity which now has size values of the attribute."
+        self.triples -= 1
+        if self.values is not None:
+            _decrement(self.values, v)
+        _decrement(self.types, type(v))
+        _decrement(self.sizes, size + 1)
+        if size:
+            self.sizes[size] = self.sizes.get(size, 0) + 1
+        else:
+            self.entities -= 1
+
+    def _drop_values(self):
+        self.distinct = Distinct()
+        for v in self.values:
+            self.distinct.add(v)
+        self.values = None
+
+    def n_values(self):
+        "The number of distinct values (estimated, once there are more than max_values)."
+        return len(self.values) if self.values is not None else len(self.distinct)
+
+    def as_dict(self):
+        # Text counts as str, whether python 2 has it as str or unicode
+        value_types = {}
+        for t, n in self.types.items():
+            name = 'str' if t in _string_types else t.__name__
+            value_types[name] = value_types.get(name, 0) + n
+        return {'triples': self.triples,
+                'entities': self.entities,
+                'distinct_values': self.n_values(),
+                'max_values': max(self.sizes) if self.sizes else 0,
+                'avg_values': float(self.triples) / self.entities if self.entities else 0.0,
+                'value_types': value_types}
+
+
+def _decrement(counts, key):
+    # Drop keys as they hit zero, so len and max stay right
+    n = counts[key]
+    if n == 1:
+        del counts[key]
+    else:
+        counts[key] = n - 1
+
+
+def collect(eav_index):
+    "Compute stats for every attribute by walking an eav index (for stores which don't keep them as they go)."
+    stats = collections.defaultdict(AttrStats)
+    for e, attrs in eav_index.items():
+        for a, vs in attrs.items():
+            attr_stats = stats[a]
+            for size, v in enumerate(as_values(vs), 1):
+                attr_stats.add(v, size)
+    return stats
+
+
+def estimate(attr_stats, values):
+    """Upper bound on the number of entities with any of values for the attribute; or once its value counts have
+    been dropped, the average number per value."""
+    if attr_stats is None:
+        return 0
+    if attr_stats.values is None:
+        per_value = float(attr_stats.triples) / max(attr_stats.n_values(), 1)
+        return min(attr_stats.entities, int(round(len(values) * per_value)))
+    return min(attr_stats.entities, sum(attr_stats.values.get(v, 0) for v in values))
@@ -0,0 +1,244 @@
+"""
+Storage backends for TripleStore indexes, for graphs which don't fit in memory:
+
+    from tripl import storage, tripl
+    ts = tripl.TripleStore(storage=storage.SQLiteStorage('graph.db'))
+    ts.assert_facts(facts)
+    ts.close()
+    # ... later, picks up where it left off (schema included)
+    ts = tripl.TripleStore(storage=storage.SQLiteStorage('graph.db'))
+
+A TripleStore keeps two indexes, eav (e -> a -> {v}) and vae (v -> a -> {e}, for ref attributes), and everything it
+does goes through this much of the mapping protocol on them:
+
+* `index.get(k1, default)`: the {k2: values} entry for k1 (treated as read only), or default if there isn't one;
+  values may be sets, or stored compactly as in tripl.index
+* `index.add(k1, k2, k3)` / `index.remove(k1, k2, k3)`: writes, returning the number of values left under k1, k2
+* `index.items()`, `index.keys()`, `k1 in index`: scans and membership
+* optionally `index.match(pattern)`: the eids matching a match_pattern pattern, if the backend can do better than a
+  scan of items()
+
+By default a TripleStore uses tripl.index.TripleIndex, a dict which provides all this with no further indirection. A
+storage backend provides `eav` and `vae` indexes, `stats` (see tripl.stats; anything with
+get, items and a `[attr]` returning something with add and remove), `commit()`, called after each public write,
+and `close()`.
+"""
+
+import collections
+import json
+import sqlite3
+import threading
+
+from . import stats
+
+
+_encode = json.dumps
+_decode = json.loads
+
+
+def _count_cache(storage, hit):
+    "Count a cache hit or miss into the metrics of the store storage backs, if it's instrumented."
+    graph = storage._graph() if storage._graph is not None else None
+    if graph is not None and graph.metrics is not None:
+        graph.metrics.count('cache_hits' if hit else 'cache_misses')
+
+
+class _LRU(object):
+    "A size bounded cache, dropping the least recently used entries first."
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._entries[key] = entry
+        return entry
+
+    def peek(self, key):
+        "Get without counting as a use."
+        return self._entries.get(key)
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        "Remove and return key's entry (None if there isn't one)."
+        return self._entries.pop(key, None)
+
+    def keys(self):
+        return list(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class _SQLiteIndex(object):
+    """One index (eav or vae) as a table keyed (k1, k2, k3), with the {k2: {k3}} entries of recently used k1s cached
+    in memory. Writes go straight through to the table (and any cached entry)."""
+
+    def __init__(self, storage, table, cols, cache_size):
+        self._storage = storage
+        self._db = storage._db
+        self._lock = storage._lock
+        self._table = table
+        self._cache = _LRU(cache_size)
+        k1, k2, k3 = cols
+        params = dict(table=table, k1=k1, k2=k2, k3=k3)
+        self._select_entry = 'SELECT %(k2)s, %(k3)s FROM %(table)s WHERE %(k1)s = ?' % params
+        self._select_all = 'SELECT %(k1)s, %(k2)s, %(k3)s FROM %(table)s ORDER BY %(k1)s' % params
+        self._select_keys = 'SELECT DISTINCT %(k1)s FROM %(table)s ORDER BY %(k1)s' % params
+        self._insert = 'INSERT OR IGNORE INTO %(table)s (%(k1)s, %(k2)s, %(k3)s) VALUES (?, ?, ?)' % params
+        self._delete = 'DELETE FROM %(table)s WHERE %(k1)s = ? AND %(k2)s = ? AND %(k3)s = ?' % params
+
+    def _entry(self, k1):
+        # The cached entry for k1 (loading it if need be); {} if there's nothing. Call with the lock held.
+        entry = self._cache.get(k1)
+        _count_cache(self._storage, entry is not None)
+        if entry is None:
+            entry = {}
+            for k2, k3 in self._db.execute(self._select_entry, (_encode(k1),)):
+                entry.setdefault(k2, set()).add(_decode(k3))
+            self._cache.put(k1, entry)
+        return entry
+
+    def get(self, k1, default=None):
+        with self._lock:
+            entry = self._entry(k1)
+        return entry if entry else default
+
+    def __contains__(self, k1):
+        return bool(self.get(k1))
+
+    def add(self, k1, k2, k3):
+        with self._lock:
+            self._db.execute(self._insert, (_encode(k1), k2, _encode(k3)))
+            values = self._entry(k1).setdefault(k2, set())
+            values.add(k3)
+            return len(values)
+
+    def remove(self, k1, k2, k3):
+        with self._lock:
+            if not self._db.execute(self._delete, (_encode(k1), k2, _encode(k3))).rowcount:
+                raise KeyError(k3)
+            entry = self._entry(k1)
+            values = entry.get(k2, set())
+            values.discard(k3)
+            if not values:
+                entry.pop(k2, None)
+            return len(values)
+
+    def _rows(self, sql, params=()):
+        # Stream rows, holding the lock only while fetching
+        cursor = self._db.cursor()
+        with self._lock:
+            cursor.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+    def items(self):
+        k1, entry = None, None
+        for row_k1, k2, k3 in self._rows(self._select_all):
+            row_k1 = _decode(row_k1)
+            if entry is None or row_k1 != k1:
+                if entry:
+                    yield k1, entry
+                k1, entry = row_k1, {}
+            entry.setdefault(k2, set()).add(_decode(k3))
+        if entry:
+            yield k1, entry
+
+    def keys(self):
+        return (_decode(k1) for (k1,) in self._rows(self._select_keys))
+
+    __iter__ = keys
+
+    def match(self, pattern):
+        "The k1s with at least one of the values given for each k2 in pattern; just an index lookup per clause."
+        clauses, params = [], []
+        for k2, value in pattern.items():
+            values = value if isinstance(value, (list, set)) else [value]
+            clauses.append('SELECT e FROM %s WHERE a = ? AND v IN (%s)' % (self._table, ', '.join('?' * len(values))))
+            params += [k2] + [_encode(v) for v in values]
+        with self._lock:
+            return set(_decode(e) for (e,) in self._db.execute(' INTERSECT '.join(clauses), params))
+
+
+class _Untracked(object):
+    # What _assert_triple and _retract_triple update stats through, when they're computed on demand instead
+    def add(self, v, size):
+        pass
+
+    remove = add
+
+
+_untracked = _Untracked()
+
+
+class _SQLiteStats(object):
+    """Attribute stats, computed by query when asked for, rather than kept up to date in memory (which would mean
+    holding every distinct value)."""
+
+    def __init__(self, storage):
+        self._storage = storage
+
+    def __getitem__(self, attr):
+        return _untracked
+
+    def get(self, attr, default=None):
+        attr_stats = stats.AttrStats()
+        e, size = None, 0
+        for row_e, v in self._storage.eav._rows('SELECT e, v FROM eav WHERE a = ? ORDER BY e', (attr,)):
+            size = size + 1 if row_e == e else 1
+            e = row_e
+            attr_stats.add(_decode(v), size)
+        return attr_stats if attr_stats.triples else default
+
+    def items(self):
+        for (attr,) in list(self._storage.eav._rows('SELECT DISTINCT a FROM eav')):
+            yield attr, self.get(attr)
+
+
+class SQLiteStorage(object):
+    """Keeps a TripleStore's indexes in an SQLite database (created if need be), each as a table whose primary key
+    is in index order, plus a covering (a, v, e) index, which match_pattern queries directly. Up to cache_size
+    entities per index are cached in memory. Each public write to the store is committed as a transaction.
+
+    Values are stored as JSON, so unlike in memory, 1, 1.0 and True are distinct values."""
+
+    # A weak reference to the TripleStore this backs, set by it
+    _graph = None
+
+    def __init__(self, filename, cache_size=100000):
+        self.filename = filename
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS eav (e TEXT NOT NULL, a TEXT NOT NULL, v TEXT NOT NULL,
+                                            PRIMARY KEY (e, a, v)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS eav_ave ON eav (a, v, e);
+            CREATE TABLE IF NOT EXISTS vae (v TEXT NOT NULL, a TEXT NOT NULL, e TEXT NOT NULL,
+                                            PRIMARY KEY (v, a, e)) WITHOUT ROWID;
+            """)
+        self.eav = _SQLiteIndex(self, 'eav', ('e', 'a', 'v'), cache_size)
+        self.vae = _SQLiteIndex(self, 'vae', ('v', 'a', 'e'), cache_size)
+        self.stats = _SQLiteStats(self)
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
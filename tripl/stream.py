@@ -0,0 +1,234 @@
+"""
+Streaming reads and writes of EAV index dumps, for working with graphs without loading them into a TripleStore.
+
+Dumps are written as a JSON object with one entity per line, schema entities (those with `db` namespace attributes)
+first and then everything else, each sorted by eid:
+
+    {
+    "cft.seq:timepoint": {"db:cardinality": ["db.cardinality:many"], "db:valueType": ["db.type:ref"]},
+    "2a2a9c4e-...": {"cft.seq:id": ["QA255-092.Vh"], "cft.seq:timepoint": ["5b0b3d4e-..."]},
+    ...
+    }
+
+This is still just JSON (TripleStore.load_file reads it as ever), but it can also be read a line at a time, and
+because of the ordering, any number of dumps can be merged or diffed in a single pass with bounded memory (entities
+sorting before the last schema entity are held back, on disk past a few MB, in case one is schema in another dump).
+Any other JSON EAV index can still be read here too, just not in bounded memory.
+"""
+
+import collections
+import heapq
+import itertools
+import json
+import pickle
+import tempfile
+
+from . import txlog
+from .index import as_values
+
+
+def _schema_attr(attr, ident_attr='db:ident'):
+    return attr != ident_attr and str(attr).split(':')[0].split('.')[0] == 'db'
+
+
+def schema_entity(attrs, ident_attr='db:ident'):
+    "Whether an entity (attribute dict) asserts schema; such entities sort first in dumps."
+    return any(vs and _schema_attr(a, ident_attr) for a, vs in attrs.items())
+
+
+def _entity_key(eid, attrs, ident_attr='db:ident'):
+    return (0 if schema_entity(attrs, ident_attr) else 1, eid)
+
+
+def index_entities(eav_index, ident_attr='db:ident'):
+    "Generate the (eid, {attr: [values]}) entries of an in memory eav index in dump order."
+    keys = sorted(_entity_key(eid, attrs, ident_attr) for eid, attrs in eav_index.items() if attrs)
+    for _, eid in keys:
+        attrs = eav_index.get(eid)
+        yield eid, dict((a, list(as_values(vs))) for a, vs in attrs.items())
+
+
+def write_entities(entities, fp, offsets=None):
+    """Write (eid, attrs) pairs, assumed to already be in dump order, to fp in the line per entity dump layout. With
+    offsets (a dict), the (offset, length) of each entity's line is recorded under its eid, for read_entity; JSON
+    output is ascii, so these are byte positions as much as character ones."""
+    fp.write('{\n')
+    position = 2
+    line = None
+    for eid, attrs in entities:
+        if line is not None:
+            fp.write(line + ',\n')
+            position += len(line) + 2
+        line = json.dumps(eid) + ': ' + json.dumps(attrs, default=list, sort_keys=True)
+        if offsets is not None:
+            offsets[eid] = (position, len(line))
+    if line is not None:
+        fp.write(line + '\n')
+    fp.write('}\n')
+
+
+def read_entity(fp, offset, length):
+    "The (eid, attrs) on the line at offset in a dump file (opened in binary mode), as recorded by write_entities."
+    fp.seek(offset)
+    (eid, attrs), = json.loads('{' + fp.read(length).decode('utf8') + '}').items()
+    return eid, attrs
+
+
+def read_entities(fp, ident_attr='db:ident'):
+    """Generate (eid, {attr: [values]}) pairs in dump order from a file object. Line per entity dumps are read a line
+    at a time; any other JSON EAV index is loaded whole and then sorted."""
+    first = fp.readline()
+    if first.strip() != '{':
+        index = json.loads(first + fp.read())
+        for entity in index_entities(index, ident_attr):
+            yield entity
+        return
+    last_key = None
+    for line in fp:
+        line = line.strip().rstrip(',')
+        if not line or line == '}':
+            continue
+        try:
+            (eid, attrs), = json.loads('{' + line + '}').items()
+        except ValueError:
+            raise ValueError("Not a line per entity trip dump (as written by dump_file): " + line[:80])
+        key = _entity_key(eid, attrs, ident_attr)
+        if last_key is not None and key < last_key:
+            raise ValueError("Entities out of order in trip dump at " + json.dumps(eid))
+        last_key = key
+        yield eid, attrs
+
+
+def _sections(entities, ident_attr):
+    "Split a stream in dump order into its schema entities (a list, schema being small) and an iterator of the rest."
+    entities = iter(entities)
+    schema = []
+    for eid, attrs in entities:
+        if not schema_entity(attrs, ident_attr):
+            return schema, itertools.chain([(eid, attrs)], entities)
+        schema.append((eid, attrs))
+    return schema, iter(())
+
+
+def _keyed(entities, i):
+    for eid, attrs in entities:
+        yield eid, i, attrs
+
+
+def _merged(streams):
+    # Merge streams of (eid, attrs) each in eid order, generating (eid, [(source, attrs) for each source having eid])
+    eid, group = None, []
+    for next_eid, i, attrs in heapq.merge(*[_keyed(entities, i) for i, entities in enumerate(streams)]):
+        if group and next_eid != eid:
+            yield eid, group
+            group = []
+        eid = next_eid
+        group.append((i, attrs))
+    if group:
+        yield eid, group
+
+
+# Rest entities held back while schema entities are completed are spilled to disk past this many bytes
+_spool_size = 1 << 23
+
+
+def _grouped(sources, ident_attr):
+    """Merge streams of (eid, attrs) in dump order, generating (eid, [(source, attrs) for each source having eid, in
+    order]), keyed on eid alone, so each eid comes out once: those which are schema entities in any source first,
+    then the rest, each in eid order."""
+    sections = [_sections(entities, ident_attr) for entities in sources]
+    schema = collections.OrderedDict(_merged([head for head, _ in sections]))
+    rest = _merged([tail for _, tail in sections])
+    if not schema or len(sections) == 1:
+        for item in itertools.chain(schema.items(), rest):
+            yield item
+        return
+    # An entity can be schema in one source but not another (say docs for an attribute with no schema in their
+    # dump), where it's further on; so rest entities up to the last schema eid are held until they're all complete
+    last = next(reversed(schema))
+    spool = tempfile.SpooledTemporaryFile(_spool_size)
+    try:
+        ahead = None
+        for eid, group in rest:
+            if eid > last:
+                ahead = (eid, group)
+                break
+            if eid in schema:
+                schema[eid] = sorted(schema[eid] + group, key=lambda part: part[0])
+            else:
+                pickle.dump((eid, group), spool, pickle.HIGHEST_PROTOCOL)
+        for item in schema.items():
+            yield item
+        spool.seek(0)
+        while True:
+            try:
+                yield pickle.load(spool)
+            except EOFError:
+                break
+        if ahead is not None:
+            yield ahead
+        for item in rest:
+            yield item
+    finally:
+        spool.close()
+
+
+class _Cardinalities(object):
+    "Tracks attribute cardinality from schema entities as they stream past (they come first)."
+
+    def __init__(self):
+        self.default = 'db.cardinality:many'
+        self.attrs = {}
+
+    def observe(self, eid, attrs):
+        if eid == 'db:schema' and attrs.get('db.cardinality:default'):
+            self.default = attrs['db.cardinality:default'][0]
+        if 'db:cardinality' in attrs or 'db:valueType' in attrs:
+            self.attrs[eid] = (attrs.get('db:cardinality') or [None])[0]
+
+    def one(self, attr):
+        if attr == 'db:cardinality':
+            return True
+        if attr not in self.attrs:
+            return False
+        return (self.attrs[attr] or self.default) == 'db.cardinality:one'
+
+
+def merge_entities(sources, ident_attr='db:ident'):
+    """Merge any number of (eid, attrs) streams in dump order (as from read_entities) into one, as assert_facts
+    would: values are unioned, except for cardinality one attributes, where later sources win."""
+    cardinalities = _Cardinalities()
+    for eid, group in _grouped(sources, ident_attr):
+        merged = {}
+        for _, attrs in group:
+            for a, vs in attrs.items():
+                if a in merged and not cardinalities.one(a):
+                    seen = set(merged[a])
+                    merged[a].extend(v for v in vs if v not in seen)
+                elif vs:
+                    merged[a] = list(vs)
+        cardinalities.observe(eid, merged)
+        yield eid, merged
+
+
+def diff_entities(old, new, ident_attr='db:ident'):
+    """Generate the (op, triple) changes taking (eid, attrs) stream old to new, both in dump order, where op is
+    txlog.ASSERT or txlog.RETRACT; the same form as a transaction log, so it can be replayed as one."""
+    for eid, group in _grouped([old, new], ident_attr):
+        old_attrs = group[0][1] if group[0][0] == 0 else {}
+        new_attrs = group[-1][1] if group[-1][0] == 1 else {}
+        for a in sorted(set(old_attrs) | set(new_attrs)):
+            old_vs = set(old_attrs.get(a, []))
+            new_vs = set(new_attrs.get(a, []))
+            for v in old_vs:
+                if v not in new_vs:
+                    yield txlog.RETRACT, (eid, a, v)
+            for v in new_vs:
+                if v not in old_vs:
+                    yield txlog.ASSERT, (eid, a, v)
+
+
+def write_changes(changes, fp):
+    "Write (op, triple) changes to fp in transaction log format."
+    for op, (e, a, v) in changes:
+        fp.write(json.dumps([op, e, a, v]) + '\n')
@@ -0,0 +1,121 @@
+"""
+Text search on string values, as pattern clauses alongside comparisons (see tripl.valuetypes):
+
+    ts.match_pattern({'cft.seq:description': {'text': 'ebola jena'}})    # has the words ebola and jena, in any case
+    ts.match_pattern({'cft.seq:path': {'contains': '/raw/'}})            # has /raw/ in it, in any case
+
+These scan by default. `ts.index_text(attr)` keeps an inverted index of the words in attr's values, which text
+clauses are answered from; `ts.index_text(attr, ngram=3)` also indexes every 3 character slice of the values, for
+contains clauses at least that long. Indexes are kept up to date as attr's triples are asserted and retracted, and
+give candidates, which are then checked against the clause, so results are always the same as a scan's.
+"""
+
+import re
+
+try:
+    _string_types = (str, unicode)
+except NameError:
+    _string_types = (str,)
+
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+
+def tokens(s):
+    "The (lower cased) words in s."
+    return set(word.lower() for word in _word.findall(s))
+
+
+def grams(s, n):
+    "The n character slices of s, lower cased."
+    s = s.lower()
+    return set(s[i:i + n] for i in range(len(s) - n + 1))
+
+
+def _text(v, query):
+    return isinstance(v, _string_types) and tokens(query) <= tokens(v)
+
+
+def _contains(v, query):
+    return isinstance(v, _string_types) and query.lower() in v.lower()
+
+
+# Clause operator -> predicate of a value and the clause's argument
+predicates = {'text': _text, 'contains': _contains}
+
+
+def _intersect(index, keys):
+    # The eids under every one of keys
+    sets = sorted((index.get(key, ()) for key in keys), key=len)
+    eids = set(sets[0])
+    for more in sets[1:]:
+        if not eids:
+            break
+        eids &= more
+    return eids
+
+
+def _discard(index, key, eid):
+    eids = index.get(key)
+    if eids is not None:
+        eids.discard(eid)
+        if not eids:
+            del index[key]
+
+
+class TextIndex(object):
+    "Word (and optionally n-gram) -> eids, for one attribute's string values."
+
+    def __init__(self, graph, attr, ngram=None):
+        self.attr = attr
+        self.ngram = ngram
+        self._tokens = {}
+        self._grams = {}
+        for e, entry in graph._eav_index.items():
+            for v in graph._values(e, attr):
+                self.add(e, v)
+
+    def _keys(self, v):
+        return tokens(v), grams(v, self.ngram) if self.ngram else ()
+
+    def add(self, e, v):
+        "Called once (e, attr, v) has been asserted."
+        if not isinstance(v, _string_types):
+            return
+        words, slices = self._keys(v)
+        for word in words:
+            self._tokens.setdefault(word, set()).add(e)
+        for piece in slices:
+            self._grams.setdefault(piece, set()).add(e)
+
+    def remove(self, e, v, remaining):
+        "Called once (e, attr, v) has been retracted, with e's remaining values; keys they still have are kept."
+        if not isinstance(v, _string_types):
+            return
+        words, slices = self._keys(v)
+        for x in remaining:
+            if isinstance(x, _string_types):
+                more_words, more_slices = self._keys(x)
+                words = words - more_words
+                slices = set(slices) - set(more_slices)
+        for word in words:
+            _discard(self._tokens, word, e)
+        for piece in slices:
+            _discard(self._grams, piece, e)
+
+    def search(self, clause):
+        """Candidate eids for the text predicates in a clause (every match among them), or None if the index can't
+        narrow things down (no text predicates, or contains shorter than the n-grams)."""
+        eids = None
+        for op, query in clause.items():
+            if op == 'text':
+                keys, index = tokens(query), self._tokens
+            elif op == 'contains' and self.ngram and len(query) >= self.ngram:
+                keys, index = grams(query, self.ngram), self._grams
+            else:
+                continue
+            if not keys:
+                continue
+            found = _intersect(index, keys)
+            eids = found if eids is None else eids & found
+        return eids
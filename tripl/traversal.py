@@ -0,0 +1,204 @@
+"""
+Graph traversal along ref attributes (see TripleStore.reachable, shortest_path, ancestors and descendants), for
+lineage questions without `'...'` recursive pulls:
+
+    ts.ancestors('person-1', 'person:parent')             # everyone person-1 descends from
+    ts.descendants('person-1', 'person:parent')           # and everyone descending from person-1
+    list(ts.reachable('sample-1', ['sample:source', 'sample:_derived_from'], order='dfs', max_depth=3))
+    ts.shortest_path('person-1', 'person-9', 'person:parent')
+
+Attributes are followed forward (e to its values) or, named `ns:_attr` as in pull, in reverse (through the vae index
+if the attribute is typed `db.type:ref`, otherwise with a scan, once per traversal).
+
+For attributes asked about over and over, `ts.cache_closure(attr)` keeps a Closure: for every entity, everything it
+reaches through attr and everything reaching it, updated as attr triples are asserted and retracted, so ancestors and
+descendants cost no more than the size of their answer. It can take a lot of memory for deep graphs (a chain of n
+entities has n * n / 2 pairs), so it's only kept for attributes you ask for.
+"""
+
+import collections
+
+from .index import get_values
+from .valuetypes import _string_types
+
+
+_no_attrs = {}
+_no_vals = frozenset()
+
+
+def _stepper(graph, attrs):
+    "A function from an eid to the eids one step on through any of attrs."
+    lock = graph._lock
+    if lock is None:
+        return _steps(graph, attrs)
+    # Traversals are generated lazily, so rather than hold the lock throughout, each step takes it; and copies its
+    # eids out, as they may be value sets a snapshot still shares with the live store
+    with lock.reading():
+        step = _steps(graph, attrs)
+
+    def locked(e):
+        with lock.reading():
+            return list(step(e))
+    return locked
+
+
+def _steps(graph, attrs):
+    from .tripl import reverse_lookup
+    steps = []
+    for attr in ([attrs] if isinstance(attrs, _string_types) else attrs):
+        reverse = reverse_lookup(attr)
+        if not reverse:
+            steps.append(lambda e, attr=attr: graph._values(e, attr))
+        elif graph._ref_attr(reverse):
+            steps.append(lambda e, attr=reverse: get_values(graph._vae_index.get(e, _no_attrs), attr))
+        else:
+            by_value = collections.defaultdict(list)
+            for e, entry in graph._eav_index.items():
+                for v in get_values(entry, reverse):
+                    by_value[v].append(e)
+            if graph.metrics is not None:
+                graph.metrics.count('index_scans')
+            steps.append(lambda e, by_value=by_value: by_value.get(e, ()))
+    if len(steps) == 1:
+        return steps[0]
+    return lambda e: [v for step in steps for v in step(e)]
+
+
+def reachable(graph, eid, attrs, order='bfs', max_depth=None):
+    "See TripleStore.reachable."
+    step = _stepper(graph, attrs)
+    if order == 'bfs':
+        seen = set([eid])
+        frontier = collections.deque([(eid, 0)])
+        while frontier:
+            e, depth = frontier.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for v in step(e):
+                if v not in seen:
+                    seen.add(v)
+                    yield v
+                    frontier.append((v, depth + 1))
+    else:
+        seen = set()
+        stack = [(eid, 0)]
+        while stack:
+            e, depth = stack.pop()
+            if e in seen:
+                continue
+            seen.add(e)
+            if e != eid:
+                yield e
+            if max_depth is None or depth < max_depth:
+                # Reversed, so the first step out is the first taken
+                stack.extend((v, depth + 1) for v in reversed(list(step(e))) if v not in seen)
+
+
+def shortest_path(graph, source, target, attrs):
+    "See TripleStore.shortest_path."
+    if source == target:
+        return [source]
+    step = _stepper(graph, attrs)
+    previous = {source: None}
+    frontier = collections.deque([source])
+    while frontier:
+        e = frontier.popleft()
+        for v in step(e):
+            if v in previous:
+                continue
+            previous[v] = e
+            if v == target:
+                path = [v]
+                while previous[path[-1]] is not None:
+                    path.append(previous[path[-1]])
+                path.reverse()
+                return path
+            frontier.append(v)
+    return None
+
+
+class Closure(object):
+    """The transitive closure of a ref attribute: for each entity, the entities it reaches following attr (up) and
+    the entities reaching it (down). Kept up to date by the store calling add and remove as attr triples are
+    asserted and retracted."""
+
+    def __init__(self, graph, attr):
+        self.graph = graph
+        self.attr = attr
+        self._up = {}
+        self._down = {}
+        edges = {}
+        for e, entry in graph._eav_index.items():
+            vs = get_values(entry, attr)
+            if vs:
+                edges[e] = list(vs)
+        # Edges are added in depth first post order, so whatever an edge leads to is already closed, and nothing
+        # reaches where it's from yet; so each add costs about the size of its answer (any order would be correct)
+        done = set()
+        for root in edges:
+            if root in done:
+                continue
+            done.add(root)
+            stack = [(root, iter(edges[root]))]
+            while stack:
+                e, vs = stack[-1]
+                for v in vs:
+                    if v not in done:
+                        done.add(v)
+                        stack.append((v, iter(edges.get(v, ()))))
+                        break
+                else:
+                    stack.pop()
+                    for v in edges.get(e, ()):
+                        self.add(e, v)
+
+    # Entities on a cycle reach themselves, which add and remove rely on; but like reachable, answers leave the
+    # entity asked about out
+
+    def ancestors(self, eid):
+        up = self._up.get(eid, _no_vals)
+        return up - set([eid]) if eid in up else up
+
+    def descendants(self, eid):
+        down = self._down.get(eid, _no_vals)
+        return down - set([eid]) if eid in down else down
+
+    def add(self, e, v):
+        "Called once (e, attr, v) has been asserted: whatever reaches e (and e) now reaches v and all v reaches."
+        targets = set(self._up.get(v, _no_vals))
+        targets.add(v)
+        sources = list(self._down.get(e, _no_vals))
+        sources.append(e)
+        for x in sources:
+            up = self._up.setdefault(x, set())
+            new = targets - up
+            if new:
+                up |= new
+                for y in new:
+                    self._down.setdefault(y, set()).add(x)
+
+    def remove(self, e, v):
+        """Called once (e, attr, v) has been retracted. Only what reached e can have lost anything, so just their
+        closures are recomputed (by walking forward from each), and dropped pairs unlinked from the other side."""
+        sources = list(self._down.get(e, _no_vals))
+        sources.append(e)
+        for x in sources:
+            old = self._up.pop(x, _no_vals)
+            new = self._reach(x)
+            if new:
+                self._up[x] = new
+            for y in old - new:
+                down = self._down[y]
+                down.discard(x)
+                if not down:
+                    del self._down[y]
+
+    def _reach(self, x):
+        # Everything x reaches; x included, if a cycle leads back to it (as add has it)
+        up, frontier = set(), [x]
+        while frontier:
+            for v in self.graph._values(frontier.pop(), self.attr):
+                if v not in up:
+                    up.add(v)
+                    frontier.append(v)
+        return up
@@ -18,6 +18,25 @@ import uuid
 import json
 import pprint
 import copy
+import os
+import weakref
+import contextlib
+import itertools
+import numbers
+
+from . import txlog
+from .index import TripleIndex, as_values, get_values, _no_vals
+from . import stream
+from . import explain
+from . import aggregate as _aggregate
+from . import traversal
+from . import text
+from . import feeds
+from . import parallel
+from . import stats
+from . import valuetypes
+from .locks import RWLock, reads, writes
+from .metrics import Metrics, timed, _clock
 
 
 # Util
@@ -33,51 +52,114 @@ def log(name, value):
 # Now for the code:
 # =================
 
-def _triple_index(vals_container=set):
-    return collections.defaultdict(lambda: collections.defaultdict(vals_container))
+# For each index order, the positions of e, a and v in its paths
+_index_orders = {'eav': (0, 1, 2), 'vae': (2, 1, 0), 'ave': (2, 0, 1)}
+
+
+def _order_key(x):
+    # Numbers first, then everything else by type; so mixed type index components still sort under python 3
+    if isinstance(x, numbers.Number):
+        return (0, '', x)
+    return (1, type(x).__name__, x)
+
+
+def _in_range(x, start, end):
+    key = _order_key(x)
+    return (start is None or key >= _order_key(start)) and (end is None or key < _order_key(end))
+
+
+def _present(sub, depth):
+    # Entries are dicts (empty is as good as missing); values may be bare, and falsy
+    return sub is not None if depth else bool(sub)
+
+
+def _walk_index(level, prefix, start=None, end=None, depth=0):
+    """Generate the paths (as tuples of keys) through an index level (the index, an entry, or values at depth 2) in
+    order, under prefix, with the first component past the prefix in [start, end)."""
+    leaf = depth == 2
+    if prefix:
+        head = prefix[0]
+        if leaf:
+            keys = [head] if head in level else []
+        else:
+            keys = [head] if _present(level.get(head), depth) else []
+    else:
+        keys = [k for k in (level if leaf else level.keys())
+                if (start is None and end is None) or _in_range(k, start, end)]
+        keys.sort(key=_order_key)
+        start = end = None
+    for key in keys:
+        if leaf:
+            yield (key,)
+        else:
+            sub = level.get(key)
+            if not _present(sub, depth):
+                continue
+            if depth == 1:
+                sub = as_values(sub)
+            for rest in _walk_index(sub, prefix[1:], start, end, depth + 1):
+                yield (key,) + rest
+
+
+_no_attrs = {}
 
 
-# Would be great to implement something analagous to the entity API, but would need to have schema I think
-# to traverse the references
 class Entity(object):
+    """A read only, dict like view of an entity, which updates as the store does. Ref attributes (typed, or with
+    lazy_refs, values which are themselves eids) navigate to Entities, as do reverse `ns:_attr` lookups (through the
+    vae index when the attribute is typed as a ref). Get these from TripleStore.entity, which hands back the same
+    Entity for an eid for as long as it's referenced anywhere, rather than constructing them directly."""
+
+    __slots__ = ('graph', 'eid', '__weakref__')
+
     def __init__(self, graph, eid):
         self.graph = graph
         self.eid = eid
-        self._entity = graph._eav_index[eid]
+
+    @property
+    def _entity(self):
+        # Looked up on each access (without materializing anything), so the view stays live
+        return self.graph._eav_index.get(self.eid, _no_attrs)
 
     def __getitem__(self, key):
-        # This is really the only magic to this object, over just looking at the EAV index
-        # Should probably have these globally cached or something, so we don't create dups?
-        # lazy_ref means that we allow you to infer relationships without assigning a reference type
-        if self.graph._ref_attr(key) or (self.graph.lazy_refs and self.graph._eav_index[key]):
-            return type(self)(self.graph, self.eid)
-        if str(key).split(':')[-1][0:1] == '_':
-            namespace, name = key.split(':')
-            name = name[1:]
-            key = namespace + ':' + name
-            if self.graph._ref_attr(key):
-                return list(type(self)(self.graph, v) for v in self.graph._vae_index[self.eid][key])
+        graph = self.graph
+        reverse = reverse_lookup(key)
+        if reverse:
+            if graph._ref_attr(reverse):
+                eids = get_values(graph._vae_index.get(self.eid, _no_attrs), reverse)
+            elif graph.lazy_refs:
+                eids = [e for e, attrs in graph._eav_index.items() if self.eid in get_values(attrs, reverse)]
             else:
-                # reverse lookups only supported currently with ref typing; need to generalize to do a scan if
-                # graph.lazy_refs is truthy; TODO
-                return []
-        else:
-            return self._entity[key]
+                eids = _no_vals
+            return [graph.entity(e) for e in eids]
+        values = get_values(self._entity, key)
+        if values and (graph._ref_attr(key) or
+                       (graph.lazy_refs and key != graph.ident_attr and all(v in graph._eav_index for v in values))):
+            if graph._card_one(key):
+                return graph.entity(some(values))
+            return [graph.entity(v) for v in values]
+        # A copy, as pull hands back: the index's own values may be a bare value, a tuple, or the live set itself
+        return set(values)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
 
     def __contains__(self, key):
-        if key in self._entity:
-            return True
-        else:
-            if str(key).split(':')[-1][0:1] == '_':
-                key = key.replace('_', '')
-                return self.graph._ref_attr(key)
+        if reverse_lookup(key):
+            return bool(self[key])
+        return key in self._entity
 
+    def __iter__(self):
+        return iter(self.keys())
 
     def __len__(self):
-        return len(self._entity)
+        return len(self.keys())
 
     def keys(self):
-        return self._entity.keys()
+        return list(self._entity.keys())
+
+    def __repr__(self):
+        return 'Entity(%r)' % (self.eid,)
 
 
 def reverse_lookup(attr_name):
@@ -117,30 +199,74 @@ def some(xs, default=None):
 
 
 class TripleStore(object):
-    def __init__(self, schema=None, facts=None, lazy_refs=None, default_cardinality=None, types=None, ident_attr="db:ident"):
+    # Set (on a snapshot) by explain, to collect the steps pull takes
+    _plan = None
+
+    def __init__(self, schema=None, facts=None, lazy_refs=None, default_cardinality=None, types=None, ident_attr="db:ident",
+                 thread_safe=False, storage=None):
         """Construct a new TripleStore instance, with the optional facts attribute asserted as via
         assert_facts. The schema can be specified by the facts data, by the schema attribute, and by the
         global default setting kw attrs in this signature, and precedence is taken in that order.
 
         * 
         
-        The schema dict should map attribute names to schema attributes (`db:cardinality` and
-        `db:valueType: db.type:ref` only for the moment), and should not be updated once set (for now at
-        least). Additional options are:
+        The schema dict should map attribute names to schema attributes (`db:cardinality` and `db:valueType`,
+        either `db.type:ref` or one of the scalar types in tripl.valuetypes), and should not be updated once set
+        (for now at least). Additional options are:
+
+        * thread_safe: guard the store with a reader-writer lock, so that any number of threads can query it
+          (pull, pull_many, match_pattern, ...) while another asserts or retracts facts. Each pull sees either all
+          or none of a given assert/retract call; for a consistent view across a whole pull_many, query a snapshot.
+        * storage: keep the indexes in a storage backend (e.g. tripl.storage.SQLiteStorage), rather than in memory.
+          Facts already in the storage are picked up, schema included.
             """
         # 1. Load all facts, which may include schema
         #
         # Start by assuming everything cardinality many with lazy refs, to load everything without conflict
         self.default_cardinality = 'db.cardinality:many'
         self.lazy_refs = True
+        # No transaction log until one is attached (see open); nothing asserted during construction gets logged
+        self._txlog = None
+        self._snapshot_file = None
+        self.compact_every = None
+        # Live snapshots, which need entities preserved before we write to them
+        self._snapshots = weakref.WeakSet()
+        self._lock = RWLock() if thread_safe else None
+        # Off until instrument is called
+        self.metrics = None
+        # eid -> Entity, for as long as something else holds on to it
+        self._entities = weakref.WeakValueDictionary()
+        # A feeds.ChangeFeed, once anything subscribes
+        self._feed = None
+        # attr -> valuetypes.Column, built as comparisons on typed attributes need them, and kept sorted on writes
+        self._columns = {}
+        # attr -> traversal.Closure, for the attributes cache_closure was called for
+        self._closures = {}
+        # attr -> text.TextIndex, for the attributes index_text was called for
+        self._text_indexes = {}
         # Set up index
-        self._eav_index = _triple_index(vals_container=set)
-        self._vae_index = _triple_index(vals_container=set)
+        self._storage = storage
+        if storage is None:
+            self._eav_index = TripleIndex()
+            self._vae_index = TripleIndex()
+            # attr -> stats.AttrStats, kept up to date by _assert_triple and _retract_triple
+            self._stats = collections.defaultdict(stats.AttrStats)
+        else:
+            self._eav_index = storage.eav
+            self._vae_index = storage.vae
+            self._stats = storage.stats
+            # For counting cache hits and misses into our metrics
+            storage._graph = weakref.ref(self)
         # This must be statically set for now? Should check compatibility with facts?
         self.ident_attr = ident_attr
+        if facts is not None and not isinstance(facts, (dict, list, tuple, TripleStore, _FrozenIndex)):
+            # Gets iterated twice below
+            facts = list(facts)
         self.assert_facts(base_schema(self.ident_attr))
+        # Just the schema facts (those asserting db namespace attributes) to begin with, so that the data can be
+        # asserted once, with cardinality and ref typing already in place
         if facts:
-            self.assert_facts(facts)
+            self.assert_facts(self._schema_facts(facts))
 
         # 2. Load schema, if specified
         if schema:
@@ -164,24 +290,98 @@ class TripleStore(object):
         # Should probably eventually be able to specify vals container, primary key strategy, etc.;
         self.types = types
         # other indices to follow possibly; well see what DS does
-        # Reload facts to flush out indices, constraints, etc. (will this be safe?)
+        # Now everything (schema facts again included, so their values take precedence as they always have)
         if facts:
             self.assert_facts(facts)
 
+    def _schema_facts(self, facts):
+        "The facts (in the same form, index or list) which assert schema."
+        if isinstance(facts, TripleStore):
+            facts = facts._eav_index
+        if isinstance(facts, (dict, _FrozenIndex)):
+            return dict((e, attrs) for e, attrs in facts.items() if stream.schema_entity(attrs, self.ident_attr))
+        return [fact for fact in facts if self._schema_fact(fact)]
+
+    def _schema_fact(self, fact):
+        if not isinstance(fact, dict):
+            return stream._schema_attr(fact[1], self.ident_attr)
+        for a, vs in fact.items():
+            # (cheap test first; this runs over every fact)
+            if str(a).startswith('db') and stream._schema_attr(a, self.ident_attr):
+                return True
+            if isinstance(vs, list):
+                if any(isinstance(v, dict) and self._schema_fact(v) for v in vs):
+                    return True
+            elif isinstance(vs, dict) and self._schema_fact(vs):
+                return True
+        return False
+
     # This could get rather interesting...
     # Only semi-public for the moment
 
+    @reads
     def entity(self, eid):
-        "Return a read only entity dict representation for a given eid."
-        return Entity(self, eid)
+        """Return a read only entity dict representation for a given eid (or the first entity matching a pattern
+        dict). There's only ever one live Entity per eid per store, so repeat lookups and ref navigation don't
+        allocate duplicates."""
+        if isinstance(eid, dict):
+            eid = some(self.match_pattern(eid))
+        entity = self._entities.get(eid)
+        if self.metrics is not None:
+            self.metrics.count('cache_misses' if entity is None else 'cache_hits')
+        if entity is None:
+            entity = self._entities[eid] = Entity(self, eid)
+        return entity
 
     def entities(self, eids):
         return map(self.entity, eids)
 
-    # Should define triples iterator
-    # Define write to file
+    def datoms(self, index='eav', prefix=(), start=None, end=None):
+        """Generate the store's (e, a, v) triples lazily, in the order of index: 'eav' (by entity, attribute, value),
+        'vae' (by value, attribute, entity; only covers ref typed attributes, as that's all the vae index holds) or
+        'ave' (by attribute, value, entity). prefix fixes the leading components in index order (e.g.
+        `datoms('vae', (eid,))` for everything referring to eid), and start/end bound the next component to the
+        range [start, end). Components order numbers first, then everything else by type and value.
+
+        Each level of the index is sorted as it's reached, so nothing is materialized up front. There's no ave index
+        though; 'ave' builds one for the attribute in prefix (or for all attributes) with a scan, and holds it for
+        the duration. Writes while iterating may or may not show up; iterate over a snapshot for a consistent view
+        (which thread safe stores do for you)."""
+        if index not in _index_orders:
+            raise ValueError("index must be one of %s" % ', '.join(sorted(_index_orders)))
+        return self._datoms(index, tuple(prefix), start, end)
+
+    def _datoms(self, index, prefix, start, end):
+        graph = self.snapshot() if self._lock is not None else self
+        if index == 'eav':
+            level = graph._eav_index
+        elif index == 'vae':
+            level = graph._vae_index
+        else:
+            level = graph._ave_index(prefix[0] if prefix else None)
+        if graph._lock is not None and index != 'ave':
+            # The snapshot still shares entries the live store hasn't written to yet, which it may while we yield
+            level = _LockedIndex(level, graph._lock)
+        order = _index_orders[index]
+        for path in _walk_index(level, prefix, start, end):
+            yield tuple(path[i] for i in order)
+
+    @reads
+    def _ave_index(self, attr=None):
+        # Built on the fly for datoms, for attr or everything
+        index = TripleIndex()
+        for e, attrs in self._eav_index.items():
+            if attr is None:
+                for a, vs in attrs.items():
+                    for v in as_values(vs):
+                        index.add(a, v, e)
+            else:
+                for v in get_values(attrs, attr):
+                    index.add(attr, v, e)
+        return index
 
 
+    @writes
     def assert_schema(self, schema):
         def attr_entity(attr, attr_schema):
             attr_schema = copy.deepcopy(attr_schema)
@@ -193,30 +393,35 @@ class TripleStore(object):
                                     for attr, attr_schema in schema.items()]})
         return eid
 
+    @reads
     def schema(self, attr=None, meta_attr=None):
         if attr and meta_attr:
-            # This could be optimized
-            #return some(self.schema(attr).get(meta_attr))
-            return self._eav_index[attr][meta_attr]
+            return set(self._values(attr, meta_attr))
         elif attr:
             # Could work to get the cards right here
-            return dict(self._eav_index[attr])
+            return {a: set(as_values(vs)) for a, vs in self._eav_index.get(attr, _no_attrs).items()}
         else:
-            return [self.schema(a) for a in self._eav_index['db:schema']['db:attributes']]
+            return [self.schema(a) for a in self._values('db:schema', 'db:attributes')]
 
 
     # Some implementation details:
 
+    # These are hit for every triple asserted and every attribute pulled, so read straight off the index rather
+    # than through schema (which copies)
+
     def _attr_cardinality(self, attr):
-        attr_schema = self.schema(attr)
+        if self.metrics is not None:
+            self.metrics.count('schema_lookups')
+        attr_schema = self._eav_index.get(attr)
         if attr_schema:
-            return some(attr_schema.get('db:cardinality', [self.default_cardinality]))
+            return some(get_values(attr_schema, 'db:cardinality') or [self.default_cardinality])
 
     def _attr_type(self, attr):
-        attr_schema = self.schema(attr)
+        if self.metrics is not None:
+            self.metrics.count('schema_lookups')
+        attr_schema = self._eav_index.get(attr)
         if attr_schema:
-            schema = attr_schema.get('db:valueType')
-            return some(schema) if schema else None
+            return some(get_values(attr_schema, 'db:valueType'))
 
     def _ref_attr(self, attr):
         lookup = reverse_lookup(attr)
@@ -237,28 +442,137 @@ class TripleStore(object):
         else:
             return self._attr_cardinality(attr) == 'db.cardinality:one'
 
+    @reads
+    def stats(self, attr=None):
+        """Statistics for each attribute: the number of triples, of entities with a value, of distinct values, the
+        max and average number of values per entity, and a histogram of value types (see tripl.stats). Maintained as
+        facts are asserted and retracted, so this doesn't walk the index. Returns {attr: stats}, or just attr's
+        stats (None if it has no values)."""
+        attr_stats = self._attr_stats()
+        if attr:
+            one = attr_stats.get(attr)
+            return one.as_dict() if one and one.triples else None
+        return dict((a, s.as_dict()) for a, s in attr_stats.items() if s.triples)
+
+    def _attr_stats(self):
+        return self._stats
+
+    def _values(self, e, a):
+        "The values of a for e (see tripl.index for how they're stored)."
+        return get_values(self._eav_index.get(e, _no_attrs), a)
+
+    def _preserve(self, e=None, v=None):
+        "Copy the pre-write state of eav entry e and vae entry v into any live snapshots which don't have it yet."
+        for snapshot in self._snapshots:
+            snapshot._preserve(e, v)
+
     def _assert_triple(self, triple):
         e, a, v = triple
+        value_type = self._attr_type(a)
+        if value_type in valuetypes.coercers:
+            v = valuetypes.coerce(value_type, v, a)
         # First if cardinality one, remove any other values
-        if self._card_one(a) and self._eav_index[e][a]:
-            for x in self._eav_index[e][a]:
+        if self._card_one(a) and self._values(e, a):
+            for x in list(self._values(e, a)):
                 if x != v:
-                    self._retract_triple(self, (e, a, x))
+                    self._retract_triple((e, a, x))
+        ref = self._ref_attr(a)
+        if v in self._values(e, a):
+            # Already asserted, so nothing to log; but the attribute may have been typed as a ref since
+            if ref and e not in get_values(self._vae_index.get(v, _no_attrs), a):
+                if self._snapshots:
+                    self._preserve(None, v)
+                self._index_ref(e, a, v)
+            return
+        if self._snapshots:
+            self._preserve(e, v if ref else None)
+        if self._columns:
+            self._update_columns(e, a, v, True)
         # Add the canonical eav index
-        self._eav_index[e][a].add(v)
-        if self._ref_attr(a):
-            self._vae_index[v][a].add(e)
-        # And a lazy index of 
+        self._stats[a].add(v, self._eav_index.add(e, a, v))
+        if ref:
+            self._index_ref(e, a, v)
+        if self._closures and a in self._closures:
+            self._closures[a].add(e, v)
+        if self._text_indexes and a in self._text_indexes:
+            self._text_indexes[a].add(e, v)
+        if self._txlog:
+            self._txlog.append(txlog.ASSERT, (e, a, v))
+        if self._feed is not None:
+            self._feed.record(txlog.ASSERT, (e, a, v))
+        if self.metrics is not None:
+            self.metrics.count('triples_asserted')
 
     def _retract_triple(self, triple):
         e, a, v = triple
-        # Have to be careful here; remove only removes the first entry; Should just be using sets
-        self._eav_index[e][a].remove(v)
-        reverse_index = self._vae_index[v]
-        if reverse_index:
-            reverse_attr_index = reverse_index[a]
-            if reverse_attr_index and e in reverse_attr_index:
-                reverse_attr_index.remove(e)
+        values = self._values(e, a)
+        value_type = self._attr_type(a)
+        if value_type in valuetypes.coercers:
+            try:
+                coerced = valuetypes.coerce(value_type, v, a)
+            except ValueError:
+                coerced = v
+            # Values asserted before the attribute was typed are kept as they were given
+            if coerced in values or v not in values:
+                v = coerced
+        # Retracting something that isn't there is a no-op (makes log replay idempotent)
+        if v not in values:
+            return
+        if self._snapshots:
+            self._preserve(e, v)
+        if self._columns:
+            self._update_columns(e, a, v, False)
+        self._stats[a].remove(v, self._eav_index.remove(e, a, v))
+        self._unindex_ref(e, a, v)
+        if self._closures and a in self._closures:
+            self._closures[a].remove(e, v)
+        if self._text_indexes and a in self._text_indexes:
+            self._text_indexes[a].remove(e, v, self._values(e, a))
+        if self._txlog:
+            self._txlog.append(txlog.RETRACT, (e, a, v))
+        if self._feed is not None:
+            self._feed.record(txlog.RETRACT, (e, a, v))
+        if self.metrics is not None:
+            self.metrics.count('triples_retracted')
+
+    def _update_columns(self, e, a, v, added):
+        # Columns are kept sorted through writes (at the cost of a memmove of the arrays), rather than rebuilt with a
+        # scan by the next comparison after each; but dropped when their attribute is retyped (e is the attribute)
+        self._columns.pop(e, None)
+        column = self._columns.get(a)
+        if column is None:
+            return
+        try:
+            if added:
+                column.add(v, e)
+            else:
+                column.remove(v, e)
+        except OverflowError:
+            # Too big for the array; the rebuilt column falls back to a list
+            del self._columns[a]
+
+    def _column(self, attr, build=True):
+        "The valuetypes.Column for a typed attribute (built with a scan, unless build is False), or None."
+        column = self._columns.get(attr)
+        if column is None and build:
+            value_type = self._attr_type(attr)
+            if value_type in valuetypes.coercers:
+                if self.metrics is not None:
+                    self.metrics.count('cache_misses')
+                column = self._columns[attr] = valuetypes.Column(
+                    value_type, ((v, e) for e, attrs in self._eav_index.items() for v in get_values(attrs, attr)))
+        elif build and self.metrics is not None:
+            self.metrics.count('cache_hits')
+        return column
+
+    # The vae half of indexing a triple; split out so a store can keep that index elsewhere (see shard)
+
+    def _index_ref(self, e, a, v):
+        self._vae_index.add(v, a, e)
+
+    def _unindex_ref(self, e, a, v):
+        if e in get_values(self._vae_index.get(v, _no_attrs), a):
+            self._vae_index.remove(v, a, e)
 
 
     # Should the following two be public?
@@ -321,6 +635,8 @@ class TripleStore(object):
 
     # Our public API for asserting and retracting facts
 
+    @writes
+    @timed('assert_fact')
     def assert_fact(self, fact, id_attrs=None, _ids=None):
         """Assert fact about an entity as a dict or as a single eav triple. Dictionaries are interpretted as a set of eav triples
         where e is a unique identitier for the entity (uuid, globally namespaced keyword, web url,
@@ -328,30 +644,256 @@ class TripleStore(object):
         The a, v components of the triples for such an e correspond with the key value pairs of the map.
         The vals of the dictionary should be a single value, or list of values for db.cardinality:many
         attributes. Identity attr can be set on graph instantiation."""
+        eid = self._assert_fact(fact, id_attrs=id_attrs, _ids=_ids)
+        self._commit()
+        return eid
+
+    def _assert_fact(self, fact, id_attrs=None, _ids=None):
         if isinstance(fact, dict):
             # Returns eid
             return self._assert_dict(fact, id_attrs=id_attrs, _ids=_ids)
         else:
             self._assert_triple(fact)
 
+    @writes
+    @timed('assert_facts')
     def assert_facts(self, facts, id_attrs=None, _ids=None):
         """As with assert_fact, except asserts either a collection of facts via assert_fact, or if passed a
         dictionary, interprets as a eav index to merge in. If passed in another TripleStore, interprets as
         it's eav index, thereby merging the graphs :-)"""
-        if isinstance(facts, dict):
+        if isinstance(facts, TripleStore):
+            # TODO; think about what id_attrs might mean here
+            facts = facts._eav_index
+        if isinstance(facts, (dict, _FrozenIndex)):
             # Then merge as an eav index of values
             for e, d in facts.items():
                 for a, vs in d.items():
-                    for v in vs:
+                    for v in as_values(vs):
                         # May be more lookup time than if we look up and remember the nested dicts as we go
-                        self.assert_fact((e, a, v))
-        elif isinstance(facts, TripleStore):
-            # TODO; think about what id_attrs might mean here
-            self.assert_facts(facts._eav_index)
+                        self._assert_triple((e, a, v))
         else:
             _ids = _ids or collections.defaultdict(dict)
             for fact in facts:
-                self.assert_fact(fact, id_attrs=id_attrs, _ids=_ids)
+                self._assert_fact(fact, id_attrs=id_attrs, _ids=_ids)
+        # One log flush for the whole batch
+        self._commit()
+
+    @writes
+    def retract_fact(self, triple):
+        "Retract a single eav triple. Retracting a triple which isn't in the store is a no-op."
+        self._retract_triple(triple)
+        self._commit()
+
+    @writes
+    @timed('retract_facts')
+    def retract_facts(self, triples):
+        "As with retract_fact, for a collection of eav triples."
+        for triple in triples:
+            self._retract_triple(triple)
+        self._commit()
+
+    @writes
+    @timed('apply_changes')
+    def apply_changes(self, changes):
+        """Apply a sequence of (op, triple) changes, where op is '+' to assert and '-' to retract; as produced by
+        diff_changes, stream.diff_entities (trip diff) or read from a transaction log."""
+        for op, triple in changes:
+            if op == txlog.ASSERT:
+                self._assert_triple(triple)
+            else:
+                self._retract_triple(triple)
+        self._commit()
+
+
+    # Persistence via snapshot + transaction log
+
+    @classmethod
+    def open(cls, filename, log_filename=None, compact_every=None, sync=False, schema=None, thread_safe=False):
+        """Open a durable store backed by the snapshot at filename (as written by dump_file, if it exists yet) and
+        the append-only transaction log at log_filename (filename + '.log' by default). The log is replayed over the
+        snapshot, and from then on every asserted and retracted triple is appended to it, so writes cost O(delta)
+        rather than a full dump. With compact_every=n, the log is folded into a new snapshot once it holds n
+        entries; otherwise call compact yourself. With sync=True the log is fsynced after every write call."""
+        if os.path.exists(filename):
+            graph = cls.load_file(filename, schema=schema)
+        else:
+            graph = cls(schema=schema)
+        log_filename = log_filename or filename + '.log'
+        graph.apply_changes(txlog.read_log(log_filename))
+        graph._snapshot_file = filename
+        graph._txlog = txlog.TxLog(log_filename, sync=sync)
+        graph.compact_every = compact_every
+        if thread_safe:
+            graph._lock = RWLock()
+        return graph
+
+    @writes
+    @timed('compact')
+    def compact(self):
+        "Write a fresh snapshot of the store and truncate the transaction log."
+        if not self._txlog:
+            raise ValueError("compact requires a store opened with TripleStore.open")
+        # Snapshot is swapped in atomically before the log is dropped; if we crash in between, replaying the
+        # log over the new snapshot is harmless since replay is idempotent
+        self._txlog.flush()
+        txlog.write_snapshot(self, self._snapshot_file)
+        self._txlog.truncate()
+
+    @writes
+    def close(self):
+        "Flush and close the transaction log and storage, if any."
+        if self._txlog:
+            self._txlog.close()
+            self._txlog = None
+        if self._storage is not None:
+            self._storage.close()
+            self._storage = None
+
+    @reads
+    def instrument(self, metrics=None):
+        """Start collecting counts and timings of this store's operations into metrics (a fresh tripl.metrics.Metrics
+        by default), and return it. See tripl.metrics for what's collected. ts.metrics = None turns it back off."""
+        self.metrics = metrics or Metrics()
+        return self.metrics
+
+    @contextlib.contextmanager
+    def trace(self, max_spans=10000):
+        """Capture a tripl.metrics.Trace of the operations run on this store within the with block (instrumenting
+        the store just for the duration, if it isn't already)."""
+        instrumented = self.metrics is not None
+        store_metrics = self.metrics if instrumented else self.instrument()
+        try:
+            with store_metrics.trace(max_spans) as trace:
+                yield trace
+        finally:
+            if not instrumented:
+                self.metrics = None
+
+    @writes
+    def subscribe(self, listener, attrs=None, pattern=None):
+        """Call listener(added, retracted) with the (e, a, v) triples each write call (assert_facts, retract_facts,
+        ...) adds and retracts: of the given attrs, of entities matching pattern (before or after the write), or if
+        neither, everything. Listeners run in the writing thread, once the write has been applied (and logged, with
+        a transaction log); they may query the store. Patterns take the same clauses as match_pattern, comparisons
+        and text predicates included. Returns a tripl.feeds.Subscription, for unsubscribe."""
+        if pattern:
+            pattern = self._coerce_pattern(pattern)
+        if self._feed is None:
+            self._feed = feeds.ChangeFeed()
+        return self._feed.subscribe(feeds.Subscription(listener, attrs, pattern))
+
+    @writes
+    def unsubscribe(self, subscription):
+        self._feed.unsubscribe(subscription)
+        if not self._feed:
+            # Back to not collecting changes at all
+            self._feed = None
+
+    def aggregate(self, aggregates, pattern=None, group_by=None):
+        """Compute aggregates ({name: function or (function, attr)}, with function one of count, count_distinct,
+        min, max and sum) over the entities matching pattern (or all of them), straight off the indexes; see
+        tripl.aggregate. Returns {name: result}, or with group_by an attribute, generates (value, {name: result})
+        for each of its values in order, a group at a time (thread safe stores work them all out up front)."""
+        if self._lock is None:
+            return _aggregate.aggregate(self, aggregates, pattern, group_by)
+        # Rather than hold the lock across yields, groups are worked out under it before any are generated
+        with self._lock.reading():
+            results = _aggregate.aggregate(self, aggregates, pattern, group_by)
+            return results if group_by is None else iter(list(results))
+
+    def reachable(self, eid, attrs, order='bfs', max_depth=None):
+        """Generate the eids reachable from eid following attrs (an attribute or list of them; `ns:_attr` follows
+        attr in reverse), breadth first ('bfs') or depth first ('dfs'), each once, up to max_depth steps out. The
+        start isn't included. See tripl.traversal."""
+        if order not in ('bfs', 'dfs'):
+            raise ValueError("order must be 'bfs' or 'dfs'")
+        graph = self.snapshot() if self._lock is not None else self
+        return traversal.reachable(graph, eid, attrs, order, max_depth)
+
+    @reads
+    def shortest_path(self, source, target, attrs):
+        "The eids along a shortest path from source to target following attrs (as for reachable), or None."
+        return traversal.shortest_path(self, source, target, attrs)
+
+    @reads
+    def ancestors(self, eid, attr):
+        """The set of eids reachable from eid following attr (e.g. everyone a person descends from through
+        person:parent); from the attribute's closure cache, if there is one."""
+        closure = self._closures.get(attr)
+        if self.metrics is not None:
+            self.metrics.count('cache_misses' if closure is None else 'cache_hits')
+        if closure is not None:
+            return set(closure.ancestors(eid))
+        return set(traversal.reachable(self, eid, attr))
+
+    @reads
+    def descendants(self, eid, attr):
+        "The set of eids from which eid can be reached following attr; the reverse of ancestors."
+        closure = self._closures.get(attr)
+        if self.metrics is not None:
+            self.metrics.count('cache_misses' if closure is None else 'cache_hits')
+        if closure is not None:
+            return set(closure.descendants(eid))
+        return set(traversal.reachable(self, eid, self._reverse_attr(attr)))
+
+    def _reverse_attr(self, attr):
+        ns, name = attr.rsplit(':', 1)
+        return ns + ':_' + name
+
+    @writes
+    def cache_closure(self, attr):
+        """Keep the transitive closure of ref attribute attr from now on (see traversal.Closure), so ancestors and
+        descendants through it cost no more than their answers. Builds it with a scan."""
+        if reverse_lookup(attr):
+            raise ValueError("cache_closure takes a forward attribute, not %s" % attr)
+        if attr not in self._closures:
+            self._closures[attr] = traversal.Closure(self, attr)
+
+    @writes
+    def drop_closure(self, attr):
+        "Stop keeping attr's closure."
+        self._closures.pop(attr, None)
+
+    @writes
+    def index_text(self, attr, ngram=None):
+        """Keep an inverted index of the words in attr's string values from now on (and of their ngram character
+        slices, if given), which `{'text': ...}` (and `{'contains': ...}`) pattern clauses are answered from rather
+        than by scanning; see tripl.text. Builds it with a scan."""
+        text_index = self._text_indexes.get(attr)
+        if text_index is None or text_index.ngram != ngram:
+            self._text_indexes[attr] = text.TextIndex(self, attr, ngram)
+
+    @writes
+    def drop_text_index(self, attr):
+        "Stop keeping attr's text index."
+        self._text_indexes.pop(attr, None)
+
+    def explain(self, eids_or_pattern, pull_expr=None):
+        """Run match_pattern(eids_or_pattern) (if it's a pattern dict) and pull_many(pull_expr, eids_or_pattern) (if
+        pull_expr is given) against a snapshot of the store, holding its read lock, and return a tripl.explain.Plan of
+        how they were answered: the index used for each pattern clause and ref followed, estimated vs actual
+        candidates, whether reverse lookups had to fall back to full scans, and timings for each step. print() it for
+        a table."""
+        return explain.explain(self, eids_or_pattern, pull_expr)
+
+    @reads
+    def snapshot(self):
+        """Return a read only Snapshot of the store as it stands right now, which pull, pull_many, match_pattern,
+        entity etc. can be run against while writes to this store continue. Taking a snapshot is O(1); entities
+        are shared with the live store until it first writes to them, at which point their prior state is copied
+        into the snapshot (so writes cost at most one extra entity copy per live snapshot)."""
+        return Snapshot(self)
+
+    def _commit(self):
+        # Called at the end of each public write
+        if self._storage is not None:
+            self._storage.commit()
+        if self._txlog:
+            self._txlog.flush()
+            if self.compact_every and self._txlog.count >= self.compact_every:
+                self.compact()
+        if self._feed is not None:
+            self._feed.dispatch(self)
 
     @classmethod
     def load_file(cls, filename, schema=None): # add format option eventually?
@@ -375,10 +917,33 @@ class TripleStore(object):
                 result = new_graph
         return result
 
+    @reads
+    @timed('dump_file')
     def dump_file(self, filename):
-        "Save semantic graph to a json file as an EAV index."
+        """Save semantic graph to a json file as an EAV index. Written a line per entity, in a stable order, so the
+        file can also be streamed (see tripl.stream)."""
         with open(filename, 'w') as fp:
-            json.dump(self._eav_index, fp, default=list)
+            self._dump(fp)
+
+    def _dump(self, fp):
+        stream.write_entities(stream.index_entities(self._eav_index, self.ident_attr), fp)
+
+    @reads
+    @timed('dump_partitions')
+    def dump_partitions(self, dirname, by='type', n_partitions=16):
+        """Save the graph as a partitioned dump in directory dirname (see tripl.partition): a dump file per value of
+        the entities' ns:type attributes, or with by='hash', per n_partitions buckets of eid hashes, plus a sidecar
+        index of where each entity is, so load_partitions can load just the partitions queries touch."""
+        from . import partition
+        partition.write_partitions(self, dirname, by=by, n_partitions=n_partitions)
+
+    @classmethod
+    def load_partitions(cls, dirname, max_partitions=8, schema=None, thread_safe=False):
+        """A store over a partitioned dump (as written by dump_partitions), which loads partitions as pull,
+        match_pattern etc. touch their entities, keeping at most max_partitions of them in memory."""
+        from . import partition
+        return cls(schema=schema, thread_safe=thread_safe,
+                   storage=partition.PartitionedStorage(dirname, max_partitions=max_partitions))
 
 
     # # Now our query engine
@@ -412,14 +977,111 @@ class TripleStore(object):
 
     def _entity_match(self, entity, pattern):
         "For a match, at least one of the pattern options must match"
-        return all(entity[k].intersection(v if (isinstance(v, list) or isinstance(v, set)) else [v])
-                   for k, v in pattern.items())
-
+        for k, v in pattern.items():
+            vals = get_values(entity, k)
+            if isinstance(v, dict):
+                if not any(valuetypes.compares(x, v) for x in vals):
+                    return False
+            elif isinstance(v, (list, set)):
+                if not any(x in vals for x in v):
+                    return False
+            elif v not in vals:
+                return False
+        return True
+
+    def _clause_eids(self, attr, clause):
+        """For a comparison clause, (index, eids, exact): candidate eids from attr's text index and/or column, and
+        whether they're exactly the matches; or None if there's nothing to narrow them down with."""
+        index, eids = [], None
+        text_index = self._text_indexes.get(attr)
+        if text_index is not None:
+            eids = text_index.search(clause)
+            if eids is not None:
+                index.append('text index')
+        if valuetypes.has_bounds(clause):
+            column = self._column(attr)
+            if column is not None:
+                index.append('column')
+                in_range = column.range(clause)
+                eids = in_range if eids is None else eids & in_range
+        if not index:
+            return None
+        # Text predicates are always checked against the candidates
+        return ', '.join(index), eids, index == ['column'] and valuetypes.only_bounds(clause)
+
+    def _coerce_pattern(self, pattern):
+        "pattern with the values of clauses on typed attributes coerced, as they were when asserted."
+        coerced = {}
+        for a, clause in pattern.items():
+            value_type = self._attr_type(a)
+            if value_type in valuetypes.coercers:
+                clause = valuetypes.coerce_clause(value_type, clause, a)
+            else:
+                # Still validates comparison clauses
+                valuetypes.is_comparison(clause)
+            coerced[a] = clause
+        return coerced
+
+    def _index_candidates(self, pattern):
+        """For a coerced pattern, (index, eids, rest): candidate eids from the indexes, and the clauses left to check
+        them against; or None if the pattern needs a scan."""
+        # Comparison and text clauses are answered from columns and text indexes where there are any, leaving the
+        # rest to check per candidate
+        candidates = None
+        indexes = []
+        rest = dict(pattern)
+        for a, clause in pattern.items():
+            if isinstance(clause, dict):
+                found = self._clause_eids(a, clause)
+                if found is not None:
+                    index, eids, exact = found
+                    indexes.append(index)
+                    candidates = eids if candidates is None else candidates & eids
+                    if exact:
+                        del rest[a]
+        if candidates is not None:
+            return ', '.join(indexes), candidates, rest
+        # Storage backends may be able to answer from an index
+        match = getattr(self._eav_index, 'match', None)
+        if match is not None and pattern and not any(isinstance(clause, dict) for clause in pattern.values()):
+            return 'storage match', match(pattern), {}
+        return None
+
+    @reads
+    @timed('match_pattern')
     def match_pattern(self, pattern):
-        return set(eid for eid, entity
-                       in self._eav_index.items()
-                       if self._entity_match(entity, pattern))
-
+        """The eids of entities matching pattern, a dict of attribute to clause: a value, a list of values (any of
+        which will do), a comparison such as `{'>=': 10, '<': 20}` (see tripl.valuetypes) or a text predicate such
+        as `{'contains': 'jena'}` (see tripl.text)."""
+        pattern = self._coerce_pattern(pattern)
+        found = self._index_candidates(pattern)
+        if found is not None:
+            index, candidates, pattern = found
+            if self._plan is not None:
+                self._plan._match_index = index
+            if self.metrics is not None:
+                self.metrics.count('index_hits')
+            if not pattern:
+                return set(candidates)
+            return set(eid for eid in candidates if self._entity_match(self._eav_index.get(eid, _no_attrs), pattern))
+        if self._plan is not None:
+            self._plan._match_index = 'eav scan'
+        if self.metrics is None:
+            return set(eid for eid, entity
+                           in self._eav_index.items()
+                           if self._entity_match(entity, pattern))
+        matches = set()
+        scanned = 0
+        for eid, entity in self._eav_index.items():
+            scanned += 1
+            if self._entity_match(entity, pattern):
+                matches.add(eid)
+        self.metrics.count('index_scans')
+        self.metrics.count('entities_scanned', scanned)
+        return matches
+
+    @reads
+    @timed('pull')
     def pull(self, pull_expr, entity,
              _seen_entities=None, _base_pattern=None):
         """
@@ -445,80 +1107,368 @@ class TripleStore(object):
           * `_` after the `:` separator of the namespaced `university:_location` attribute specifies a reverse
             lookup on the attribute `university:location` of the university entities.
         """
+        return self._pull(pull_expr, entity, _seen_entities, _base_pattern)
+
+    def _pull(self, pull_expr, entity, _seen_entities=None, _base_pattern=None, _depth=1):
+        # pull, which recurses through here rather than the public method, so only the outermost call takes the lock
+        # and is timed
         if isinstance(entity, dict):
             eids = self.match_pattern(entity)
-            return self.pull(pull_expr, eids[0])
+            return self._pull(pull_expr, some(eids), _depth=_depth)
         else:
             eid = entity.eid if isinstance(entity, Entity) else entity
-            _entity = self._eav_index[eid]
+            _entity = self._eav_index.get(eid, _no_attrs)
+            if self.metrics is not None:
+                self.metrics.count('entities_pulled')
+                self.metrics.observe_max('pull_depth', _depth)
             _seen_entities = _seen_entities or {eid} # seed the seen entities if needed
-            dict_patterns = filter(lambda x: isinstance(x, dict), pull_expr)
-            attr_patterns = filter(lambda x: not(isinstance(x, dict)), pull_expr)
+            dict_patterns = [x for x in pull_expr if isinstance(x, dict)]
+            attr_patterns = [x for x in pull_expr if not isinstance(x, dict)]
             # Get the attr_patterns (non recursive patterns), separate reverse lookups, etc
             # QUESTION Do we want to return an id dictionary when we know it's a ref? who should we copy?
-            normal_attributes = filter(lambda x: x not in {'*'} and not reverse_lookup(x), attr_patterns)
-            reverse_lookups = filter(reverse_lookup, attr_patterns)
-            pull_data = {attr: _entity[attr] for attr in normal_attributes}
+            normal_attributes = [x for x in attr_patterns if x not in {'*'} and not reverse_lookup(x)]
+            reverse_lookups = [x for x in attr_patterns if reverse_lookup(x)]
+            # Copy value sets out, so results don't alias (or race with writes to) the index
+            pull_data = {attr: set(get_values(_entity, attr)) for attr in normal_attributes}
             # Handling reverse lookups at base attr_patterns (not in the dict_patterns)
             if reverse_lookups:
                 for lookup in reverse_lookups:
-                    pull_data[reverse_lookup] = self.pull([{lookup: [self.ident_attr]}], eid)[reverse_lookup]
+                    pull_data[lookup] = self._pull([{lookup: [self.ident_attr]}], eid, _depth=_depth)[lookup]
             # Handle * attrs
             if '*' in attr_patterns:
                 for a, vs in _entity.items():
                     if a not in pull_data:
-                        pull_data[a] = vs # cardinality schema?
+                        pull_data[a] = set(as_values(vs)) # cardinality schema?
             # Deal with the dict patterns, which correspond with relations/refs (implicit are fine; though
             # need to think about the details of how defaults and options work out)
             for dict_pattern in dict_patterns:
                 for attr, token in dict_pattern.items():
+                    if self._plan is not None:
+                        start = _clock()
                     reverse = reverse_lookup(attr)
                     if reverse:
                         # Then reverse lookup
                         if self._ref_attr(reverse):
                             # Can do this; have reverse mapping indexed (vae)
-                            eids = self._vae_index[eid][reverse]
+                            index = 'vae index'
+                            eids = get_values(self._vae_index.get(eid, _no_attrs), reverse)
+                            if self.metrics is not None:
+                                self.metrics.count('index_hits')
                         elif self.lazy_refs:
+                            index = 'full scan (lazy refs)'
                             # have to search through all triples
-                            eids = set(e for e, attrs in self._eav_index.items()
-                                         if eid in attrs[reverse])
+                            eids = set()
+                            scanned = 0
+                            for e, attrs in self._eav_index.items():
+                                scanned += 1
+                                if eid in get_values(attrs, reverse):
+                                    eids.add(e)
+                            if self.metrics is not None:
+                                self.metrics.count('index_scans')
+                                self.metrics.count('entities_scanned', scanned)
                         else:
                             print("Warning! Should have either lazy refs or or a schema for reverse lookups!")
+                            index = 'none (no schema)'
+                            eids = _no_vals
                     else:    
-                        eids = _entity[attr]
+                        index = 'eav'
+                        eids = get_values(_entity, attr)
+                    if self._plan is not None:
+                        self._plan._ref_step(attr, index, len(eids), _clock() - start)
                     if token == '...':
                         # Only track recursion points in seen entities; all else statically terminates
-                        _seen_entities = _seen_entities.update(_entity[attr])
-                        token = _base_pattern
+                        _seen_entities = _seen_entities.update(get_values(_entity, attr))
+                        token = _base_pattern or pull_expr
 
                     # * identity attr should key cardinality as well for reverse lookups; could have ref ident
-                    results = [self.pull(token, e,
-                                         # in case of recursive pulls
-                                         _base_pattern=(_base_pattern or pull_expr),
-                                         # Each of the pull results needs to know that the others
-                                         # will have been seed, as well as what has been seen.
-                                         # Note: doesn't look for relationships forked past
-                                         # that... Have to think about these side cases... update
-                                         # compute global state?
-                                         _seen_entities=_seen_entities)
-                               for e in eids]
+                    results = [self._pull(token, e,
+                                          # in case of recursive pulls
+                                          _base_pattern=(_base_pattern or pull_expr),
+                                          # Each of the pull results needs to know that the others
+                                          # will have been seed, as well as what has been seen.
+                                          # Note: doesn't look for relationships forked past
+                                          # that... Have to think about these side cases... update
+                                          # compute global state?
+                                          _seen_entities=_seen_entities,
+                                          _depth=_depth + 1)
+                               for e in list(eids)]
                     pull_data[attr] = results
             for a, vs in pull_data.items():
                 pull_data[a] = some(vs) if self._card_one(a) else vs
             return pull_data
             # ctn...
 
-    def pull_many(self, pull_expr, eids_or_pattern, sort_by=None, sort_desc=True):
+    def pull_many(self, pull_expr, eids_or_pattern, sort_by=None, sort_desc=True, limit=None, processes=None,
+                  ordered=True, chunk_size=1000):
+        """Pull each of a list of eids, or each entity matching a pattern (see match_pattern), generating the results
+        lazily where they can be. With sort_by, results are sorted by that attribute, and with limit, only the first
+        limit of them are pulled (given a typed cardinality one sort_by, or none, the rest aren't pulled at all).
+
+        With processes, results are pulled in chunk_size batches by a pool of that many forked worker processes (see
+        tripl.parallel), streaming back in eid order, or with ordered=False, as they're done (sorted results are
+        always in order)."""
         # Could eventually first sort and take by some attribute without having to pull everything, if that
         # became necessary, using a first step to just pull that attribute, without the rest. Then do full
         # pull only for what's needed.
+        if limit is not None and limit < 0:
+            raise ValueError("limit can't be negative")
         eids = self.match_pattern(eids_or_pattern) if isinstance(eids_or_pattern, dict) else eids_or_pattern
-        results = (self.pull(pull_expr, eid) for eid in eids)
+        if sort_by and self._card_one(sort_by):
+            # A typed sort attribute's column gives the order up front, so results can still be pulled lazily; worth
+            # building for a pattern match (itself a scan), but not for a short list of eids
+            column = self._column(sort_by, build=isinstance(eids_or_pattern, dict))
+            if column is not None:
+                eids = column.order(eids, reverse=not sort_desc)
+                return self._pull_eids(pull_expr, eids[:limit], processes, True, chunk_size)
         if sort_by:
-            results = sorted(results, key = lambda x: x[sort_by])
-        if not sort_desc:
-            results = results.reversed()
-        return results
+            results = self._sort_results(self._pull_eids(pull_expr, eids, processes, False, chunk_size),
+                                         sort_by, sort_desc)
+            return results[:limit]
+        if limit is not None:
+            eids = itertools.islice(eids, limit)
+        return self._pull_eids(pull_expr, eids, processes, ordered, chunk_size)
+
+    def _pull_eids(self, pull_expr, eids, processes, ordered, chunk_size):
+        if processes:
+            return parallel.pull(self, pull_expr, eids, processes, chunk_size=chunk_size, ordered=ordered)
+        return (self.pull(pull_expr, eid) for eid in eids)
+
+    # Diffs
+
+    def diff_changes(self, other):
+        """Generate the (op, triple) changes which would take this store to other (another TripleStore or a
+        snapshot), with op '-' for retractions and '+' for assertions. Entities the two share unchanged (as a
+        snapshot does with its store, until the store writes to them) are skipped without comparing values, so
+        diffing a snapshot against its live store is cheap. Thread safe stores are diffed as of when the first
+        change is asked for."""
+        # Generated lazily, so rather than hold the lock across yields, diff snapshots (as _datoms does)
+        graph = self.snapshot() if self._lock is not None else self
+        if other._lock is not None:
+            other = other.snapshot()
+        ours, theirs = _stable_index(graph), _stable_index(other)
+        for e in list(ours.keys()):
+            if graph._eav_index.get(e) is other._eav_index.get(e):
+                continue
+            # Each entity's changes are worked out before any are yielded, since the live store may write to it
+            attrs, other_attrs = ours.get(e, _no_attrs), theirs.get(e, _no_attrs)
+            changes = []
+            for a, vs in attrs.items():
+                other_vs = other_attrs.get(a, _no_vals)
+                if vs != other_vs:
+                    vs, other_vs = set(as_values(vs)), set(as_values(other_vs))
+                    changes.extend((txlog.RETRACT, (e, a, v)) for v in vs - other_vs)
+                    changes.extend((txlog.ASSERT, (e, a, v)) for v in other_vs - vs)
+            for a, other_vs in other_attrs.items():
+                if a not in attrs:
+                    changes.extend((txlog.ASSERT, (e, a, v)) for v in as_values(other_vs))
+            for change in changes:
+                yield change
+        for e in list(theirs.keys()):
+            if e not in graph._eav_index:
+                changes = [(txlog.ASSERT, (e, a, v))
+                           for a, other_vs in theirs.get(e, _no_attrs).items() for v in as_values(other_vs)]
+                for change in changes:
+                    yield change
+
+    def diff(self, other):
+        """Return (added, retracted) lists of the triples in other but not this store, and vice versa. Applying
+        them (retract_facts(retracted), then assert_facts(added)) takes this store to other. For graphs too big to
+        hold twice, see stream.diff_entities (or trip diff), which diffs two dumps in a single streaming pass."""
+        added, retracted = [], []
+        for op, triple in self.diff_changes(other):
+            (added if op == txlog.ASSERT else retracted).append(triple)
+        return added, retracted
+
+    def _sort_results(self, results, sort_by, sort_desc):
+        # Missing values (None) sort first, rather than failing to compare
+        return sorted(results, key=lambda x: (x[sort_by] is not None, x[sort_by]), reverse=not sort_desc)
+
+
+def _stable_index(view):
+    # view's eav index, to read lazily while the store is written to: a snapshot's through _LockedIndex, since its
+    # entries are the live ones until the store writes to them
+    return _LockedIndex(view._eav_index, view._lock) if view._lock is not None else view._eav_index
+
+
+def _copy_entry(entry):
+    # Only sets get written to in place; bare values and tuples are replaced, so can be shared
+    return dict((a, set(vs) if type(vs) is set else vs) for a, vs in entry.items())
+
+
+class _LockedIndex(object):
+    """A snapshot's index for generators, which can't hold the store's lock between yields: each read takes the lock,
+    and entries are copied out, since the live store may write to the ones it still shares with the snapshot."""
+
+    def __init__(self, index, lock):
+        self._index = index
+        self._lock = lock
+
+    def get(self, key, default=None):
+        with self._lock.reading():
+            entry = self._index.get(key)
+            return _copy_entry(entry) if entry else default
+
+    def keys(self):
+        with self._lock.reading():
+            return list(self._index.keys())
+
+    __iter__ = keys
+
+    def items(self):
+        for key in self.keys():
+            entry = self.get(key)
+            if entry:
+                yield key, entry
+
+
+class _FrozenIndex(object):
+    """Read only view of a live triple index (eav or vae) as of a snapshot. Entries the live index has written to
+    since are read from the preserved copies in frozen (None marking an entry which didn't exist yet)."""
+
+    def __init__(self, live, frozen):
+        self._live = live
+        self._frozen = frozen
+        if hasattr(live, 'match'):
+            # A storage backend's index, which can still answer equality patterns for us
+            self.match = self._match
+
+    def _match(self, pattern):
+        # The live index's matches, less entries written to since, which are checked as they were
+        def matches(entry):
+            return all(any(v in get_values(entry, a) for v in (clause if isinstance(clause, (list, set)) else [clause]))
+                       for a, clause in pattern.items())
+        frozen = self._frozen
+        eids = set(e for e in self._live.match(pattern) if e not in frozen)
+        eids.update(e for e, entry in list(frozen.items()) if entry and matches(entry))
+        return eids
+
+    def get(self, key, default=None):
+        if key in self._frozen:
+            entry = self._frozen[key]
+        else:
+            entry = self._live.get(key)
+        return entry if entry else default
+
+    def __getitem__(self, key):
+        return self.get(key) or collections.defaultdict(set)
+
+    def __contains__(self, key):
+        return bool(self.get(key))
+
+    def items(self):
+        # Entries frozen part way through (as the live index writes to them) are read from their frozen copies, and
+        # only once; entries frozen to start with come after
+        frozen = set(self._frozen)
+        for key in list(self._live.keys()):
+            if key not in frozen:
+                entry = self.get(key)
+                if entry:
+                    yield key, entry
+        for key in frozen:
+            entry = self._frozen[key]
+            if entry:
+                yield key, entry
+
+    def keys(self):
+        return (key for key, _ in self.items())
+
+    __iter__ = keys
+
+    def count(self):
+        "The number of entries, counted without reading any of the live index's (which may mean loading them)."
+        frozen = self._frozen
+        return sum(1 for key in self._live.keys() if key not in frozen) + sum(1 for entry in frozen.values() if entry)
+
+
+class _SnapshotTextIndexes(object):
+    """A snapshot's view of the live store's text indexes. Their candidates are as of now, so entries written to
+    since the snapshot was taken are added to them; which is safe, as text candidates are always checked."""
+
+    def __init__(self, graph, frozen):
+        self._graph = graph
+        self._frozen = frozen
+
+    def get(self, attr, default=None):
+        text_index = self._graph._text_indexes.get(attr)
+        return _SnapshotTextIndex(text_index, self._frozen) if text_index is not None else default
+
+
+class _SnapshotTextIndex(object):
+
+    def __init__(self, text_index, frozen):
+        self._text_index = text_index
+        self._frozen = frozen
+
+    def search(self, clause):
+        eids = self._text_index.search(clause)
+        return eids | set(self._frozen) if eids is not None else None
+
+
+class Snapshot(TripleStore):
+    """A read only, point in time view of a TripleStore, as returned by TripleStore.snapshot. Supports all of the
+    query API (pull, pull_many, match_pattern, entity, schema, dump_file), but none of the write API."""
+
+    def __init__(self, graph):
+        self.ident_attr = graph.ident_attr
+        self.lazy_refs = graph.lazy_refs
+        self.default_cardinality = graph.default_cardinality
+        self.types = graph.types
+        self._txlog = None
+        self._storage = None
+        self._feed = None
+        self._snapshots = ()
+        # Reads of shared entries race with the live store's writes just the same
+        self._lock = graph._lock
+        self.metrics = graph.metrics
+        self._graph = graph
+        self._eav_frozen = {}
+        self._vae_frozen = {}
+        self._eav_index = _FrozenIndex(graph._eav_index, self._eav_frozen)
+        self._vae_index = _FrozenIndex(graph._vae_index, self._vae_frozen)
+        self._stats = None
+        self._entities = weakref.WeakValueDictionary()
+        # Never dropped, as nothing writes to a snapshot
+        self._columns = {}
+        # Closures are the live store's; snapshots traverse
+        self._closures = {}
+        self._text_indexes = _SnapshotTextIndexes(graph, self._eav_frozen)
+        graph._snapshots.add(self)
+
+    def _attr_stats(self):
+        # The live store's stats move on with it; ours can't change, so are collected once, when first asked for
+        if self._stats is None:
+            self._stats = stats.collect(self._eav_index)
+        return self._stats
+
+    def _preserve(self, e=None, v=None):
+        # Called by the live graph before it writes to eav entry e / vae entry v
+        for key, live, frozen in ((e, self._graph._eav_index, self._eav_frozen),
+                                  (v, self._graph._vae_index, self._vae_frozen)):
+            if key is not None and key not in frozen:
+                entry = live.get(key)
+                frozen[key] = _copy_entry(entry) if entry else None
+
+    def _assert_triple(self, triple):
+        raise TypeError("Snapshots are read only")
+
+    _retract_triple = _assert_triple
+
+    def _column(self, attr, build=True):
+        # The live store's column will do for as long as it hasn't written anything since we were taken
+        if not self._eav_frozen:
+            column = self._graph._column(attr, build=False)
+            if column is not None:
+                return column
+        return TripleStore._column(self, attr, build)
+
+    def index_text(self, attr, ngram=None):
+        raise TypeError("Snapshots are read only")
+
+    drop_text_index = index_text
+
+    def snapshot(self):
+        # Already immutable
+        return self
 
 
 # Our data constructors, as pure functions
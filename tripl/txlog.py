@@ -0,0 +1,112 @@
+"""
+Append-only transaction log for TripleStore.
+
+Each line of a log file is a JSON array `[op, e, a, v]`, where op is `"+"` for an asserted triple and `"-"` for a
+retracted one. A store opened via `TripleStore.open` replays the log over its last snapshot (a plain
+`dump_file` EAV index), so a durable write only costs the size of the change, and `TripleStore.compact` folds the
+log back into a fresh snapshot.
+"""
+
+import os
+import json
+
+
+ASSERT = '+'
+RETRACT = '-'
+
+
+def _replace(src, dst):
+    # os.replace is atomic on both posix and windows, but python 3 only
+    getattr(os, 'replace', os.rename)(src, dst)
+
+
+def read_log(filename):
+    """Generate (op, triple) pairs from a log file, in the order they were written. A torn trailing line (say from a
+    crash mid-write) is ignored; anything else malformed is an error."""
+    if not os.path.exists(filename):
+        return
+    with open(filename) as fp:
+        lines = fp.readlines()
+    for i, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            op, e, a, v = json.loads(line)
+        except ValueError:
+            if i == len(lines) - 1 and not line.endswith('\n'):
+                return
+            raise
+        yield op, (e, a, v)
+
+
+def _drop_torn_line(filename):
+    # Truncate a log back to the end of its last complete line, so the next append doesn't land on the end of a
+    # line torn by a crash (read_log skips such a line, but one with an entry appended to it is just garbage)
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'r+b') as fp:
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell()
+        if not size:
+            return
+        fp.seek(size - 1)
+        if fp.read(1) == b'\n':
+            return
+        # Torn lines are at most one entry long, so read back in chunks until a newline turns up
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            fp.seek(start)
+            newline = fp.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                fp.truncate(start + newline + 1)
+                break
+            end = start
+        else:
+            fp.truncate(0)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+
+class TxLog(object):
+    """An open, append-only log file. Entries are buffered until flush; with sync=True, flush also fsyncs. A torn
+    trailing line left by a crash is dropped on opening."""
+
+    def __init__(self, filename, sync=False):
+        self.filename = filename
+        self.sync = sync
+        _drop_torn_line(filename)
+        self.count = sum(1 for _ in read_log(filename))
+        self._fp = open(filename, 'a')
+
+    def append(self, op, triple):
+        e, a, v = triple
+        self._fp.write(json.dumps([op, e, a, v]) + '\n')
+        self.count += 1
+
+    def flush(self):
+        self._fp.flush()
+        if self.sync:
+            os.fsync(self._fp.fileno())
+
+    def truncate(self):
+        "Drop all entries; called once they've been folded into a snapshot."
+        self._fp.close()
+        self._fp = open(self.filename, 'w')
+        self.flush()
+        self.count = 0
+
+    def close(self):
+        if not self._fp.closed:
+            self.flush()
+            self._fp.close()
+
+
+def write_snapshot(graph, filename):
+    "Atomically replace filename with a dump of graph, so a crash never leaves a half written snapshot behind."
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w') as fp:
+        graph._dump(fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    _replace(tmp_filename, filename)
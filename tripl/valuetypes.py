@@ -0,0 +1,236 @@
+"""
+Typed attribute values, set with `db:valueType` in the schema alongside `db.type:ref`:
+
+    ts = tripl.TripleStore(schema={'cft.seq:depth': {'db:valueType': 'db.type:double'},
+                                   'cft.seq:collected': {'db:valueType': 'db.type:instant'}})
+    ts.match_pattern({'cft.seq:depth': {'>=': 30}, 'cft.seq:collected': {'<': '2017-07-01'}})
+
+* `db.type:long`: integers ('42', and floats with nothing after the point, are converted)
+* `db.type:double`: floats
+* `db.type:instant`: points in time, as integer milliseconds since the epoch (UTC), so they stay plain JSON through
+  dumps, transaction logs and storage. ISO 8601 strings ('2017-06-01', '2017-06-01T13:17:00Z', ...), datetimes and
+  dates are converted, naive ones taken as UTC; to_datetime converts back.
+* `db.type:string`: strings (anything else is str()ed)
+
+Values are coerced as they're asserted (and retracted, and matched against), so the numbers and dates bio.load_csv
+reads as strings come in as numbers, compare and sort as numbers, and take a fraction of the memory. A value which
+can't be coerced raises ValueError; None is left as is. Values asserted before their attribute was typed aren't
+converted after the fact (which is why TripleStore asserts schema facts first).
+
+Pattern clauses may also be comparisons: a dict of bounds keyed by '<', '<=', '>' and '>=', e.g. `{'>=': 10, '<': 20}`.
+For typed attributes these are answered from a Column of the attribute's values, sorted into a compact typed array
+the first time it's needed, and kept sorted as values are asserted and retracted from then on; otherwise by scanning.
+The same dicts take the text predicates in tripl.text ('text' and 'contains').
+"""
+
+import array
+import bisect
+import datetime
+import numbers
+import operator
+import re
+
+from . import text
+from .text import _string_types
+
+
+LONG = 'db.type:long'
+DOUBLE = 'db.type:double'
+INSTANT = 'db.type:instant'
+STRING = 'db.type:string'
+
+_epoch = datetime.datetime(1970, 1, 1)
+
+_iso = re.compile(r'^(\d{4})-(\d\d)-(\d\d)(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6})\d*)?)?)?\s*(Z|[+-]\d\d:?\d\d)?$')
+
+
+def _long(v):
+    if isinstance(v, float):
+        if not v.is_integer():
+            raise ValueError(v)
+        return int(v)
+    return int(v)
+
+
+def _millis(dt):
+    delta = dt - _epoch
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+def _instant(v):
+    if isinstance(v, numbers.Number):
+        return _long(v)
+    if isinstance(v, datetime.datetime):
+        if v.tzinfo is not None:
+            v = (v - v.utcoffset()).replace(tzinfo=None)
+        return _millis(v)
+    if isinstance(v, datetime.date):
+        return _millis(datetime.datetime(v.year, v.month, v.day))
+    match = _iso.match(v.strip())
+    if not match:
+        raise ValueError(v)
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    dt = datetime.datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                           int((fraction or '0').ljust(6, '0')))
+    if zone and zone != 'Z':
+        offset = datetime.timedelta(hours=int(zone[1:3]), minutes=int(zone[-2:]))
+        dt = dt - offset if zone[0] == '+' else dt + offset
+    return _millis(dt)
+
+
+def _string(v):
+    return v if isinstance(v, _string_types) else str(v)
+
+
+# value type -> function converting a value to it
+coercers = {LONG: _long, DOUBLE: float, INSTANT: _instant, STRING: _string}
+
+# value type -> array typecode its columns are stored in (strings just get a list)
+_typecodes = {LONG: 'q', DOUBLE: 'd', INSTANT: 'q'}
+try:
+    array.array('q')
+except ValueError:
+    # Python 2
+    _typecodes[LONG] = _typecodes[INSTANT] = 'l'
+
+
+def coerce(value_type, v, attr=None):
+    "v as value_type (one of the keys of coercers); ValueError if it can't be."
+    if v is None:
+        return v
+    try:
+        return coercers[value_type](v)
+    except (TypeError, ValueError, OverflowError, AttributeError):
+        raise ValueError("Can't store %r as %s%s" % (v, value_type, ' (for %s)' % attr if attr else ''))
+
+
+def to_datetime(millis):
+    "A db.type:instant value as a (naive, UTC) datetime."
+    return _epoch + datetime.timedelta(milliseconds=millis)
+
+
+_comparisons = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+# Everything a comparison clause can hold
+_predicates = dict(_comparisons, **text.predicates)
+
+
+def is_comparison(clause):
+    "Whether a pattern clause is a comparison (a dict of bounds or predicates), rather than a value or values."
+    if not isinstance(clause, dict):
+        return False
+    for op in clause:
+        if op not in _predicates:
+            raise ValueError("Comparison clauses take bounds keyed by %s, not %r"
+                             % (', '.join(sorted(_predicates)), op))
+    return True
+
+
+def has_bounds(clause):
+    "Whether a comparison clause has any bounds (as opposed to just text predicates)."
+    return any(op in _comparisons for op in clause)
+
+
+def only_bounds(clause):
+    "Whether a comparison clause has nothing but bounds."
+    return all(op in _comparisons for op in clause)
+
+
+def coerce_clause(value_type, clause, attr=None):
+    "A pattern clause with its values (or bounds) coerced to value_type."
+    if is_comparison(clause):
+        return dict((op, coerce(value_type, bound, attr) if op in _comparisons else bound)
+                    for op, bound in clause.items())
+    if isinstance(clause, (list, set)):
+        return [coerce(value_type, v, attr) for v in clause]
+    return coerce(value_type, clause, attr)
+
+
+def compares(v, clause):
+    "Whether v is within a comparison clause's bounds (and meets its predicates); values which don't compare aren't."
+    if v is None:
+        return False
+    try:
+        return all(_predicates[op](v, bound) for op, bound in clause.items())
+    except TypeError:
+        return False
+
+
+class Column(object):
+    """An attribute's values in sorted order, in a typed array, alongside the eids they belong to; built from
+    (value, eid) pairs. Values of the wrong type (asserted before the attribute was typed) are left out."""
+
+    __slots__ = ('values', 'eids')
+
+    def __init__(self, value_type, pairs):
+        coercer = coercers[value_type]
+        typed = []
+        for v, e in pairs:
+            if v is None:
+                continue
+            try:
+                typed.append((coercer(v), e))
+            except (TypeError, ValueError, OverflowError, AttributeError):
+                pass
+        typed.sort(key=operator.itemgetter(0))
+        values = [v for v, _ in typed]
+        self.eids = [e for _, e in typed]
+        if value_type in _typecodes:
+            try:
+                values = array.array(_typecodes[value_type], values)
+            except OverflowError:
+                # longs too big for a machine word; a list sorts them just the same
+                pass
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def _bounds(self, clause):
+        lo, hi = 0, len(self.values)
+        for op, bound in clause.items():
+            if op == '>':
+                lo = max(lo, bisect.bisect_right(self.values, bound))
+            elif op == '>=':
+                lo = max(lo, bisect.bisect_left(self.values, bound))
+            elif op == '<':
+                hi = min(hi, bisect.bisect_left(self.values, bound))
+            elif op == '<=':
+                hi = min(hi, bisect.bisect_right(self.values, bound))
+        return lo, hi
+
+    def add(self, v, e):
+        "Insert a (coerced) value for e, keeping the column sorted."
+        if v is None:
+            return
+        i = bisect.bisect_right(self.values, v)
+        self.values.insert(i, v)
+        self.eids.insert(i, e)
+
+    def remove(self, v, e):
+        "Remove e's value v, if the column has it (values from before the attribute was typed aren't)."
+        if v is None:
+            return
+        lo, hi = bisect.bisect_left(self.values, v), bisect.bisect_right(self.values, v)
+        for i in range(lo, hi):
+            if self.eids[i] == e:
+                del self.values[i]
+                del self.eids[i]
+                return
+
+    def range(self, clause):
+        "The eids with a value within a comparison clause's (coerced) bounds; any other predicates are ignored."
+        lo, hi = self._bounds(clause)
+        return set(self.eids[lo:hi])
+
+    def order(self, eids, reverse=False):
+        """eids in order of their values (ascending, or descending with reverse), as a list; those without a value
+        come first (last with reverse), as None sorts in TripleStore._sort_results."""
+        eids = set(eids)
+        ordered = [e for e in self.eids if e in eids]
+        found = set(ordered)
+        missing = [e for e in eids if e not in found]
+        if reverse:
+            ordered.reverse()
+            return ordered + missing
+        return missing + ordered